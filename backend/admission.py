@@ -0,0 +1,368 @@
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from telemetry import Counter, Gauge, Histogram, registry
+from tokens import count_tokens
+
+
+class Priority(IntEnum):
+    """Order in which queued upstream calls are admitted; lower goes first."""
+
+    INTERACTIVE = 0
+    NORMAL = 1
+    BACKGROUND = 2
+
+
+# Calls waiting longer than the deadline of their priority are rejected
+ADMISSION_DEADLINES = {
+    Priority.INTERACTIVE: float(os.getenv("ADMISSION_DEADLINE_INTERACTIVE", "5")),
+    Priority.NORMAL: float(os.getenv("ADMISSION_DEADLINE_NORMAL", "15")),
+    Priority.BACKGROUND: float(os.getenv("ADMISSION_DEADLINE_BACKGROUND", "120")),
+}
+# Waiting calls per provider; when full, a new call displaces the newest call of lower priority
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "64"))
+# Completion budget assumed for calls without max_tokens, until the reported usage settles it
+DEFAULT_COMPLETION_TOKENS = 500
+
+ROUTE_PRIORITIES = {
+    "/lifeChat": Priority.INTERACTIVE,
+    "/lifeChat/stream": Priority.INTERACTIVE,
+    "/getAdvice": Priority.NORMAL,
+}
+
+ADMISSION_QUEUE_DEPTH = registry.register(Gauge(
+    "admission_queue_depth", "Upstream calls waiting for rate limit capacity", ("provider", "priority")
+))
+ADMISSION_WAIT_SECONDS = registry.register(Histogram(
+    "admission_wait_seconds", "Time upstream calls waited for rate limit capacity", ("provider", "priority", "outcome")
+))
+ADMISSION_REJECTIONS = registry.register(Counter(
+    "admission_rejections_total", "Upstream calls rejected before they were sent", ("provider", "priority", "reason")
+))
+
+_priority: ContextVar[Priority] = ContextVar("admission_priority", default=Priority.NORMAL)
+
+
+def set_priority(priority: Priority) -> None:
+    """Admit the upstream calls of the current task (and the tasks it starts) at `priority`."""
+    _priority.set(priority)
+
+
+class SharedPriority:
+    """
+    Priority of one upstream call several requests wait for, e.g. through a SingleFlight.
+
+    It is the most urgent priority among those requests, so a request that
+    joins a call started by a background job is not admitted at background
+    priority. A call still queued when its priority is raised moves up the
+    queue, under the deadline of the new priority.
+    """
+
+    def __init__(self, priority: Priority):
+        self.priority = priority
+        self.listeners: List[Callable[[Priority], None]] = []
+
+    def raise_to(self, priority: Priority) -> None:
+        if priority < self.priority:
+            self.priority = priority
+            for listener in list(self.listeners):
+                listener(priority)
+
+
+_shared_priority: ContextVar[Optional[SharedPriority]] = ContextVar("admission_shared_priority", default=None)
+
+
+def current_priority() -> Priority:
+    shared = _shared_priority.get()
+    return shared.priority if shared is not None else _priority.get()
+
+
+def use_shared_priority(shared: SharedPriority) -> None:
+    """Admit the upstream calls of the current task at `shared`'s priority, raised as others join."""
+    _shared_priority.set(shared)
+
+
+class AdmissionRejected(Exception):
+    """An upstream call was not sent because its provider's rate limit could not admit it in time."""
+
+    def __init__(self, provider: str, reason: str, retry_after: float):
+        self.provider = provider
+        self.reason = reason
+        # Whole seconds, as sent in the Retry-After header
+        self.retry_after = max(1, math.ceil(retry_after))
+        super().__init__(f"{provider} is over its rate limit ({reason}); retry after {self.retry_after}s")
+
+
+class TokenBucket:
+    """
+    Refills at `rate` per second up to `capacity`.
+
+    The level may go negative when a call used more than it reserved; later
+    calls then wait for the debt to be refilled.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` is available."""
+        self._refill()
+        return max(0.0, (amount - self.level) / self.rate)
+
+    def take(self, amount: float) -> None:
+        self._refill()
+        self.level -= amount
+
+
+@dataclass(order=True)
+class _Waiter:
+    priority: Priority
+    seq: int
+    tokens: float = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+
+
+class Admission:
+    """Capacity taken for one upstream call."""
+
+    def __init__(self, limiter: Optional["ProviderLimiter"] = None, tokens: float = 0):
+        self.limiter = limiter
+        self.tokens = tokens
+
+    def settle(self, usage: Any) -> None:
+        """Correct the reserved tokens with the usage the provider reported."""
+        total = getattr(usage, "total_tokens", None)
+        if self.limiter is not None and total:
+            self.limiter.adjust(total - self.tokens)
+            self.tokens = total
+
+
+class ProviderLimiter:
+    """
+    Request- and token-rate limit of one provider with a bounded priority queue.
+
+    Calls are admitted in priority order, first come first served within a
+    priority. A call that would wait longer than its priority's deadline is
+    rejected right away, estimated from the capacity the calls ahead of it
+    need, instead of queueing until it times out.
+
+    Args:
+        provider (str): Label in the metrics and errors
+        requests_per_minute (float): Request limit; 0 for none
+        tokens_per_minute (float): Token (for ElevenLabs: character) limit; 0 for none
+        queue_size (int): Most calls waiting at once
+    """
+
+    def __init__(self, provider: str, requests_per_minute: float, tokens_per_minute: float, queue_size: int = ADMISSION_QUEUE_SIZE):
+        self.provider = provider
+        self.requests = TokenBucket(requests_per_minute / 60, requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute / 60, tokens_per_minute) if tokens_per_minute else None
+        self.queue_size = queue_size
+        self._queue: List[_Waiter] = []
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def _wait_time(self, requests: float, tokens: float) -> float:
+        waits = [0.0]
+        if self.requests is not None:
+            waits.append(self.requests.wait_time(requests))
+        if self.tokens is not None:
+            waits.append(self.tokens.wait_time(tokens))
+        return max(waits)
+
+    def _take(self, tokens: float) -> None:
+        if self.requests is not None:
+            self.requests.take(1)
+        if self.tokens is not None:
+            self.tokens.take(tokens)
+
+    def _estimate(self, priority: Priority, tokens: float) -> float:
+        """Seconds until a call of `priority` would be admitted behind the ones queued ahead of it."""
+        ahead = [waiter for waiter in self._queue if waiter.priority <= priority and not waiter.future.done()]
+        return self._wait_time(1 + len(ahead), tokens + sum(waiter.tokens for waiter in ahead))
+
+    def _reject(self, priority: Priority, reason: str, retry_after: float) -> AdmissionRejected:
+        ADMISSION_REJECTIONS.inc(provider=self.provider, priority=priority.name.lower(), reason=reason)
+        return AdmissionRejected(self.provider, reason, retry_after)
+
+    async def acquire(self, tokens: float, priority: Priority, shared: Optional[SharedPriority] = None) -> Admission:
+        if self.requests is None and self.tokens is None:
+            return Admission()
+        # A single call larger than the bucket would never fit
+        if self.tokens is not None:
+            tokens = min(tokens, self.tokens.capacity)
+        if not self._queue and self._wait_time(1, tokens) == 0:
+            self._take(tokens)
+            ADMISSION_WAIT_SECONDS.observe(0.0, provider=self.provider, priority=priority.name.lower(), outcome="admitted")
+            return Admission(self, tokens)
+
+        deadline = ADMISSION_DEADLINES[priority]
+        estimate = self._estimate(priority, tokens)
+        if estimate > deadline:
+            raise self._reject(priority, "deadline", estimate)
+        if len(self._queue) >= self.queue_size:
+            lowest = max(self._queue)
+            if lowest.priority <= priority:
+                raise self._reject(priority, "queue_full", estimate)
+            self._queue.remove(lowest)
+            heapq.heapify(self._queue)
+            if not lowest.future.done():
+                lowest.future.set_exception(self._reject(lowest.priority, "displaced", self._estimate(lowest.priority, lowest.tokens)))
+
+        loop = asyncio.get_running_loop()
+        waiter = _Waiter(priority, next(self._seq), tokens, loop.create_future())
+        heapq.heappush(self._queue, waiter)
+        self._dispatch()
+        start = time.monotonic()
+        deadline_at = start + deadline
+        promoted = loop.create_future()
+
+        def promote(new_priority: Priority) -> None:
+            nonlocal deadline_at
+            waiter.priority = new_priority
+            heapq.heapify(self._queue)
+            deadline_at = min(deadline_at, time.monotonic() + ADMISSION_DEADLINES[new_priority])
+            if not promoted.done():
+                promoted.set_result(None)
+            self._dispatch()
+
+        if shared is not None:
+            shared.listeners.append(promote)
+        outcome = "rejected"
+        try:
+            while not waiter.future.done():
+                remaining = deadline_at - time.monotonic()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError
+                promoted = loop.create_future()
+                await asyncio.wait((waiter.future, promoted), timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            # Raises if a call of higher priority displaced this one
+            waiter.future.result()
+            outcome = "admitted"
+        except asyncio.TimeoutError:
+            # Calls of higher priority arrived after the estimate
+            raise self._reject(waiter.priority, "deadline", self._estimate(waiter.priority, tokens)) from None
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        finally:
+            if shared is not None:
+                shared.listeners.remove(promote)
+            if not waiter.future.done():
+                waiter.future.cancel()
+            ADMISSION_WAIT_SECONDS.observe(time.monotonic() - start, provider=self.provider, priority=waiter.priority.name.lower(), outcome=outcome)
+            if waiter in self._queue:
+                self._queue.remove(waiter)
+                heapq.heapify(self._queue)
+                self._dispatch()
+        return Admission(self, tokens)
+
+    def adjust(self, tokens: float) -> None:
+        """Take (or give back, if negative) tokens after the fact."""
+        if self.tokens is not None:
+            self.tokens.take(tokens)
+            if tokens < 0 and self._queue:
+                self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Admit queued calls while there is capacity, then wake up when the head of the queue fits."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._queue:
+            head = self._queue[0]
+            if head.future.done():
+                # Rejected or cancelled while waiting
+                heapq.heappop(self._queue)
+                continue
+            wait = self._wait_time(1, head.tokens)
+            if wait > 0:
+                self._timer = asyncio.get_running_loop().call_later(wait, self._dispatch)
+                break
+            heapq.heappop(self._queue)
+            self._take(head.tokens)
+            head.future.set_result(None)
+        for priority in Priority:
+            depth = sum(1 for waiter in self._queue if waiter.priority == priority and not waiter.future.done())
+            ADMISSION_QUEUE_DEPTH.set(depth, provider=self.provider, priority=priority.name.lower())
+
+
+def _limiter(provider: str, requests_per_minute: str, tokens_per_minute: str) -> ProviderLimiter:
+    prefix = provider.upper()
+    return ProviderLimiter(
+        provider,
+        float(os.getenv(f"{prefix}_RPM", requests_per_minute)),
+        float(os.getenv(f"{prefix}_TPM", tokens_per_minute)),
+    )
+
+
+# Defaults are conservative account limits; set <PROVIDER>_RPM / _TPM to yours, or 0 to disable
+PROVIDER_LIMITERS = {
+    "openai": _limiter("openai", "500", "200000"),
+    "mistral": _limiter("mistral", "300", "500000"),
+    # Tokens are characters of synthesized text
+    "elevenlabs": _limiter("elevenlabs", "120", "0"),
+}
+
+
+async def admit(provider: str, tokens: float = 0) -> Admission:
+    """
+    Wait until `provider`'s rate limits admit a call of `tokens` at the current task's priority.
+
+    Raises:
+        AdmissionRejected: The call would not be admitted within its priority's deadline
+    """
+    return await PROVIDER_LIMITERS[provider].acquire(tokens, current_priority(), _shared_priority.get())
+
+
+def estimate_tokens(messages: List[Dict[str, Any]], max_tokens: Optional[int] = None) -> int:
+    """Prompt tokens of chat messages plus the completion budget, reserved before a call."""
+    prompt = sum(count_tokens(message["content"]) + 4 for message in messages if isinstance(message.get("content"), str))
+    return prompt + (max_tokens or DEFAULT_COMPLETION_TOKENS)
+
+
+class PriorityMiddleware:
+    """ASGI middleware admitting each request's upstream calls at the priority of its route."""
+
+    def __init__(self, app, priorities: Dict[str, Priority] = ROUTE_PRIORITIES):
+        self.app = app
+        self.priorities = priorities
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = _priority.set(self.priorities.get(scope["path"], Priority.NORMAL))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _priority.reset(token)
+
+
+async def rejected_response(request: Request, exc: AdmissionRejected) -> JSONResponse:
+    return JSONResponse({"detail": str(exc)}, status_code=429, headers={"Retry-After": str(exc.retry_after)})
+
+
+def add_admission_control(app: FastAPI, priorities: Dict[str, Priority] = ROUTE_PRIORITIES) -> None:
+    """Prioritize upstream calls by route and answer rejected ones with 429 and Retry-After."""
+    app.add_middleware(PriorityMiddleware, priorities=priorities)
+    app.add_exception_handler(AdmissionRejected, rejected_response)
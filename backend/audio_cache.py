@@ -0,0 +1,142 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+from fastapi import Request, Response
+from fastapi.responses import FileResponse
+
+
+def _opaque_tag(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """
+    Whether an If-None-Match header matches `etag`.
+
+    Uses the weak comparison RFC 7232 prescribes for If-None-Match, so a
+    `W/"..."` tag sent back by a proxy still revalidates the strong one.
+    """
+    if if_none_match.strip() == "*":
+        return True
+    return _opaque_tag(etag) in {_opaque_tag(tag) for tag in if_none_match.split(",")}
+
+
+class AudioCache:
+    """
+    Disk-backed cache of synthesized audio, keyed by a hash of the TTS request.
+
+    Files are named `<key>-<digest>.mp3`, where the digest is taken over the
+    audio bytes and doubles as a strong ETag. Least recently used files are
+    evicted once the directory grows past `max_bytes`. The access order is
+    kept in memory and seeded from file mtimes on startup.
+
+    Args:
+        directory (str): Directory holding the audio files
+        max_bytes (int): Size limit of all cached files together
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[str, int]]" = OrderedDict()
+        self._size = 0
+        os.makedirs(directory, exist_ok=True)
+        self._scan()
+
+    def _scan(self) -> None:
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".part"):
+                # Leftover of a write interrupted by a crash
+                self._remove_file(name)
+                continue
+            if not name.endswith(".mp3") or "-" not in name:
+                continue
+            stat = os.stat(os.path.join(self.directory, name))
+            files.append((stat.st_mtime, name.split("-", 1)[0], name, stat.st_size))
+        for _, key, name, size in sorted(files):
+            self._entries[key] = (name, size)
+            self._size += size
+
+    def lookup(self, key: str) -> Optional[Tuple[str, str]]:
+        """Return (path, etag) of a cached file and mark it as recently used."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+        name, _ = entry
+        digest = name[len(key) + 1:-len(".mp3")]
+        return os.path.join(self.directory, name), f'"{digest}"'
+
+    async def tee(self, key: str, chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        """
+        Pass chunks through while writing them to the cache.
+
+        The file is only added once the stream completed; an interrupted
+        stream (error, client disconnect) leaves no entry behind.
+        """
+        tmp_path = os.path.join(self.directory, f"{key}.{os.getpid()}.{id(chunks)}.part")
+        digest = hashlib.sha256()
+        size = 0
+        completed = False
+        try:
+            with open(tmp_path, "wb") as f:
+                async for chunk in chunks:
+                    f.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+                    yield chunk
+            completed = True
+        finally:
+            if completed:
+                self._add(key, tmp_path, digest.hexdigest()[:32], size)
+            elif os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _add(self, key: str, tmp_path: str, digest: str, size: int) -> None:
+        name = f"{key}-{digest}.mp3"
+        os.replace(tmp_path, os.path.join(self.directory, name))
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= previous[1]
+                if previous[0] != name:
+                    self._remove_file(previous[0])
+            self._entries[key] = (name, size)
+            self._size += size
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                _, (old_name, old_size) = self._entries.popitem(last=False)
+                self._size -= old_size
+                self._remove_file(old_name)
+
+    def _remove_file(self, name: str) -> None:
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            pass
+
+    def response(self, request: Request, path: str, etag: str, headers: Optional[Dict[str, str]] = None) -> Response:
+        """
+        Serve a cached file with ETag revalidation and Range support.
+
+        FileResponse answers Range/If-Range requests with 206 and hands the
+        file to the server via `http.response.pathsend` (zero-copy) where
+        the ASGI server supports it.
+        """
+        headers = {"ETag": etag, "Cache-Control": "public, max-age=86400", **(headers or {})}
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+        return FileResponse(path, media_type="audio/mpeg", headers=headers)
+
+
+audio_cache = AudioCache(
+    directory=os.getenv("AUDIO_CACHE_DIR", "audio_cache"),
+    max_bytes=int(os.getenv("AUDIO_CACHE_MAX_BYTES", str(512 * 1024 * 1024))),
+)
@@ -0,0 +1,229 @@
+"""
+End-to-end load benchmark of the HTTP endpoints against local upstream fakes.
+
+Starts the fakes from benchmarks.fake_upstreams, then each selected app
+(dummy_backend and/or database_integration.main) in its own uvicorn
+process pointed at them. Every scenario runs `--requests` requests with
+`--concurrency` in flight and reports throughput and p50/p95/p99 latency.
+Results are written as JSON for comparison across releases.
+
+Scenario windows rotate through June 2025, so after the first pass advice
+and speech are largely served from the generation/audio caches, as they
+would be for repeated queries in production. Every run starts with empty
+caches.
+
+Usage (from backend/):
+    python -m benchmarks.bench_endpoints --output bench.json
+    python -m benchmarks.bench_endpoints --app dummy --scenario lifeChat --requests 500 --concurrency 32 \\
+        --latency openai=900 --error-rate openai=0.02
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Tuple
+
+import httpx
+import uvicorn
+
+from benchmarks.fake_upstreams import add_arguments, build_app, config_from_args, upstream_env
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APPS = {"dummy": "dummy_backend:app", "database": "database_integration.main:app"}
+CHATS = [
+    "I have a team meeting tomorrow at 10 AM",
+    "I'm so stressed about the exam",
+    "how should I approach this week?",
+    "What do I have on my calendar tomorrow?",
+    "Went for a run this morning and I feel great",
+]
+MONTH_START = datetime(2025, 6, 1)
+
+Request = Tuple[str, str, Dict]
+
+
+def day_window(i: int, days: int) -> Dict[str, str]:
+    start = MONTH_START + timedelta(days=i % (30 - days + 1))
+    return {"startTime": start.isoformat(), "endTime": (start + timedelta(days=days)).isoformat()}
+
+
+SCENARIOS: Dict[str, Callable[[int], Request]] = {
+    "lifeChat": lambda i: ("POST", "/lifeChat", {"json": {"chat": CHATS[i % len(CHATS)]}}),
+    "getEvents": lambda i: ("GET", "/getEvents", {"params": day_window(i, 1)}),
+    "getAdvice": lambda i: ("GET", "/getAdvice", {"params": day_window(i, 7)}),
+    "getMotivationalSpeech": lambda i: ("GET", "/getMotivationalSpeech", {"params": day_window(i, 7)}),
+}
+
+
+def percentile(samples, q):
+    return statistics.quantiles(samples, n=100)[q - 1] if len(samples) > 1 else samples[0]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_fakes(args: argparse.Namespace) -> Tuple[uvicorn.Server, str]:
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(build_app(config_from_args(args)), port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, f"http://127.0.0.1:{port}"
+
+
+def start_app(target: str, fakes_url: str, workdir: str) -> Tuple[subprocess.Popen, str]:
+    port = free_port()
+    env = {
+        **os.environ,
+        **upstream_env(fakes_url),
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        "AUDIO_CACHE_DIR": os.path.join(workdir, "audio_cache"),
+        "GENERATION_CACHE_DB": "",
+        "TOOL_DEFINITIONS_CACHE": "",
+        "CHAT_SESSIONS_DB": "",
+        # Off-peak precomputation would otherwise skew runs that happen to fall into its hours
+        "PRECOMPUTE_ENABLED": "0",
+    }
+    for key in ("OPENAI_API_KEY", "MISTRAL_API_KEY", "ELEVENLABS_API_KEY", "ACI_API_KEY", "LINKED_ACCOUNT_OWNER_ID"):
+        env.setdefault(key, "bench")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", target, "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"{target} exited with {process.returncode}")
+        try:
+            if httpx.get(f"{base_url}/openapi.json").status_code == 200:
+                return process, base_url
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise SystemExit(f"{target} did not start within 60s")
+
+
+def seed_database(base_url: str) -> None:
+    """Give the database app the same kind of month of data the dummy backend has."""
+    events, feelings = [], []
+    for day in range(30):
+        date = MONTH_START + timedelta(days=day)
+        for hour, name in ((9, "Deep work"), (13, "Team sync"), (18, "Gym")):
+            start = date + timedelta(hours=hour)
+            events.append({
+                "date": date.date().isoformat(),
+                "startTime": start.isoformat(),
+                "endTime": (start + timedelta(hours=1)).isoformat(),
+                "description": f"{name} session",
+                "tags": ["work" if hour < 18 else "health"],
+                "name": name,
+            })
+        for hour, score in ((13, 1 + day % 10), (16, 1 + (day + 3) % 10)):
+            feelings.append({"feelings": ["motivated"], "score": score, "datetime": (date + timedelta(hours=hour)).isoformat()})
+    httpx.post(f"{base_url}/addEvents", json=events, timeout=60).raise_for_status()
+    httpx.post(f"{base_url}/addFeelings", json=feelings, timeout=60).raise_for_status()
+
+
+async def run_scenario(base_url: str, build: Callable[[int], Request], requests: int, concurrency: int, warmup: int) -> Dict:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+
+        async def one(i: int) -> Tuple[float, int]:
+            method, path, kwargs = build(i)
+            t = time.perf_counter()
+            try:
+                response = await client.request(method, path, **kwargs)
+                await response.aread()
+                status = response.status_code
+            except httpx.HTTPError:
+                status = 0
+            return (time.perf_counter() - t) * 1000, status
+
+        for i in range(warmup):
+            await one(i)
+
+        queue = iter(range(requests))
+        samples: List[Tuple[float, int]] = []
+
+        async def worker():
+            for i in queue:
+                samples.append(await one(warmup + i))
+
+        t = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - t
+
+    ok = [latency for latency, status in samples if 200 <= status < 400]
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": requests - len(ok),
+        "throughput_rps": round(len(ok) / elapsed, 2),
+        "mean_ms": round(statistics.fmean(ok), 2) if ok else None,
+        "p50_ms": round(percentile(ok, 50), 2) if ok else None,
+        "p95_ms": round(percentile(ok, 95), 2) if ok else None,
+        "p99_ms": round(percentile(ok, 99), 2) if ok else None,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--app", action="append", choices=sorted(APPS), help="app to benchmark (default: all)")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="scenario to run (default: all)")
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16, help="requests in flight")
+    parser.add_argument("--warmup", type=int, default=5, help="sequential requests before measuring")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    fakes, fakes_url = start_fakes(args)
+    results = []
+    try:
+        for app in args.app or sorted(APPS):
+            with tempfile.TemporaryDirectory() as workdir:
+                process, base_url = start_app(APPS[app], fakes_url, workdir)
+                try:
+                    if app == "database":
+                        seed_database(base_url)
+                    for scenario in args.scenario or list(SCENARIOS):
+                        result = asyncio.run(run_scenario(
+                            base_url, SCENARIOS[scenario], args.requests, args.concurrency, args.warmup
+                        ))
+                        results.append({"app": app, "scenario": scenario, **result})
+                        print(
+                            f"{app:8} {scenario:22} rps={result['throughput_rps']:8.2f}  errors={result['errors']:4}  "
+                            f"p50={result['p50_ms']}ms  p95={result['p95_ms']}ms  p99={result['p99_ms']}ms"
+                        )
+                finally:
+                    process.terminate()
+                    process.wait()
+    finally:
+        fakes.should_exit = True
+
+    if args.output:
+        report = {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "arguments": {key: value for key, value in vars(args).items() if key != "output"},
+            "results": results,
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
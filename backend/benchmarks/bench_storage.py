@@ -0,0 +1,103 @@
+"""
+Range-query latency of the database_integration storage layer.
+
+Fills a throwaway SQLite file with events and feelings spread over several
+years and times the prepared range queries for day, week and month windows.
+
+Usage (from backend/):
+    python -m benchmarks.bench_storage --rows 1000000
+    python -m benchmarks.bench_storage --rows 1000000 --no-index
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, text
+from sqlalchemy.orm import Session
+
+from database_integration import models
+from database_integration.database import create_sqlite_engine
+from database_integration.queries import events_in_range, feelings_in_range, init_db
+
+START = datetime(2020, 1, 1)
+STEP = timedelta(minutes=5)
+BATCH = 50_000
+WINDOWS = {"day": timedelta(days=1), "week": timedelta(days=7), "month": timedelta(days=30)}
+
+
+def fill(engine, rows: int) -> None:
+    with engine.begin() as conn:
+        for offset in range(0, rows, BATCH):
+            n = min(BATCH, rows - offset)
+            times = [START + STEP * (offset + i) for i in range(n)]
+            conn.execute(
+                insert(models.Event.__table__),
+                [
+                    {
+                        "date": t.date(),
+                        "startTime": t,
+                        "endTime": t + STEP,
+                        "description": "Benchmark event",
+                        "tags": "work",
+                        "name": "Event",
+                    }
+                    for t in times
+                ],
+            )
+            conn.execute(
+                insert(models.Feeling.__table__),
+                [{"feelings": "calm", "score": 1 + i % 10, "datetime": t} for i, t in enumerate(times)],
+            )
+
+
+def percentile(samples, q):
+    return statistics.quantiles(samples, n=100)[q - 1] if len(samples) > 1 else samples[0]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000, help="rows per table")
+    parser.add_argument("--queries", type=int, default=200, help="queries per window size")
+    parser.add_argument("--no-index", action="store_true", help="drop the time indexes to compare")
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    engine = create_sqlite_engine(f"sqlite:///{path}")
+    init_db(engine)
+
+    t = time.perf_counter()
+    fill(engine, args.rows)
+    print(f"inserted {args.rows:,} events and feelings in {time.perf_counter() - t:.1f}s")
+
+    if args.no_index:
+        with engine.begin() as conn:
+            conn.execute(text('DROP INDEX "ix_events_startTime"'))
+            conn.execute(text("DROP INDEX ix_feelings_datetime"))
+
+    span = STEP * args.rows
+    rng = random.Random(0)
+    with Session(engine) as db:
+        for name, window in WINDOWS.items():
+            for label, query in (("events", events_in_range), ("feelings", feelings_in_range)):
+                samples, found = [], 0
+                for _ in range(args.queries):
+                    start = START + (span - window) * rng.random()
+                    t = time.perf_counter()
+                    found += len(query(db, start, start + window))
+                    samples.append((time.perf_counter() - t) * 1000)
+                    db.expunge_all()
+                print(
+                    f"{label:8} {name:5}  rows/query={found // args.queries:6}  "
+                    f"p50={percentile(samples, 50):7.2f}ms  p95={percentile(samples, 95):7.2f}ms"
+                )
+
+    engine.dispose()
+    os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+"""
+Local stand-ins for the OpenAI, Mistral, ElevenLabs and ACI APIs.
+
+All four are served by one app under their own prefix, so the backend can
+be pointed at them with:
+
+    OPENAI_BASE_URL=http://HOST:PORT/openai/v1
+    MISTRAL_SERVER_URL=http://HOST:PORT/mistral
+    ELEVENLABS_BASE_URL=http://HOST:PORT/elevenlabs
+    ACI_SERVER_URL=http://HOST:PORT/aci/v1/
+
+Each provider has a configurable latency (time to first byte, with
+jitter), a streaming rate for token/audio streams and an error rate.
+Payloads only depend on the request, so runs are reproducible.
+
+Usage (from backend/):
+    python -m benchmarks.fake_upstreams --port 9100 --latency openai=800 --error-rate mistral=0.05
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+from fastapi import APIRouter, FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+PROVIDERS = ("openai", "mistral", "elevenlabs", "aci")
+
+
+@dataclass
+class ProviderConfig:
+    latency_ms: float = 300.0
+    jitter_ms: float = 50.0
+    # Stream rate: tokens per second for chat completions, KiB per second for audio
+    stream_rate: float = 50.0
+    error_rate: float = 0.0
+
+
+@dataclass
+class FakeConfig:
+    providers: Dict[str, ProviderConfig] = field(default_factory=lambda: {name: ProviderConfig() for name in PROVIDERS})
+    seed: int = 0
+
+
+def digest(*parts) -> int:
+    return int(hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()[:12], 16)
+
+
+class Upstream:
+    def __init__(self, name: str, config: FakeConfig):
+        self.config = config.providers[name]
+        self.rng = random.Random(config.seed)
+
+    async def wait(self) -> None:
+        jitter = self.rng.uniform(-self.config.jitter_ms, self.config.jitter_ms)
+        await asyncio.sleep(max(0.0, self.config.latency_ms + jitter) / 1000)
+
+    def failure(self):
+        """A 429 or 500 response for the configured share of requests, else None."""
+        if self.rng.random() >= self.config.error_rate:
+            return None
+        status = self.rng.choice([429, 500, 503])
+        return JSONResponse({"error": {"message": f"injected {status}"}}, status_code=status, headers={"Retry-After": "1"})
+
+
+def completion_text(messages: List[dict], words: int = 60) -> str:
+    seed = digest(messages)
+    vocabulary = ["Keep", "going", "you", "are", "doing", "great", "take", "a", "short", "break",
+                  "focus", "on", "one", "thing", "at", "time", "rest", "well", "tonight", "and", "plan", "tomorrow"]
+    text = " ".join(vocabulary[(seed + i * 7) % len(vocabulary)] for i in range(words))
+    return text.replace(" tonight", ". Tonight").strip() + "."
+
+
+def completion(model: str, message: dict, finish_reason: str = "stop") -> dict:
+    return {
+        "id": "cmpl-fake",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+        "usage": {"prompt_tokens": 100, "completion_tokens": 60, "total_tokens": 160},
+    }
+
+
+async def stream_completion(upstream: Upstream, model: str, text: str):
+    delay = 1 / upstream.config.stream_rate if upstream.config.stream_rate > 0 else 0
+    for i, word in enumerate(text.split(" ")):
+        chunk = {
+            "id": "cmpl-fake",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": {"role": "assistant", "content": word if i == 0 else " " + word}, "finish_reason": None}],
+        }
+        yield f"data: {json.dumps(chunk)}\n\n"
+        await asyncio.sleep(delay)
+    done = {
+        "id": "cmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+        "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 100, "completion_tokens": 60, "total_tokens": 160},
+    }
+    yield f"data: {json.dumps(done)}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+def tool_calls_for(messages: List[dict], tools: List[dict]) -> List[dict]:
+    """Deterministic tool calls: an insert for scheduling messages, a feeling for every turn."""
+    names = {tool["function"]["name"] for tool in tools}
+    text = str(messages[-1].get("content", "")).lower()
+    calls = []
+    if "GOOGLE_CALENDAR__EVENTS_INSERT" in names and any(word in text for word in ("meeting", "tomorrow", "at ")):
+        calls.append(("GOOGLE_CALENDAR__EVENTS_INSERT", {
+            "path": {"calendarId": "primary"},
+            "body": {
+                "summary": "Team meeting",
+                "start": {"dateTime": "2025-06-16T10:00:00+02:00", "timeZone": "Europe/Berlin"},
+                "end": {"dateTime": "2025-06-16T11:00:00+02:00", "timeZone": "Europe/Berlin"},
+            },
+        }))
+    if "GOOGLE_CALENDAR__EVENTS_LIST" in names and any(word in text for word in ("what do i have", "schedule", "calendar")):
+        calls.append(("GOOGLE_CALENDAR__EVENTS_LIST", {
+            "path": {"calendarId": "primary"},
+            "query": {"timeMin": "2025-06-16T00:00:00Z", "timeMax": "2025-06-17T00:00:00Z"},
+        }))
+    if "extract_feeling_from_log" in names and (not calls or digest(text) % 2):
+        calls.append(("extract_feeling_from_log", {"feelings": ["motivated"], "score": 1 + digest(text) % 10}))
+    return [
+        {"id": f"call_{i}", "type": "function", "function": {"name": name, "arguments": json.dumps(arguments)}}
+        for i, (name, arguments) in enumerate(calls)
+    ]
+
+
+def chat_router(name: str, config: FakeConfig, with_tools: bool) -> APIRouter:
+    router = APIRouter()
+    upstream = Upstream(name, config)
+
+    @router.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        await upstream.wait()
+        failure = upstream.failure()
+        if failure is not None:
+            return failure
+        model = body.get("model", "fake")
+        if with_tools and body.get("tools"):
+            calls = tool_calls_for(body["messages"], body["tools"])
+            if calls:
+                return completion(model, {"role": "assistant", "content": None, "tool_calls": calls}, "tool_calls")
+        text = completion_text(body["messages"], words=min(body.get("max_tokens") or 60, 60))
+        if body.get("stream"):
+            return StreamingResponse(stream_completion(upstream, model, text), media_type="text/event-stream")
+        return completion(model, {"role": "assistant", "content": text})
+
+    return router
+
+
+def elevenlabs_router(config: FakeConfig) -> APIRouter:
+    router = APIRouter()
+    upstream = Upstream("elevenlabs", config)
+
+    @router.post("/v1/text-to-speech/{voice_id}/stream")
+    async def text_to_speech_stream(voice_id: str, request: Request):
+        body = await request.json()
+        await upstream.wait()
+        failure = upstream.failure()
+        if failure is not None:
+            return failure
+        # About 2 KiB of "audio" per 25 characters, derived from the text
+        text = body.get("text", "")
+        seed = hashlib.sha256(text.encode()).digest()
+        size = max(1, len(text) // 25) * 2048
+        chunk_size = 1024
+        delay = 1 / upstream.config.stream_rate if upstream.config.stream_rate > 0 else 0
+
+        async def audio():
+            for offset in range(0, size, chunk_size):
+                yield (seed * (chunk_size // len(seed) + 1))[:min(chunk_size, size - offset)]
+                await asyncio.sleep(delay)
+
+        return StreamingResponse(audio(), media_type="audio/mpeg")
+
+    return router
+
+
+def aci_router(config: FakeConfig) -> APIRouter:
+    router = APIRouter()
+    upstream = Upstream("aci", config)
+
+    @router.get("/v1/functions/{function_name}/definition")
+    async def definition(function_name: str):
+        await upstream.wait()
+        return {
+            "type": "function",
+            "function": {
+                "name": function_name,
+                "description": f"Fake definition of {function_name}",
+                "parameters": {
+                    "type": "object",
+                    "properties": {"path": {"type": "object"}, "query": {"type": "object"}, "body": {"type": "object"}},
+                    "required": ["path"],
+                },
+            },
+        }
+
+    @router.post("/v1/functions/{function_name}/execute")
+    async def execute(function_name: str, request: Request):
+        body = await request.json()
+        await upstream.wait()
+        failure = upstream.failure()
+        if failure is not None:
+            return failure
+        function_input = body.get("function_input", {})
+        if function_name == "GOOGLE_CALENDAR__EVENTS_INSERT":
+            event = dict(function_input.get("body", {}))
+            event.update(id=f"evt{digest(event)}", status="confirmed", updated="2025-06-15T12:00:00Z")
+            return {"success": True, "data": event}
+        if function_name == "GOOGLE_CALENDAR__EVENTS_LIST":
+            items = [
+                {
+                    "id": f"evt{day}",
+                    "status": "confirmed",
+                    "summary": f"Calendar event {day}",
+                    "start": {"dateTime": f"2025-06-{day:02d}T09:00:00+02:00"},
+                    "end": {"dateTime": f"2025-06-{day:02d}T10:00:00+02:00"},
+                    "updated": "2025-06-01T00:00:00Z",
+                }
+                for day in range(1, 31)
+            ]
+            # Incremental syncs see no changes
+            if function_input.get("query", {}).get("syncToken"):
+                items = []
+            return {"success": True, "data": {"kind": "calendar#events", "items": items, "nextSyncToken": "fake-sync-token"}}
+        return {"success": False, "error": f"Unknown function {function_name}"}
+
+    return router
+
+
+def build_app(config: FakeConfig) -> FastAPI:
+    app = FastAPI(title="Fake upstreams")
+    app.include_router(chat_router("openai", config, with_tools=True), prefix="/openai")
+    app.include_router(chat_router("mistral", config, with_tools=False), prefix="/mistral")
+    app.include_router(elevenlabs_router(config), prefix="/elevenlabs")
+    app.include_router(aci_router(config), prefix="/aci")
+    return app
+
+
+def upstream_env(base_url: str) -> Dict[str, str]:
+    """Environment that points the backend's clients at the fakes."""
+    return {
+        "OPENAI_BASE_URL": f"{base_url}/openai/v1",
+        "MISTRAL_SERVER_URL": f"{base_url}/mistral",
+        "ELEVENLABS_BASE_URL": f"{base_url}/elevenlabs",
+        "ACI_SERVER_URL": f"{base_url}/aci/v1/",
+    }
+
+
+def parse_overrides(values: List[str], option: str) -> Dict[str, float]:
+    overrides = {}
+    for value in values:
+        provider, _, number = value.partition("=")
+        if provider not in PROVIDERS:
+            raise SystemExit(f"{option}: unknown provider {provider!r}, expected one of {', '.join(PROVIDERS)}")
+        overrides[provider] = float(number)
+    return overrides
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--latency", action="append", default=[], metavar="PROVIDER=MS", help="time to first byte")
+    parser.add_argument("--jitter", action="append", default=[], metavar="PROVIDER=MS", help="+/- latency jitter")
+    parser.add_argument("--stream-rate", action="append", default=[], metavar="PROVIDER=N", help="tokens/s or KiB/s")
+    parser.add_argument("--error-rate", action="append", default=[], metavar="PROVIDER=P", help="share of failed requests")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def config_from_args(args: argparse.Namespace) -> FakeConfig:
+    config = FakeConfig(seed=args.seed)
+    for option, attribute in (("latency", "latency_ms"), ("jitter", "jitter_ms"), ("stream_rate", "stream_rate"), ("error_rate", "error_rate")):
+        for provider, value in parse_overrides(getattr(args, option), f"--{option.replace('_', '-')}").items():
+            setattr(config.providers[provider], attribute, value)
+    return config
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    add_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(build_app(config_from_args(args)), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from tokens import count_tokens
+
+# Token budget for the summary and past turns of a session, on top of the system prompt and the new message
+CHAT_CONTEXT_TOKENS = int(os.getenv("CHAT_CONTEXT_TOKENS", "3000"))
+
+
+def new_session_id() -> str:
+    """Id of a new session, issued when a client starts a chat without one."""
+    return uuid.uuid4().hex
+
+
+@dataclass
+class ChatMessage:
+    role: str
+    content: str
+    tokens: int
+
+
+@dataclass
+class ChatSession:
+    id: str
+    messages: List[ChatMessage] = field(default_factory=list)
+    # Rolling summary of messages[:summarized_upto]
+    summary: str = ""
+    summary_tokens: int = 0
+    summarized_upto: int = 0
+
+
+class SessionStore:
+    """
+    Chat sessions with an append-only message log.
+
+    Sessions are kept in memory (least recently used ones are dropped past
+    `max_sessions`). If `sqlite_path` is set, messages and summaries are
+    also written to SQLite and sessions are reloaded from it on a miss.
+
+    Args:
+        max_sessions (int): Maximum number of sessions kept in memory
+        sqlite_path (Optional[str]): SQLite file for persistence, if any
+    """
+
+    def __init__(self, max_sessions: int = 1024, sqlite_path: Optional[str] = None):
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if sqlite_path:
+            self._db = sqlite3.connect(sqlite_path, check_same_thread=False)
+            self._db.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS chat_messages (
+                    session_id TEXT NOT NULL, seq INTEGER NOT NULL, role TEXT NOT NULL,
+                    content TEXT NOT NULL, tokens INTEGER NOT NULL, created_at REAL NOT NULL,
+                    PRIMARY KEY (session_id, seq)
+                );
+                CREATE TABLE IF NOT EXISTS chat_summaries (
+                    session_id TEXT PRIMARY KEY, summary TEXT NOT NULL, summarized_upto INTEGER NOT NULL
+                );
+                """
+            )
+            self._db.commit()
+
+    def get(self, session_id: str) -> ChatSession:
+        """Return the session, creating an empty one for unknown ids."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._load(session_id)
+                self._sessions[session_id] = session
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def _load(self, session_id: str) -> ChatSession:
+        session = ChatSession(id=session_id)
+        if self._db is None:
+            return session
+        rows = self._db.execute(
+            "SELECT role, content, tokens FROM chat_messages WHERE session_id = ? ORDER BY seq", (session_id,)
+        ).fetchall()
+        session.messages = [ChatMessage(role, content, tokens) for role, content, tokens in rows]
+        row = self._db.execute(
+            "SELECT summary, summarized_upto FROM chat_summaries WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is not None:
+            session.summary, session.summarized_upto = row
+            session.summary_tokens = count_tokens(session.summary)
+        return session
+
+    def append(self, session: ChatSession, role: str, content: str) -> None:
+        message = ChatMessage(role, content, count_tokens(content))
+        with self._lock:
+            session.messages.append(message)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT INTO chat_messages (session_id, seq, role, content, tokens, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (session.id, len(session.messages) - 1, role, content, message.tokens, time.time()),
+                )
+                self._db.commit()
+
+    def set_summary(self, session: ChatSession, summary: str, summarized_upto: int) -> None:
+        with self._lock:
+            session.summary = summary
+            session.summary_tokens = count_tokens(summary)
+            session.summarized_upto = summarized_upto
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO chat_summaries (session_id, summary, summarized_upto) VALUES (?, ?, ?)",
+                    (session.id, summary, summarized_upto),
+                )
+                self._db.commit()
+
+
+Summarize = Callable[[str, List[ChatMessage]], Awaitable[str]]
+
+
+async def build_context(
+    store: SessionStore,
+    session: ChatSession,
+    system_prompt: str,
+    user_content: str,
+    summarize: Summarize,
+    budget: int = CHAT_CONTEXT_TOKENS,
+) -> List[Dict[str, str]]:
+    """
+    Messages for the next turn: system prompt, rolling summary, past turns, new message.
+
+    Once the unsummarized turns exceed the budget, the oldest ones are
+    folded into the summary until half the budget is free again. Folding
+    in chunks rather than sliding the window every turn keeps the message
+    prefix unchanged between folds, so provider-side prompt caching keeps
+    hitting.
+    """
+    history = session.messages[session.summarized_upto:]
+    if session.summary_tokens + sum(m.tokens for m in history) > budget:
+        keep_tokens = 0
+        keep_from = len(history)
+        while keep_from > 0 and keep_tokens + history[keep_from - 1].tokens <= budget // 2:
+            keep_from -= 1
+            keep_tokens += history[keep_from].tokens
+        # Never start the kept history with an assistant reply
+        while keep_from < len(history) and history[keep_from].role != "user":
+            keep_from += 1
+        if keep_from > 0:
+            summary = await summarize(session.summary, history[:keep_from])
+            store.set_summary(session, summary, session.summarized_upto + keep_from)
+            history = history[keep_from:]
+
+    messages = [{"role": "system", "content": system_prompt}]
+    if session.summary:
+        messages.append({"role": "system", "content": f"Summary of the earlier conversation: {session.summary}"})
+    messages += [{"role": m.role, "content": m.content} for m in history]
+    messages.append({"role": "user", "content": user_content})
+    return messages
+
+
+chat_sessions = SessionStore(
+    max_sessions=int(os.getenv("CHAT_SESSIONS_MAX", "1024")),
+    sqlite_path=os.getenv("CHAT_SESSIONS_DB") or None,
+)
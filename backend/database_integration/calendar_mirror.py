@@ -0,0 +1,313 @@
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import bindparam, delete, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from database_integration import models
+from database_integration.database import SessionLocal
+from gcal import execute_function_async
+from schemes import parse_timestamp
+
+logger = logging.getLogger(__name__)
+
+CALENDAR_SYNC_INTERVAL = float(os.getenv("CALENDAR_SYNC_INTERVAL", "300"))
+# How far back the initial (full) sync reaches; later syncs only fetch changes
+CALENDAR_SYNC_DAYS_BACK = int(os.getenv("CALENDAR_SYNC_DAYS_BACK", "365"))
+
+LIST_FUNCTION = "GOOGLE_CALENDAR__EVENTS_LIST"
+INSERT_FUNCTION = "GOOGLE_CALENDAR__EVENTS_INSERT"
+
+# List query parameters the mirror answers like Google; a call with any other goes to the live API
+MIRROR_QUERY_PARAMETERS = {"timeMin", "timeMax", "q", "maxResults", "orderBy", "singleEvents", "showDeleted"}
+# Google's page size defaults and limits
+DEFAULT_MAX_RESULTS = 250
+MAX_RESULTS_LIMIT = 2500
+
+ToolHandler = Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+_calendar_event_insert = sqlite_insert(models.CalendarEvent)
+UPSERT_CALENDAR_EVENT = _calendar_event_insert.on_conflict_do_update(
+    index_elements=["owner_id", "calendar_id", "google_id"],
+    set_={
+        column: _calendar_event_insert.excluded[column]
+        for column in ("summary", "startTime", "endTime", "all_day", "updated", "raw")
+    },
+)
+DELETE_CALENDAR_EVENT = delete(models.CalendarEvent).where(
+    models.CalendarEvent.owner_id == bindparam("owner"),
+    models.CalendarEvent.calendar_id == bindparam("calendar"),
+    models.CalendarEvent.google_id == bindparam("google_id"),
+)
+# Same bounds as the local events: start <= startTime < end
+CALENDAR_EVENTS_IN_RANGE = (
+    select(models.CalendarEvent)
+    .where(
+        models.CalendarEvent.owner_id == bindparam("owner_id"),
+        models.CalendarEvent.startTime >= bindparam("start"),
+        models.CalendarEvent.startTime < bindparam("end"),
+    )
+    .order_by(models.CalendarEvent.startTime)
+)
+# Google's list semantics: events ending after timeMin and starting before timeMax
+CALENDAR_EVENTS_OVERLAPPING = (
+    select(models.CalendarEvent)
+    .where(
+        models.CalendarEvent.owner_id == bindparam("owner_id"),
+        models.CalendarEvent.calendar_id == bindparam("calendar_id"),
+        models.CalendarEvent.endTime > bindparam("start"),
+        models.CalendarEvent.startTime < bindparam("end"),
+    )
+    .order_by(models.CalendarEvent.startTime)
+)
+
+
+def _flag(value: Any) -> bool:
+    # Tool arguments may carry booleans as strings
+    return value.strip().lower() in ("true", "1") if isinstance(value, str) else bool(value)
+
+
+def mirror_can_answer(query: Dict[str, Any]) -> bool:
+    """
+    Whether the mirror's answer to a list query matches the live API's.
+
+    The mirror holds the expanded instances of recurring events, without
+    deleted ones. Without singleEvents Google would return the recurring
+    masters instead; the mirror answers with their instances.
+    """
+    if any(value is not None and name not in MIRROR_QUERY_PARAMETERS for name, value in query.items()):
+        return False
+    if "singleEvents" in query and query["singleEvents"] is not None and not _flag(query["singleEvents"]):
+        return False
+    if _flag(query.get("showDeleted")):
+        return False
+    return query.get("orderBy") in (None, "startTime", "updated")
+
+
+def matches_text(item: Dict[str, Any], q: str) -> bool:
+    """Free-text search like Google's `q`: every term occurs in the summary, description, location or a participant."""
+    people = [item.get("organizer") or {}, item.get("creator") or {}] + list(item.get("attendees") or [])
+    fields = [item.get("summary"), item.get("description"), item.get("location")]
+    fields += [person.get(key) for person in people for key in ("displayName", "email")]
+    text = " ".join(field for field in fields if isinstance(field, str)).lower()
+    return all(term in text for term in q.lower().split())
+
+
+class SyncTokenExpired(Exception):
+    """Google answered 410 Gone; the mirror has to be rebuilt with a full sync."""
+
+
+def calendar_event_row(owner_id: str, calendar_id: str, item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Mirror row of a Google event resource, or None for items without usable times."""
+    start = item.get("start") or {}
+    end = item.get("end") or {}
+    start_value = start.get("dateTime") or start.get("date")
+    end_value = end.get("dateTime") or end.get("date")
+    if not start_value or not end_value:
+        return None
+    return {
+        "owner_id": owner_id,
+        "calendar_id": calendar_id,
+        "google_id": item["id"],
+        "summary": item.get("summary", ""),
+        "startTime": models.to_storage(parse_timestamp(start_value)),
+        "endTime": models.to_storage(parse_timestamp(end_value)),
+        "all_day": "dateTime" not in start,
+        "updated": models.to_storage(parse_timestamp(item["updated"])) if item.get("updated") else None,
+        "raw": json.dumps(item),
+    }
+
+
+def apply_calendar_items(db: Session, owner_id: str, calendar_id: str, items: List[Dict[str, Any]]) -> None:
+    """Upsert changed events and drop cancelled ones; the caller commits."""
+    rows = []
+    cancelled = []
+    for item in items:
+        if item.get("status") == "cancelled":
+            cancelled.append({"owner": owner_id, "calendar": calendar_id, "google_id": item["id"]})
+            continue
+        row = calendar_event_row(owner_id, calendar_id, item)
+        if row is not None:
+            rows.append(row)
+    if rows:
+        db.execute(UPSERT_CALENDAR_EVENT, rows)
+    if cancelled:
+        # Executemany deletes are only supported at the Core level
+        db.connection().execute(DELETE_CALENDAR_EVENT, cancelled)
+
+
+def calendar_events_in_range(db: Session, owner_id: str, start: datetime, end: datetime) -> List[models.CalendarEvent]:
+    """Mirrored events with start <= startTime < end; bounds are naive UTC as stored."""
+    return db.scalars(CALENDAR_EVENTS_IN_RANGE, {"owner_id": owner_id, "start": start, "end": end}).all()
+
+
+async def list_calendar_page(owner_id: str, calendar_id: str, query: Dict[str, Any]) -> Dict[str, Any]:
+    result = await execute_function_async(
+        LIST_FUNCTION,
+        {"path": {"calendarId": calendar_id}, "query": query},
+        linked_account_owner_id=owner_id,
+    )
+    if not result.get("success"):
+        error = str(result.get("error", ""))
+        if "410" in error or "fullSyncRequired" in error:
+            raise SyncTokenExpired(error)
+        raise RuntimeError(f"Listing calendar events failed: {error}")
+    return result.get("data") or {}
+
+
+class CalendarSync:
+    """
+    Keeps the calendar_events mirror of one owner's calendar current.
+
+    The first run lists the last `days_back` days; every later run passes
+    the stored syncToken, so Google only returns what changed since. All
+    pages of a run are written together with the new token in a single
+    transaction.
+
+    One instance serves exactly one owner: mirrored events and the sync
+    token are stored under `owner_id`, and its tool handlers only answer
+    for that owner. The apps run a single instance for
+    LINKED_ACCOUNT_OWNER_ID, the one account they serve; further owners
+    need an instance each.
+
+    Args:
+        owner_id (str): Linked account whose calendar is mirrored
+        calendar_id (str): Google calendar id
+        interval (float): Seconds between background syncs
+        days_back (int): Reach of a full sync into the past
+    """
+
+    def __init__(
+        self,
+        owner_id: str = models.DEFAULT_OWNER_ID,
+        calendar_id: str = "primary",
+        interval: float = CALENDAR_SYNC_INTERVAL,
+        days_back: int = CALENDAR_SYNC_DAYS_BACK,
+    ):
+        self.owner_id = owner_id
+        self.calendar_id = calendar_id
+        self.interval = interval
+        self.days_back = days_back
+        self.ready = False
+        self._lock = asyncio.Lock()
+        self._sync_task: Optional[asyncio.Task] = None
+
+    def _load_token(self) -> Optional[str]:
+        with SessionLocal() as db:
+            state = db.get(models.CalendarSyncState, (self.owner_id, self.calendar_id))
+            return state.sync_token if state else None
+
+    def _store(self, items: List[Dict[str, Any]], sync_token: Optional[str], full: bool) -> None:
+        with SessionLocal() as db:
+            if full:
+                db.execute(delete(models.CalendarEvent).where(
+                    models.CalendarEvent.owner_id == self.owner_id,
+                    models.CalendarEvent.calendar_id == self.calendar_id,
+                ))
+            apply_calendar_items(db, self.owner_id, self.calendar_id, items)
+            db.merge(models.CalendarSyncState(
+                owner_id=self.owner_id,
+                calendar_id=self.calendar_id,
+                sync_token=sync_token,
+                synced_at=models.to_storage(datetime.now(timezone.utc)),
+            ))
+            db.commit()
+
+    async def sync(self) -> int:
+        """Run one sync and return the number of changed items."""
+        async with self._lock:
+            sync_token = await run_in_threadpool(self._load_token)
+            try:
+                items, next_token = await self._fetch(sync_token)
+            except SyncTokenExpired:
+                logger.info("Calendar sync token expired, running a full sync")
+                sync_token = None
+                items, next_token = await self._fetch(None)
+            await run_in_threadpool(self._store, items, next_token, sync_token is None)
+            self.ready = True
+            return len(items)
+
+    async def _fetch(self, sync_token: Optional[str]):
+        query: Dict[str, Any] = {"singleEvents": True, "maxResults": 2500}
+        if sync_token:
+            query["syncToken"] = sync_token
+        else:
+            time_min = datetime.now(timezone.utc) - timedelta(days=self.days_back)
+            query["timeMin"] = time_min.isoformat().replace("+00:00", "Z")
+        items = []
+        while True:
+            data = await list_calendar_page(self.owner_id, self.calendar_id, query)
+            items.extend(data.get("items", []))
+            if not data.get("nextPageToken"):
+                return items, data.get("nextSyncToken")
+            query = {**query, "pageToken": data["nextPageToken"]}
+
+    async def start(self) -> None:
+        """Serve from a mirror left by a previous run right away and start syncing in the background."""
+        self.ready = await run_in_threadpool(self._load_token) is not None
+        self._sync_task = asyncio.create_task(self._sync_loop())
+
+    async def stop(self) -> None:
+        if self._sync_task:
+            self._sync_task.cancel()
+            self._sync_task = None
+
+    async def _sync_loop(self) -> None:
+        while True:
+            try:
+                changed = await self.sync()
+                logger.debug("Calendar sync applied %d changes", changed)
+            except Exception:
+                # Keep serving the current mirror; the next round retries
+                logger.exception("Calendar sync failed")
+            await asyncio.sleep(self.interval)
+
+    def _list_from_mirror(self, query: Dict[str, Any]) -> Dict[str, Any]:
+        now = datetime.now(timezone.utc)
+        start = parse_timestamp(query["timeMin"]) if query.get("timeMin") else now - timedelta(days=self.days_back)
+        end = parse_timestamp(query["timeMax"]) if query.get("timeMax") else datetime.max.replace(tzinfo=timezone.utc)
+        with SessionLocal() as db:
+            events = db.scalars(CALENDAR_EVENTS_OVERLAPPING, {
+                "owner_id": self.owner_id,
+                "calendar_id": self.calendar_id,
+                "start": models.to_storage(start),
+                "end": models.to_storage(end),
+            }).all()
+        if query.get("orderBy") == "updated":
+            events = sorted(events, key=lambda event: event.updated or datetime.min)
+        items = [json.loads(event.raw) for event in events]
+        if query.get("q"):
+            items = [item for item in items if matches_text(item, str(query["q"]))]
+        max_results = min(int(query.get("maxResults") or DEFAULT_MAX_RESULTS), MAX_RESULTS_LIMIT)
+        return {"success": True, "data": {"kind": "calendar#events", "items": items[:max_results]}}
+
+    def _store_inserted(self, item: Dict[str, Any]) -> None:
+        with SessionLocal() as db:
+            apply_calendar_items(db, self.owner_id, self.calendar_id, [item])
+            db.commit()
+
+    def tool_handlers(self) -> Dict[str, ToolHandler]:
+        """lifeChat tool overrides: list calls read the mirror, inserts update it right away."""
+
+        def mirrored(arguments: Dict[str, Any]) -> bool:
+            return (arguments.get("path") or {}).get("calendarId", "primary") == self.calendar_id
+
+        async def list_events(arguments: Dict[str, Any]) -> Dict[str, Any]:
+            query = arguments.get("query") or {}
+            if not self.ready or not mirrored(arguments) or not mirror_can_answer(query):
+                return await execute_function_async(LIST_FUNCTION, arguments, linked_account_owner_id=self.owner_id)
+            return await run_in_threadpool(self._list_from_mirror, query)
+
+        async def insert_event(arguments: Dict[str, Any]) -> Dict[str, Any]:
+            result = await execute_function_async(INSERT_FUNCTION, arguments, linked_account_owner_id=self.owner_id)
+            if mirrored(arguments) and result.get("success") and isinstance(result.get("data"), dict):
+                await run_in_threadpool(self._store_inserted, result["data"])
+            return result
+
+        return {LIST_FUNCTION: list_events, INSERT_FUNCTION: insert_event}
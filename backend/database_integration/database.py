@@ -1,10 +1,55 @@
-from sqlalchemy import create_engine
+import os
+
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./lifechat.db"
+from telemetry import instrument_engine
+
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./lifechat.db")
+
+# Applied to every new pooled connection
+SQLITE_PRAGMAS = {
+    # Readers no longer wait for writers (and vice versa)
+    "journal_mode": "WAL",
+    # Safe with WAL; fsync only at checkpoints instead of every commit
+    "synchronous": "NORMAL",
+    "mmap_size": 256 * 1024 * 1024,
+    # Negative values are KiB, i.e. 64 MiB page cache per connection
+    "cache_size": -64 * 1024,
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,
+}
+
+
+def create_sqlite_engine(url: str = SQLALCHEMY_DATABASE_URL, pool_size: int = 8):
+    engine = create_engine(
+        url,
+        # Sessions are handed to the threadpool; cached_statements keeps the range queries prepared
+        connect_args={"check_same_thread": False, "cached_statements": 256},
+        pool_size=pool_size,
+        max_overflow=pool_size,
+    )
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+        # pysqlite would otherwise begin transactions implicitly and commit on SAVEPOINT release;
+        # with BEGIN emitted below, Session.begin_nested() works inside the outer transaction
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def begin_transaction(connection):
+        connection.exec_driver_sql("BEGIN")
+
+    instrument_engine(engine)
+    return engine
+
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+engine = create_sqlite_engine()
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -0,0 +1,139 @@
+import json
+import os
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple, Type
+
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, ValidationError
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "500"))
+
+ToRow = Callable[[Any], Dict]
+InsertRows = Callable[[Session, List[Dict]], None]
+
+
+class RowError(BaseModel):
+    index: int
+    error: str
+
+
+class IngestResult(BaseModel):
+    inserted: int = 0
+    errors: List[RowError] = []
+
+
+def describe_validation_error(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in e['loc']) or 'record'}: {e['msg']}" for e in error.errors()
+    )
+
+
+def validate_record(
+    scheme: Type[BaseModel], to_row: ToRow, index: int, record: Any, result: IngestResult
+) -> Optional[Dict]:
+    """Convert one record to a row, or note why it was rejected and return None."""
+    try:
+        return to_row(scheme.model_validate(record))
+    except ValidationError as e:
+        result.errors.append(RowError(index=index, error=describe_validation_error(e)))
+    except ValueError as e:
+        result.errors.append(RowError(index=index, error=str(e)))
+    return None
+
+
+def insert_batch(db: Session, batch: List[Tuple[int, Dict]], insert_rows: InsertRows, result: IngestResult) -> None:
+    """
+    Insert (index, row) pairs in a savepoint of the open transaction.
+
+    If the database rejects the batch (e.g. a constraint violation), it is
+    retried row by row, so only the failing rows are reported and skipped.
+    """
+    if not batch:
+        return
+    try:
+        with db.begin_nested():
+            insert_rows(db, [row for _, row in batch])
+        result.inserted += len(batch)
+        return
+    except SQLAlchemyError:
+        pass
+    for index, row in batch:
+        try:
+            with db.begin_nested():
+                insert_rows(db, [row])
+            result.inserted += 1
+        except SQLAlchemyError as e:
+            result.errors.append(RowError(index=index, error=str(getattr(e, "orig", None) or e)))
+
+
+def ingest(
+    db: Session, records: Iterable[Any], scheme: Type[BaseModel], to_row: ToRow, insert_rows: InsertRows
+) -> IngestResult:
+    """
+    Validate records and insert the valid ones in a single transaction.
+
+    Invalid records and rows the database rejects are reported by their
+    position and skipped; they do not abort the batch.
+    """
+    result = IngestResult()
+    rows = []
+    for index, record in enumerate(records):
+        row = validate_record(scheme, to_row, index, record, result)
+        if row is not None:
+            rows.append((index, row))
+    insert_batch(db, rows, insert_rows, result)
+    db.commit()
+    result.errors.sort(key=lambda error: error.index)
+    return result
+
+
+async def ndjson_records(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, bytes]]:
+    """Yield (line index, raw line) for each non-blank line of a newline-delimited body."""
+    buffer = b""
+    index = 0
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield index, line
+            index += 1
+    if buffer.strip():
+        yield index, buffer
+
+
+async def ingest_ndjson(
+    db: Session,
+    chunks: AsyncIterator[bytes],
+    scheme: Type[BaseModel],
+    to_row: ToRow,
+    insert_rows: InsertRows,
+    batch_size: int = IMPORT_BATCH_SIZE,
+) -> IngestResult:
+    """
+    Import an NDJSON body while it is still being received.
+
+    Rows are inserted in batches of `batch_size` as they are parsed, but
+    committed once at the end, so an aborted upload leaves nothing behind.
+    Errors are reported by line index.
+    """
+    result = IngestResult()
+    batch: List[Tuple[int, Dict]] = []
+    async for index, line in ndjson_records(chunks):
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            result.errors.append(RowError(index=index, error=f"invalid JSON: {e}"))
+            continue
+        row = validate_record(scheme, to_row, index, record, result)
+        if row is None:
+            continue
+        batch.append((index, row))
+        if len(batch) >= batch_size:
+            await run_in_threadpool(insert_batch, db, batch, insert_rows, result)
+            batch = []
+    await run_in_threadpool(insert_batch, db, batch, insert_rows, result)
+    await run_in_threadpool(db.commit)
+    result.errors.sort(key=lambda error: error.index)
+    return result
@@ -1,35 +1,49 @@
-from datetime import datetime
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timezone
 import os
-from typing import List
+from typing import Any, List, Optional
 
-from fastapi import FastAPI, Depends, Query
-from pydantic import BaseModel, Field
+from fastapi import FastAPI, Body, Depends, HTTPException, Query, Request
+from pydantic import ValidationError
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 import uvicorn
 
+from chat_sessions import new_session_id
+from database_integration.calendar_mirror import CalendarSync, calendar_events_in_range
 from database_integration.database import SessionLocal, engine
 from database_integration import models
-from mistral import mistral_client, lifeChat, extract_event_and_feeling
+from database_integration.ingest import IngestResult, describe_validation_error, ingest, ingest_ndjson
+from database_integration.rollups import Granularity, feeling_stats
+from database_integration.queries import events_in_range, feelings_in_range, init_db, insert_events, insert_feelings
+from mistral import extract_event_and_feeling, extract_event_and_feeling_stream, generate_advice, generate_motivation
+from schemes import APP_TIMEZONE, Event, Feeling, parse_timestamp
+from gcal import calendar_tools
+from sse import sse_response
+from telemetry import instrument_app
+from admission import add_admission_control
+from precompute import PrecomputeScheduler
 from dotenv import load_dotenv
 
 load_dotenv()
 
-models.Base.metadata.create_all(bind=engine)
+init_db(engine)
 
-app = FastAPI()
+calendar_sync = CalendarSync()
 
-class Event(BaseModel):
-    date: str
-    startTime: str
-    endTime: str
-    description: str
-    tags: List[str]
-    name: str
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await calendar_tools.start()
+    await calendar_sync.start()
+    await precompute_scheduler.start()
+    yield
+    await precompute_scheduler.stop()
+    await calendar_sync.stop()
+    await calendar_tools.stop()
 
-class Feeling(BaseModel):
-    feelings: List[str]
-    score: int = Field(..., ge=1, le=10)
-    datetime: str
+app = FastAPI(lifespan=lifespan)
+instrument_app(app)
+add_admission_control(app)
 
 def get_db():
     db = SessionLocal()
@@ -38,20 +52,26 @@ def get_db():
     finally:
         db.close()
 
-@app.get("/getEvents")
+def parse_range(startTime: str, endTime: str):
+    return (
+        models.to_storage(parse_timestamp(startTime)),
+        models.to_storage(parse_timestamp(endTime)),
+    )
+
+@app.get("/getEvents", response_model=List[Event])
 def get_events(startTime: str = Query(...), endTime: str = Query(...), db: Session = Depends(get_db)):
-    events = db.query(models.Event).filter(
-        models.Event.startTime >= startTime,
-        models.Event.startTime < endTime
-    ).all()
-    return events
+    start, end = parse_range(startTime, endTime)
+    # Locally logged events plus the mirrored Google Calendar
+    events = [e.to_scheme() for e in events_in_range(db, start, end)]
+    events += [e.to_scheme() for e in calendar_events_in_range(db, models.DEFAULT_OWNER_ID, start, end)]
+    return sorted(events, key=lambda e: e.start_epoch)
 
-@app.post("/addEvent")
+@app.post("/addEvent", response_model=Event)
 def add_event(event: Event, db: Session = Depends(get_db)):
     new_event = models.Event(
-        date=event.date,
-        startTime=event.startTime,
-        endTime=event.endTime,
+        date=date.fromisoformat(event.date),
+        startTime=models.to_storage(event.startTime),
+        endTime=models.to_storage(event.endTime),
         description=event.description,
         tags=",".join(event.tags),
         name=event.name
@@ -59,128 +79,118 @@ def add_event(event: Event, db: Session = Depends(get_db)):
     db.add(new_event)
     db.commit()
     db.refresh(new_event)
-    return new_event
+    return new_event.to_scheme()
 
-@app.post("/addFeeling")
+@app.post("/addFeeling", response_model=Feeling)
 def add_feeling(feelings: str, score: int, db: Session = Depends(get_db)):
-    new_feeling = models.Feeling(
-        feelings=feelings,
-        score=score,
-        datetime=datetime.now()
-    )
-    db.add(new_feeling)
+    try:
+        feeling = Feeling(feelings=feelings.split(","), score=score, datetime=datetime.now(timezone.utc))
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=describe_validation_error(e))
+    insert_feelings(db, [models.feeling_row(feeling)])
     db.commit()
-    db.refresh(new_feeling)
-    return new_feeling
+    return feeling
+
+@app.post("/addEvents", response_model=IngestResult)
+def add_events(events: List[Any] = Body(...), db: Session = Depends(get_db)):
+    return ingest(db, events, Event, models.event_row, insert_events)
+
+@app.post("/addFeelings", response_model=IngestResult)
+def add_feelings(feelings: List[Any] = Body(...), db: Session = Depends(get_db)):
+    return ingest(db, feelings, Feeling, models.feeling_row, insert_feelings)
+
+@app.post("/importEvents", response_model=IngestResult)
+async def import_events(request: Request, db: Session = Depends(get_db)):
+    # NDJSON, one event per line; parsed while the upload is still arriving
+    return await ingest_ndjson(db, request.stream(), Event, models.event_row, insert_events)
+
+@app.post("/importFeelings", response_model=IngestResult)
+async def import_feelings(request: Request, db: Session = Depends(get_db)):
+    return await ingest_ndjson(db, request.stream(), Feeling, models.feeling_row, insert_feelings)
 
-@app.get("/getAllFeelings")
+@app.get("/getAllFeelings", response_model=List[Feeling])
 def get_all_feelings(db: Session = Depends(get_db)):
     feelings = db.query(models.Feeling).all()
-    return feelings
+    return [f.to_scheme() for f in feelings]
 
-@app.get("/getFeelings")
+@app.get("/getFeelings", response_model=List[Feeling])
 def get_feelings(startTime: str = Query(...), endTime: str = Query(...), db: Session = Depends(get_db)):
-    feelings = db.query(models.Feeling).filter(
-        models.Feeling.datetime >= startTime,
-        models.Feeling.datetime < endTime
-    ).all()
-    return feelings
+    feelings = feelings_in_range(db, *parse_range(startTime, endTime))
+    return [f.to_scheme() for f in feelings]
+
+@app.get("/getFeelingStats")
+def get_feeling_stats(
+    startTime: str = Query(...),
+    endTime: str = Query(...),
+    granularity: Granularity = "day",
+    owner_id: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    """
+    Score statistics and emotion histograms per day or week (Monday first), served from the rollups.
+
+    Buckets are whole local days, so the range is widened to the days
+    (weeks) containing startTime and endTime.
+    """
+    start = parse_timestamp(startTime).astimezone(APP_TIMEZONE).date()
+    end = parse_timestamp(endTime).astimezone(APP_TIMEZONE).date()
+    return feeling_stats(db, owner_id or models.DEFAULT_OWNER_ID, start, end, granularity)
+
+def load_range(db: Session, startTime: str, endTime: str):
+    start, end = parse_range(startTime, endTime)
+    events = events_in_range(db, start, end) + calendar_events_in_range(db, models.DEFAULT_OWNER_ID, start, end)
+    feelings = feelings_in_range(db, start, end)
+    events_data = [e.to_scheme().model_dump() for e in sorted(events, key=lambda e: e.startTime)]
+    feelings_data = [f.to_scheme().model_dump() for f in feelings]
+    return events_data, feelings_data
+
+def load_window_data(startTime: str, endTime: str):
+    with SessionLocal() as db:
+        return load_range(db, startTime, endTime)
+
+async def load_window(startTime: str, endTime: str):
+    return await run_in_threadpool(load_window_data, startTime, endTime)
+
+# Fills the generation cache for today and this week off-peak; this app serves no audio
+precompute_scheduler = PrecomputeScheduler(load_window)
 
 @app.get("/getAdvice")
-def get_advice(startTime: str = Query(...), endTime: str = Query(...), db: Session = Depends(get_db)):
-    events = db.query(models.Event).filter(
-        models.Event.startTime >= startTime,
-        models.Event.startTime < endTime
-    ).all()
-    feelings = db.query(models.Feeling).filter(
-        models.Feeling.datetime >= startTime,
-        models.Feeling.datetime < endTime
-    ).all()
+async def get_advice(startTime: str = Query(...), endTime: str = Query(...), db: Session = Depends(get_db)):
+    # The sync session must not block the event loop
+    events_data, feelings_data = await run_in_threadpool(load_range, db, startTime, endTime)
     
-    if not events and not feelings:
+    if not events_data and not feelings_data:
         return "No data for this period. Try to log more events and feelings!"
     
-    events_data = [{
-        "date": e.date,
-        "startTime": e.startTime,
-        "endTime": e.endTime,
-        "description": e.description,
-        "tags": e.tags.split(",") if e.tags else [],
-        "name": e.name
-    } for e in events]
-    
-    feelings_data = [{
-        "feelings": f.feelings.split(",") if f.feelings else [],
-        "score": f.score,
-        "datetime": f.datetime.isoformat()
-    } for f in feelings]
-    
-    response = mistral_client.chat(
-        model="mistral-tiny",
-        messages=[{
-            "role": "system",
-            "content": "You are a helpful journaling assistant. Analyze the user's events and feelings, and provide personalized advice and insights."
-        }, {
-            "role": "user",
-            "content": f"Here are my events: {events_data}\nAnd my feelings: {feelings_data}\nPlease provide some advice and insights."
-        }]
-    )
-    return response.choices[0].message.content
+    return await generate_advice(events_data, feelings_data)
 
 @app.post("/lifeChat")
-def life_chat(chat: dict):
-    content, created_events, created_feelings = lifeChat([{
-        "role": "user",
-        "content": chat["chat"]
-    }])
+async def life_chat(chat: dict):
+    # Clients continue the chat by sending back the session id of the response
+    session_id = chat.get("session_id") or new_session_id()
+    content, created_events, created_feelings = await extract_event_and_feeling(chat["chat"], calendar_sync.tool_handlers(), session_id)
     
     response = {
         "response": content,
         "created_events": created_events,
-        "feeling": created_feelings
+        "feeling": created_feelings,
+        "session_id": session_id,
     }
     return response
 
+@app.post("/lifeChat/stream")
+async def life_chat_stream(chat: dict):
+    session_id = chat.get("session_id") or new_session_id()
+    return sse_response(extract_event_and_feeling_stream(chat["chat"], calendar_sync.tool_handlers(), session_id))
+
 @app.get("/getMotivationalSpeech")
-def get_motivational_speech(startTime: str = Query(...), endTime: str = Query(...), db: Session = Depends(get_db)):
-    events = db.query(models.Event).filter(
-        models.Event.startTime >= startTime,
-        models.Event.startTime < endTime
-    ).all()
-    feelings = db.query(models.Feeling).filter(
-        models.Feeling.datetime >= startTime,
-        models.Feeling.datetime < endTime
-    ).all()
+async def get_motivational_speech(startTime: str = Query(...), endTime: str = Query(...), db: Session = Depends(get_db)):
+    events_data, feelings_data = await run_in_threadpool(load_range, db, startTime, endTime)
     
-    if not events and not feelings:
+    if not events_data and not feelings_data:
         return "No data for this period. Try to log more events and feelings!"
     
-    events_data = [{
-        "date": e.date,
-        "startTime": e.startTime,
-        "endTime": e.endTime,
-        "description": e.description,
-        "tags": e.tags.split(",") if e.tags else [],
-        "name": e.name
-    } for e in events]
-    
-    feelings_data = [{
-        "feelings": f.feelings.split(",") if f.feelings else [],
-        "score": f.score,
-        "datetime": f.datetime.isoformat()
-    } for f in feelings]
-    
-    response = mistral_client.chat(
-        model="mistral-tiny",
-        messages=[{
-            "role": "system",
-            "content": "You are a motivational speaker. Create a short, inspiring speech based on the user's events and feelings."
-        }, {
-            "role": "user",
-            "content": f"Here are my events: {events_data}\nAnd my feelings: {feelings_data}\nPlease create a motivational speech."
-        }]
-    )
-    return response.choices[0].message.content
+    return await generate_motivation(events_data, feelings_data)
 
 if __name__ == "__main__":
     uvicorn.run("main:app", host="127.0.0.1", port=8000, reload=True)
@@ -1,25 +1,143 @@
-from sqlalchemy import Column, Integer, String, DateTime, Date, Table
+from sqlalchemy import Boolean, Column, Integer, String, DateTime, Date, Table, Text
+import os
 from sqlalchemy.orm import relationship
-from backend.database_integration.database import Base
+from database_integration.database import Base
 import datetime
 
+from schemes import APP_TIMEZONE, Event as EventScheme, Feeling as FeelingScheme
+
+
+# The app serves a single calendar account; rows without an explicit owner belong to it
+DEFAULT_OWNER_ID = os.getenv("LINKED_ACCOUNT_OWNER_ID", "")
+
+
+# Timestamps are stored as naive UTC; schemes carry them as aware UTC datetimes
+def to_storage(value: datetime.datetime) -> datetime.datetime:
+    return value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+
+def from_storage(value: datetime.datetime) -> datetime.datetime:
+    return value.replace(tzinfo=datetime.timezone.utc)
+
+
+def event_row(event: EventScheme) -> dict:
+    """Column values for inserting an event scheme."""
+    return {
+        "date": datetime.date.fromisoformat(event.date),
+        "startTime": to_storage(event.startTime),
+        "endTime": to_storage(event.endTime),
+        "description": event.description,
+        "tags": ",".join(event.tags),
+        "name": event.name,
+    }
+
+
+def feeling_row(feeling: FeelingScheme, owner_id: str = DEFAULT_OWNER_ID) -> dict:
+    """Column values for inserting a feeling scheme."""
+    return {
+        "owner_id": owner_id,
+        "feelings": ",".join(feeling.feelings),
+        "score": feeling.score,
+        "datetime": to_storage(feeling.datetime),
+    }
+
 class Event(Base):
     __tablename__ = "events"
 
     id = Column(Integer, primary_key=True, index=True)
     date = Column(Date, default=datetime.date.today)
-    startTime = Column(DateTime)
+    startTime = Column(DateTime, index=True)
     endTime = Column(DateTime)
     description = Column(String)
     tags = Column(String)  
+    name = Column(String)
+
+    def to_scheme(self) -> EventScheme:
+        return EventScheme(
+            date=str(self.date),
+            startTime=from_storage(self.startTime),
+            endTime=from_storage(self.endTime),
+            description=self.description or "",
+            tags=self.tags.split(",") if self.tags else [],
+            name=self.name or "",
+        )
 
 class Feeling(Base):
     __tablename__ = "feelings"
 
     id = Column(Integer, primary_key=True, index=True)
+    owner_id = Column(String, default=DEFAULT_OWNER_ID)
     feelings = Column(String)  
     score = Column(Integer)
-    datetime = Column(DateTime, default=datetime.datetime.now)
+    datetime = Column(DateTime, default=lambda: to_storage(datetime.datetime.now(datetime.timezone.utc)), index=True)
+
+    def to_scheme(self) -> FeelingScheme:
+        return FeelingScheme(
+            feelings=self.feelings.split(",") if self.feelings else [],
+            score=self.score,
+            datetime=from_storage(self.datetime),
+        )
+
+
+class FeelingRollup(Base):
+    """Score aggregates of one owner's feelings per local day or week (bucket = first day)."""
+    __tablename__ = "feeling_rollups"
+
+    owner_id = Column(String, primary_key=True)
+    period = Column(String, primary_key=True)
+    bucket = Column(Date, primary_key=True)
+    count = Column(Integer, nullable=False)
+    score_sum = Column(Integer, nullable=False)
+    score_min = Column(Integer, nullable=False)
+    score_max = Column(Integer, nullable=False)
+
+
+class FeelingEmotionCount(Base):
+    """How often each emotion was logged per rollup bucket."""
+    __tablename__ = "feeling_emotion_counts"
+
+    owner_id = Column(String, primary_key=True)
+    period = Column(String, primary_key=True)
+    bucket = Column(Date, primary_key=True)
+    emotion = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False)
+
+
+class CalendarEvent(Base):
+    """Local mirror of a Google Calendar event, kept current by the calendar sync."""
+    __tablename__ = "calendar_events"
+
+    owner_id = Column(String, primary_key=True)
+    calendar_id = Column(String, primary_key=True)
+    google_id = Column(String, primary_key=True)
+    summary = Column(String)
+    startTime = Column(DateTime, index=True)
+    endTime = Column(DateTime)
+    all_day = Column(Boolean, default=False)
+    updated = Column(DateTime)
+    # The event resource as returned by Google, served to the LLM in place of a live list call
+    raw = Column(Text)
+
+    def to_scheme(self) -> EventScheme:
+        start_time = from_storage(self.startTime)
+        return EventScheme(
+            date=start_time.astimezone(APP_TIMEZONE).strftime("%Y-%m-%d"),
+            startTime=start_time,
+            endTime=from_storage(self.endTime),
+            description=self.summary or "",
+            tags=["calendar"],
+            name=self.summary or "",
+        )
+
+
+class CalendarSyncState(Base):
+    """Where the incremental sync of one calendar left off."""
+    __tablename__ = "calendar_sync_state"
+
+    owner_id = Column(String, primary_key=True)
+    calendar_id = Column(String, primary_key=True)
+    sync_token = Column(String)
+    synced_at = Column(DateTime)
 
 
 class User(Base):
@@ -0,0 +1,98 @@
+from datetime import datetime
+from typing import Dict, List
+
+from sqlalchemy import bindparam, func, insert, inspect, select, text, update
+from sqlalchemy.orm import Session
+
+from database_integration import models
+from database_integration.database import Base
+from database_integration.rollups import rebuild_feeling_rollups, update_feeling_rollups
+from schemes import parse_timestamp
+
+# Built once at import; SQLAlchemy reuses the compiled SQL and sqlite3 the prepared statement
+EVENTS_IN_RANGE = (
+    select(models.Event)
+    .where(models.Event.startTime >= bindparam("start"), models.Event.startTime < bindparam("end"))
+    .order_by(models.Event.startTime)
+)
+FEELINGS_IN_RANGE = (
+    select(models.Feeling)
+    .where(models.Feeling.datetime >= bindparam("start"), models.Feeling.datetime < bindparam("end"))
+    .order_by(models.Feeling.datetime)
+)
+
+
+def events_in_range(db: Session, start: datetime, end: datetime) -> List[models.Event]:
+    """Events with start <= startTime < end; bounds are naive UTC as stored."""
+    return db.scalars(EVENTS_IN_RANGE, {"start": start, "end": end}).all()
+
+
+def feelings_in_range(db: Session, start: datetime, end: datetime) -> List[models.Feeling]:
+    """Feelings with start <= datetime < end; bounds are naive UTC as stored."""
+    return db.scalars(FEELINGS_IN_RANGE, {"start": start, "end": end}).all()
+
+
+def insert_events(db: Session, rows: List[Dict]) -> None:
+    """Insert event rows as one executemany; the caller commits."""
+    if rows:
+        db.execute(insert(models.Event), rows)
+
+
+def insert_feelings(db: Session, rows: List[Dict]) -> None:
+    """Insert feeling rows as one executemany and update the rollups; the caller commits."""
+    if rows:
+        db.execute(insert(models.Feeling), rows)
+        update_feeling_rollups(db, rows)
+
+
+# Timestamp columns that held naive APP_TIMEZONE wall-clock times before they were stored as UTC
+LOCAL_TIME_COLUMNS = {"events": ("startTime", "endTime"), "feelings": ("datetime",)}
+
+
+def convert_local_times(connection, table_names) -> None:
+    """Rewrite naive local timestamps of an original-schema database as naive UTC."""
+    for table_name, column_names in LOCAL_TIME_COLUMNS.items():
+        if table_name not in table_names:
+            continue
+        table = Base.metadata.tables[table_name]
+        columns = [table.c[name] for name in column_names]
+        rows = connection.execute(select(table.c.id, *columns)).all()
+        updates = [
+            {"row_id": row.id, **{f"new_{name}": models.to_storage(parse_timestamp(value)) if value else None
+                                  for name, value in zip(column_names, row[1:])}}
+            for row in rows
+        ]
+        if updates:
+            statement = (
+                update(table)
+                .where(table.c.id == bindparam("row_id"))
+                .values({name: bindparam(f"new_{name}") for name in column_names})
+            )
+            connection.execute(statement, updates)
+
+
+def init_db(engine) -> None:
+    """Create missing tables, columns and indexes, and backfill rollups for older databases."""
+    table_names = inspect(engine).get_table_names()
+    if "events" in table_names:
+        columns = {column["name"] for column in inspect(engine).get_columns("events")}
+        if "name" not in columns:
+            # The original schema: no event names, and times as local wall-clock times
+            with engine.begin() as connection:
+                connection.execute(text("ALTER TABLE events ADD COLUMN name VARCHAR"))
+                convert_local_times(connection, table_names)
+    if "feelings" in table_names:
+        columns = {column["name"] for column in inspect(engine).get_columns("feelings")}
+        if "owner_id" not in columns:
+            with engine.begin() as connection:
+                connection.execute(text("ALTER TABLE feelings ADD COLUMN owner_id VARCHAR"))
+                connection.execute(text("UPDATE feelings SET owner_id = :owner_id"), {"owner_id": models.DEFAULT_OWNER_ID})
+    Base.metadata.create_all(bind=engine)
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    with Session(engine) as db:
+        has_feelings = db.scalar(select(func.count()).select_from(models.Feeling))
+        has_rollups = db.scalar(select(func.count()).select_from(models.FeelingRollup))
+        if has_feelings and not has_rollups:
+            rebuild_feeling_rollups(db)
@@ -0,0 +1,142 @@
+from collections import Counter, defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Literal, Tuple
+
+from sqlalchemy import bindparam, delete, func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from database_integration import models
+from schemes import APP_TIMEZONE
+
+Granularity = Literal["day", "week"]
+PERIODS: Tuple[Granularity, ...] = ("day", "week")
+
+# Merge a batch's aggregates into existing buckets in one executemany each
+_rollup_insert = sqlite_insert(models.FeelingRollup)
+UPSERT_ROLLUP = _rollup_insert.on_conflict_do_update(
+    index_elements=["owner_id", "period", "bucket"],
+    set_={
+        "count": models.FeelingRollup.count + _rollup_insert.excluded.count,
+        "score_sum": models.FeelingRollup.score_sum + _rollup_insert.excluded.score_sum,
+        "score_min": func.min(models.FeelingRollup.score_min, _rollup_insert.excluded.score_min),
+        "score_max": func.max(models.FeelingRollup.score_max, _rollup_insert.excluded.score_max),
+    },
+)
+_emotion_insert = sqlite_insert(models.FeelingEmotionCount)
+UPSERT_EMOTION_COUNT = _emotion_insert.on_conflict_do_update(
+    index_elements=["owner_id", "period", "bucket", "emotion"],
+    set_={"count": models.FeelingEmotionCount.count + _emotion_insert.excluded.count},
+)
+
+ROLLUPS_IN_RANGE = (
+    select(models.FeelingRollup)
+    .where(
+        models.FeelingRollup.owner_id == bindparam("owner_id"),
+        models.FeelingRollup.period == bindparam("period"),
+        models.FeelingRollup.bucket >= bindparam("start"),
+        models.FeelingRollup.bucket <= bindparam("end"),
+    )
+    .order_by(models.FeelingRollup.bucket)
+)
+EMOTION_COUNTS_IN_RANGE = select(models.FeelingEmotionCount).where(
+    models.FeelingEmotionCount.owner_id == bindparam("owner_id"),
+    models.FeelingEmotionCount.period == bindparam("period"),
+    models.FeelingEmotionCount.bucket >= bindparam("start"),
+    models.FeelingEmotionCount.bucket <= bindparam("end"),
+)
+
+
+def local_date(value: datetime) -> date:
+    """Calendar day in APP_TIMEZONE of a naive UTC timestamp as stored."""
+    return models.from_storage(value).astimezone(APP_TIMEZONE).date()
+
+
+def bucket_start(day: date, period: Granularity) -> date:
+    """First day of the bucket containing `day`; weeks start on Monday."""
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    return day
+
+
+def update_feeling_rollups(db: Session, rows: Iterable[Dict]) -> None:
+    """
+    Add inserted feeling rows to the rollups; the caller commits.
+
+    The batch is aggregated in memory first, so each touched bucket is
+    written once no matter how many rows fall into it.
+    """
+    rollups: Dict[Tuple[str, str, date], List[int]] = {}
+    emotions: Counter = Counter()
+    for row in rows:
+        owner_id = row.get("owner_id", models.DEFAULT_OWNER_ID)
+        day = local_date(row["datetime"])
+        score = row["score"]
+        names = {name.strip().lower() for name in (row["feelings"] or "").split(",") if name.strip()}
+        for period in PERIODS:
+            key = (owner_id, period, bucket_start(day, period))
+            aggregate = rollups.get(key)
+            if aggregate is None:
+                rollups[key] = [1, score, score, score]
+            else:
+                aggregate[0] += 1
+                aggregate[1] += score
+                aggregate[2] = min(aggregate[2], score)
+                aggregate[3] = max(aggregate[3], score)
+            for name in names:
+                emotions[key + (name,)] += 1
+    if not rollups:
+        return
+    db.execute(UPSERT_ROLLUP, [
+        {
+            "owner_id": owner_id, "period": period, "bucket": bucket,
+            "count": count, "score_sum": score_sum, "score_min": score_min, "score_max": score_max,
+        }
+        for (owner_id, period, bucket), (count, score_sum, score_min, score_max) in rollups.items()
+    ])
+    if emotions:
+        db.execute(UPSERT_EMOTION_COUNT, [
+            {"owner_id": owner_id, "period": period, "bucket": bucket, "emotion": emotion, "count": count}
+            for (owner_id, period, bucket, emotion), count in emotions.items()
+        ])
+
+
+def rebuild_feeling_rollups(db: Session, batch_size: int = 5000) -> None:
+    """Recompute all rollups from the feelings table, e.g. for rows stored before rollups existed."""
+    db.execute(delete(models.FeelingRollup))
+    db.execute(delete(models.FeelingEmotionCount))
+    columns = select(
+        models.Feeling.owner_id, models.Feeling.feelings, models.Feeling.score, models.Feeling.datetime
+    ).where(models.Feeling.score.is_not(None), models.Feeling.datetime.is_not(None))
+    for partition in db.execute(columns).mappings().partitions(batch_size):
+        update_feeling_rollups(db, partition)
+    db.commit()
+
+
+def feeling_stats(db: Session, owner_id: str, start: date, end: date, granularity: Granularity = "day") -> List[Dict]:
+    """
+    Per-bucket score statistics and emotion frequencies for start <= day <= end.
+
+    Reads only the rollup rows of the requested buckets, so the cost does
+    not depend on how many feelings were logged overall.
+    """
+    params = {
+        "owner_id": owner_id,
+        "period": granularity,
+        "start": bucket_start(start, granularity),
+        "end": end,
+    }
+    histograms: Dict[date, Dict[str, int]] = defaultdict(dict)
+    for row in db.scalars(EMOTION_COUNTS_IN_RANGE, params):
+        histograms[row.bucket][row.emotion] = row.count
+    return [
+        {
+            "bucket": rollup.bucket.isoformat(),
+            "count": rollup.count,
+            "average": rollup.score_sum / rollup.count,
+            "min": rollup.score_min,
+            "max": rollup.score_max,
+            "emotions": dict(sorted(histograms[rollup.bucket].items(), key=lambda item: -item[1])),
+        }
+        for rollup in db.scalars(ROLLUPS_IN_RANGE, params)
+    ]
@@ -1,19 +1,41 @@
-from fastapi import FastAPI, Query
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Query, Request
 from typing import List
 from datetime import datetime
 from fastapi.middleware.cors import CORSMiddleware
 from mistral import generate_advice
-from mistral import generate_motivation
-from schemes import Event, Feeling
-from voice import text_to_speech_stream
+from mistral import generate_motivation, generate_motivation_stream
+from schemes import Event, Feeling, to_epoch
+from timeindex import TimeIndex
+from voice import pipelined_speech, speech_cache_key, speech_flights, split_sentences, start_speech_stream, text_to_speech_chunks
+from audio_cache import audio_cache
 from fastapi.responses import StreamingResponse
 
-from mistral import extract_event_and_feeling
+from mistral import extract_event_and_feeling, extract_event_and_feeling_stream
+from gcal import calendar_tools
+from sse import sse_response
+from telemetry import instrument_app
+from admission import add_admission_control
+from precompute import PrecomputeScheduler
+from feeling_lexicon import FEELINGS
+from chat_sessions import new_session_id
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Tool definitions are fetched once here instead of on every /lifeChat call
+    await calendar_tools.start()
+    await precompute_scheduler.start()
+    yield
+    await precompute_scheduler.stop()
+    await calendar_tools.stop()
+
 
 app = FastAPI(
     title="LifeChat API",
     description="API for logging and analyzing life events and feelings.",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # Allow CORS for local frontend testing
@@ -24,6 +46,10 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Per-stage latency, token usage and /metrics
+instrument_app(app)
+# Rate-limited upstream calls: /lifeChat goes first, over-limit calls get 429 with Retry-After
+add_admission_control(app)
 
 
 # --- Schemas ---
@@ -99,19 +125,6 @@ ACTIVITY_DESCRIPTION = [
     "Attend a networking event to connect with new people professionally."
 ]
 
-FEELINGS = [
-    "calm",
-    "motivated",
-    "stressed",
-    "anxious",
-    "happy",
-    "sad",
-    "angry",
-    "relaxed",
-    "excited",
-    "tired",
-]
-
 START_DATE = datetime(2025, 6, 1)
 END_DATE = datetime(2025, 7, 1)
 
@@ -128,8 +141,8 @@ def generate_dummy_events():
     events.append(
         Event(
             date=day.strftime("%Y-%m-%d"),
-            startTime=datetime(2025, 6, 16, 9, 0).isoformat(),
-            endTime=datetime(2025, 6, 16, 11, 0).isoformat(),
+            startTime=datetime(2025, 6, 16, 9, 0),
+            endTime=datetime(2025, 6, 16, 11, 0),
             description="Hands-on session to prototype and build initial solutions.",
             tags=["work", "development"],
             name="Prototyping"
@@ -138,8 +151,8 @@ def generate_dummy_events():
     events.append(
         Event(
             date=day.strftime("%Y-%m-%d"),
-            startTime=datetime(2025, 6, 15, 13, 0).isoformat(),
-            endTime=datetime(2025, 6, 15, 14, 30).isoformat(),
+            startTime=datetime(2025, 6, 15, 13, 0),
+            endTime=datetime(2025, 6, 15, 14, 30),
             description="Prepare and rehearse the pitch for the hackathon presentation.",
             tags=["work", "presentation"],
             name="Prepare for pitching"
@@ -148,8 +161,8 @@ def generate_dummy_events():
     events.append(
         Event(
             date=day.strftime("%Y-%m-%d"),
-            startTime=datetime(2025, 6, 15, 17, 0).isoformat(),
-            endTime=datetime(2025, 6, 15, 18, 0).isoformat(),
+            startTime=datetime(2025, 6, 15, 17, 0),
+            endTime=datetime(2025, 6, 15, 18, 0),
             description="Final pitch presentations to judges and audience.",
             tags=["work", "presentation"],
             name="Pitches Final"
@@ -170,7 +183,7 @@ def generate_dummy_feelings():
                 Feeling(
                     feelings=[FEELINGS[(i + j) % len(FEELINGS)]],
                     score=5 + ((i + j) % 6),
-                    datetime=dt.isoformat(),
+                    datetime=dt,
                 )
             )
     return feelings
@@ -180,89 +193,152 @@ DUMMY_EVENTS = generate_dummy_events()
 print(DUMMY_EVENTS)
 DUMMY_FEELINGS = generate_dummy_feelings()
 
+# Sorted by pre-parsed timestamps so range queries don't re-parse every record
+EVENT_INDEX = TimeIndex(lambda e: e.start_epoch, DUMMY_EVENTS)
+FEELING_INDEX = TimeIndex(lambda f: f.epoch, DUMMY_FEELINGS)
+
+
+def events_in_range(start: float, end: float) -> List[Event]:
+    return EVENT_INDEX.range(start, end)
+
+
+def feelings_in_range(start: float, end: float) -> List[Feeling]:
+    return FEELING_INDEX.range(start, end)
+
+
+def window_data(startTime: str, endTime: str):
+    """Events and feelings of a window as passed to the generators (and hashed into their cache keys)."""
+    start = to_epoch(startTime)
+    end = to_epoch(endTime)
+    events = [e.model_dump() for e in events_in_range(start, end)]
+    feelings = [f.model_dump() for f in feelings_in_range(start, end)]
+    return events, feelings
+
+
+async def load_window(startTime: str, endTime: str):
+    return window_data(startTime, endTime)
+
+
+def synthesize_cached(text: str):
+    """Audio chunks for `text`, written to the audio cache and shared with concurrent requests for it."""
+    audio_key = speech_cache_key(text)
+    return speech_flights.stream(audio_key, lambda: audio_cache.tee(audio_key, text_to_speech_chunks(text)))
+
+
+async def cache_speech(text: str) -> bool:
+    """Synthesize `text` into the audio cache unless it is there already; True if it was synthesized."""
+    if audio_cache.lookup(speech_cache_key(text)) is not None:
+        return False
+    async for _ in synthesize_cached(text):
+        pass
+    return True
+
+
+# Fills the caches for today and this week off-peak, so the first morning request is served from them
+precompute_scheduler = PrecomputeScheduler(load_window, cache_speech)
+
 
 # --- Endpoints ---
 @app.post("/lifeChat")
-def submit_life_chat(chat: dict):
-    response, events, feelings = extract_event_and_feeling(chat['chat'])
+async def submit_life_chat(chat: dict):
+    # Clients continue the chat by sending back the session id of the response
+    session_id = chat.get('session_id') or new_session_id()
+    response, events, feelings = await extract_event_and_feeling(chat['chat'], session_id=session_id)
+    EVENT_INDEX.extend(events)
+    FEELING_INDEX.extend(Feeling(**f) for f in feelings)
     return {
         "response": response,
         "created_events": events,
-        "feeling": feelings
+        "feeling": feelings,
+        "session_id": session_id,
     }
 
 
+@app.post("/lifeChat/stream")
+async def submit_life_chat_stream(chat: dict):
+    session_id = chat.get('session_id') or new_session_id()
+
+    async def frames():
+        async for kind, data in extract_event_and_feeling_stream(chat['chat'], session_id=session_id):
+            if kind == "event":
+                EVENT_INDEX.add(data)
+            elif kind == "feeling":
+                FEELING_INDEX.add(Feeling(**data))
+            yield kind, data
+
+    return sse_response(frames())
+
+
 @app.get("/getEvents", response_model=List[Event])
 def get_events(startTime: str = Query(...), endTime: str = Query(...)):
-    start = datetime.fromisoformat(startTime)
-    end = datetime.fromisoformat(endTime)
-    return [
-        e.model_dump() for e in DUMMY_EVENTS if start <= datetime.fromisoformat(e.startTime) < end
-    ]
+    start = to_epoch(startTime)
+    end = to_epoch(endTime)
+    return events_in_range(start, end)
 
 
 @app.get("/getFeelings", response_model=List[Feeling])
 def get_feelings(startTime: str = Query(...), endTime: str = Query(...)):
-    start = datetime.fromisoformat(startTime)
-    end = datetime.fromisoformat(endTime)
-    return [
-        f for f in DUMMY_FEELINGS if start <= datetime.fromisoformat(f.datetime) < end
-    ]
+    start = to_epoch(startTime)
+    end = to_epoch(endTime)
+    return feelings_in_range(start, end)
 
 
 @app.get("/getAdvice", response_model=str)
-def get_advice(startTime: str = Query(...), endTime: str = Query(...)):
-    start = datetime.fromisoformat(startTime)
-    end = datetime.fromisoformat(endTime)
-
-    # Filtere die Dummy Events
-    events = [
-        e.model_dump() for e in DUMMY_EVENTS if start <= datetime.fromisoformat(e.startTime) < end
-    ]
-
-    # Filtere die Dummy Feelings
-    feelings = [
-        f.model_dump() for f in DUMMY_FEELINGS if start <= datetime.fromisoformat(f.datetime) < end
-    ]
+async def get_advice(startTime: str = Query(...), endTime: str = Query(...)):
+    # Filtere die Dummy Events und Feelings
+    events, feelings = window_data(startTime, endTime)
 
     # Falls keine Daten vorhanden, gib kurze Message zurück
     if not events and not feelings:
         return "No data for this period. Try to log more events and feelings!"
 
     # Generiere das AI-basierte Advice mit Mistral
-    advice = generate_advice(events, feelings)
+    advice = await generate_advice(events, feelings)
 
     return advice
 
 
 @app.get("/getMotivationalSpeech")
-def get_motivational_speech(startTime: str = Query(...), endTime: str = Query(...)):
-    start = datetime.fromisoformat(startTime)
-    end = datetime.fromisoformat(endTime)
-
+async def get_motivational_speech(
+    request: Request,
+    startTime: str = Query(...),
+    endTime: str = Query(...),
+    pipelined: bool = Query(False, description="Synthesize sentence by sentence while the text is generated"),
+):
     # Filter events and feelings
-    events = [
-        e.model_dump() for e in DUMMY_EVENTS if start <= datetime.fromisoformat(e.startTime) < end
-    ]
-    feelings = [
-        f.model_dump() for f in DUMMY_FEELINGS if start <= datetime.fromisoformat(f.datetime) < end
-    ]
-
-    # If no data, return a default motivational message
-    if not events and not feelings:
-        text = "No data for this period. Keep going and log more events and feelings to get personalized motivation!"
-    else:
-        # Generate advice using Mistral
-        text = generate_motivation(events, feelings)
+    events, feelings = window_data(startTime, endTime)
+
+    headers = {"Content-Disposition": "attachment; filename=motivational_speech.mp3"}
 
-    # Convert text to speech
-    audio_stream = text_to_speech_stream(text)
+    if (events or feelings) and pipelined:
+        # Overlap Mistral generation with ElevenLabs synthesis per sentence.
+        # The text is only known at the end, so this path bypasses the audio cache.
+        chunks = pipelined_speech(split_sentences(generate_motivation_stream(events, feelings)))
+    else:
+        # If no data, return a default motivational message
+        if not events and not feelings:
+            text = "No data for this period. Keep going and log more events and feelings to get personalized motivation!"
+        else:
+            # Generate advice using Mistral
+            text = await generate_motivation(events, feelings)
+
+        # Serve previously synthesized audio from disk, with Range/ETag support
+        audio_key = speech_cache_key(text)
+        cached = audio_cache.lookup(audio_key)
+        if cached:
+            path, etag = cached
+            return audio_cache.response(request, path, etag, headers)
+        # Requests arriving while the same audio is being synthesized get the same stream
+        chunks = synthesize_cached(text)
+
+    # Forward audio chunks as they are synthesized
+    audio_stream = await start_speech_stream(chunks)
 
     # Return the audio stream
     return StreamingResponse(
         audio_stream,
         media_type="audio/mpeg",
-        headers={"Content-Disposition": "attachment; filename=motivational_speech.mp3"}
+        headers=headers
     )
 
 if __name__ == "__main__":
@@ -0,0 +1,96 @@
+import re
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from schemes import Feeling
+
+# The feelings the app tracks; every lexicon entry maps onto one of them
+FEELINGS = [
+    "calm",
+    "motivated",
+    "stressed",
+    "anxious",
+    "happy",
+    "sad",
+    "angry",
+    "relaxed",
+    "excited",
+    "tired",
+]
+
+# Surface form -> (feeling, intensity 1-10 when stated plainly)
+FEELING_LEXICON: Dict[str, Tuple[str, int]] = {
+    **{feeling: (feeling, 6) for feeling in FEELINGS},
+    "peaceful": ("calm", 6), "serene": ("calm", 7), "at peace": ("calm", 7), "centered": ("calm", 5),
+    "driven": ("motivated", 6), "inspired": ("motivated", 7), "energized": ("motivated", 7),
+    "determined": ("motivated", 7), "productive": ("motivated", 5), "focused": ("motivated", 5),
+    "stress": ("stressed", 6), "pressured": ("stressed", 6), "under pressure": ("stressed", 6),
+    "overwhelmed": ("stressed", 8), "swamped": ("stressed", 7), "burned out": ("stressed", 9), "burnt out": ("stressed", 9),
+    "anxiety": ("anxious", 6), "nervous": ("anxious", 5), "worried": ("anxious", 5), "uneasy": ("anxious", 4),
+    "scared": ("anxious", 7), "afraid": ("anxious", 7), "panicking": ("anxious", 9), "panic": ("anxious", 9),
+    "glad": ("happy", 5), "joyful": ("happy", 7), "cheerful": ("happy", 6), "amazing": ("happy", 8), "wonderful": ("happy", 8),
+    "grateful": ("happy", 6), "proud": ("happy", 7), "delighted": ("happy", 8), "ecstatic": ("happy", 10),
+    "unhappy": ("sad", 6), "depressed": ("sad", 8), "lonely": ("sad", 6),
+    "miserable": ("sad", 8), "heartbroken": ("sad", 9), "disappointed": ("sad", 5), "upset": ("sad", 6),
+    "mad": ("angry", 6), "furious": ("angry", 9), "annoyed": ("angry", 4), "frustrated": ("angry", 5),
+    "irritated": ("angry", 4), "pissed": ("angry", 7), "livid": ("angry", 9),
+    "chill": ("relaxed", 5), "rested": ("relaxed", 5), "at ease": ("relaxed", 6), "refreshed": ("relaxed", 6),
+    "thrilled": ("excited", 8), "pumped": ("excited", 7), "eager": ("excited", 5), "hyped": ("excited", 7),
+    "looking forward": ("excited", 5), "can't wait": ("excited", 7),
+    "exhausted": ("tired", 8), "sleepy": ("tired", 5), "drained": ("tired", 7), "worn out": ("tired", 7),
+    "fatigued": ("tired", 6), "knackered": ("tired", 8),
+}
+INTENSIFIERS = {"very": 2, "so": 2, "really": 2, "extremely": 3, "super": 2, "incredibly": 3, "totally": 2, "completely": 2, "quite": 1, "pretty": 1}
+DIMINISHERS = {"slightly": -2, "somewhat": -2, "little": -2, "bit": -2, "kinda": -1, "kind": -1, "sort": -1, "barely": -3}
+NEGATORS = {"not", "no", "never", "don't", "dont", "didn't", "didnt", "isn't", "wasn't", "aren't", "ain't", "hardly", "without", "nor"}
+
+# One alternation over the whole lexicon, longest forms first so "burned out" wins over shorter overlaps
+LEXICON_PATTERN = re.compile(
+    r"\b(" + "|".join(re.escape(form) for form in sorted(FEELING_LEXICON, key=len, reverse=True)) + r")\b",
+    re.IGNORECASE,
+)
+WORD = re.compile(r"[\w']+")
+# Negation and modifiers only reach back to the start of the clause
+CLAUSE_BOUNDARY = re.compile(r"[.,;:!?]|\bbut\b|\band\b", re.IGNORECASE)
+MODIFIER_WINDOW = 3
+
+
+def _clause_prefix(text: str, start: int) -> List[str]:
+    prefix = text[max(0, start - 60):start]
+    boundaries = list(CLAUSE_BOUNDARY.finditer(prefix))
+    if boundaries:
+        prefix = prefix[boundaries[-1].end():]
+    return [word.lower() for word in WORD.findall(prefix)][-MODIFIER_WINDOW:]
+
+
+def score_feelings(text: str) -> List[Tuple[str, int]]:
+    """(feeling, intensity) for every non-negated lexicon match, in order of appearance."""
+    matches = []
+    for match in LEXICON_PATTERN.finditer(text):
+        before = _clause_prefix(text, match.start())
+        if any(word in NEGATORS for word in before):
+            continue
+        feeling, intensity = FEELING_LEXICON[match.group(1).lower()]
+        intensity += sum(INTENSIFIERS.get(word, 0) + DIMINISHERS.get(word, 0) for word in before)
+        if text[match.end():match.end() + 1] == "!":
+            intensity += 1
+        matches.append((feeling, max(1, min(10, intensity))))
+    return matches
+
+
+def extract_feeling(text: str, now: Optional[datetime] = None) -> Optional[Feeling]:
+    """
+    Feeling expressed in a chat message, found without a model call.
+
+    The feelings are listed in order of first mention; the score is the
+    strongest intensity among them. Returns None if no feeling was found.
+    """
+    matches = score_feelings(text)
+    if not matches:
+        return None
+    feelings = list(dict.fromkeys(feeling for feeling, _ in matches))
+    return Feeling(
+        feelings=feelings,
+        score=max(intensity for _, intensity in matches),
+        datetime=now or datetime.now(timezone.utc),
+    )
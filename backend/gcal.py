@@ -5,13 +5,22 @@ import json
 import os
 from typing import Any, Dict
 
+import httpx
 from aci import ACI
-from aci.types.functions import FunctionDefinitionFormat
+from aci.resource.app_configurations import AppConfigurationsResource
+from aci.resource.apps import AppsResource
+from aci.resource.functions import FunctionsResource
+from aci.resource.linked_accounts import LinkedAccountsResource
+from aci.types.functions import FunctionDefinitionFormat, FunctionExecutionResult
 from dotenv import load_dotenv
 from mistralai import Mistral
 from rich import print as rprint
 from rich.panel import Panel
 
+from http_transport import PROVIDER_POLICIES, async_client, sync_client
+from telemetry import span
+from tool_registry import ToolRegistry
+
 load_dotenv()
 LINKED_ACCOUNT_OWNER_ID = os.getenv("LINKED_ACCOUNT_OWNER_ID", "")
 if not LINKED_ACCOUNT_OWNER_ID:
@@ -19,9 +28,152 @@ if not LINKED_ACCOUNT_OWNER_ID:
 
 
 # gets MISTRAL_API_KEY from your environment variables
-mistral = Mistral(api_key=os.getenv("MISTRAL_API_KEY"))
-# gets ACI_API_KEY from your environment variables
+mistral = Mistral(
+    api_key=os.getenv("MISTRAL_API_KEY"),
+    server_url=os.getenv("MISTRAL_SERVER_URL") or None,
+    client=sync_client("mistral"),
+    async_client=async_client("mistral"),
+    timeout_ms=int(PROVIDER_POLICIES["mistral"].timeout * 1000),
+)
+# gets ACI_API_KEY (and ACI_SERVER_URL, if set) from your environment variables
 aci = ACI()
+# The SDK takes no client of ours; its default one is swapped for one on the shared transport.
+# Its resource methods add a tenacity retry on top, so the helpers below call the client directly.
+aci.httpx_client.close()
+aci.httpx_client = sync_client("aci", base_url=aci.base_url, headers=aci.headers)
+aci.apps = AppsResource(aci.httpx_client)
+aci.functions = FunctionsResource(aci.httpx_client)
+aci.app_configurations = AppConfigurationsResource(aci.httpx_client)
+aci.linked_accounts = LinkedAccountsResource(aci.httpx_client)
+# The ACI SDK is sync-only; the async client reuses its base URL and auth headers on the shared transport
+aci_async_client = async_client("aci", base_url=aci.base_url, headers=aci.headers)
+# Reads that may be retried after a 5xx and hedged; writes are only retried when they were rejected (429)
+IDEMPOTENT_FUNCTIONS = {"GOOGLE_CALENDAR__EVENTS_LIST"}
+
+
+def aci_response_data(response: httpx.Response) -> Any:
+    """
+    Parsed body of an ACI API response.
+
+    Raises:
+        httpx.HTTPStatusError: For error statuses, with ACI's error body in the message
+    """
+    if response.is_error:
+        raise httpx.HTTPStatusError(
+            f"ACI answered {response.status_code}: {response.text}", request=response.request, response=response
+        )
+    return response.json() if response.content else {}
+
+
+def get_definition(
+    function_name: str, format: FunctionDefinitionFormat = FunctionDefinitionFormat.OPENAI
+) -> Dict[str, Any]:
+    """
+    Definition of an ACI function, fetched without the SDK's retries.
+
+    Args:
+        function_name (str): Name of the ACI function
+        format (FunctionDefinitionFormat): Format of the returned definition
+
+    Returns:
+        Dict[str, Any]: Function definition usable as a tool
+    """
+    with span("aci.definition"):
+        response = aci.httpx_client.get(
+            f"functions/{function_name}/definition", params={"format": format.value}
+        )
+    return aci_response_data(response)
+
+
+async def get_definition_async(
+    function_name: str, format: FunctionDefinitionFormat = FunctionDefinitionFormat.OPENAI
+) -> Dict[str, Any]:
+    """
+    Async counterpart of get_definition.
+
+    Args:
+        function_name (str): Name of the ACI function
+        format (FunctionDefinitionFormat): Format of the returned definition
+
+    Returns:
+        Dict[str, Any]: Function definition usable as a tool
+    """
+    with span("aci.definition"):
+        response = await aci_async_client.get(
+            f"functions/{function_name}/definition", params={"format": format.value}
+        )
+    return aci_response_data(response)
+
+
+CALENDAR_FUNCTIONS = ["GOOGLE_CALENDAR__EVENTS_INSERT", "GOOGLE_CALENDAR__EVENTS_LIST"]
+# Warmed by the apps' lifespan; optionally persisted for cold starts
+calendar_tools = ToolRegistry(
+    get_definition_async,
+    CALENDAR_FUNCTIONS,
+    cache_path=os.getenv("TOOL_DEFINITIONS_CACHE") or None,
+)
+
+
+def execute_function(
+    function_name: str,
+    function_arguments: Dict[str, Any],
+    linked_account_owner_id: str = LINKED_ACCOUNT_OWNER_ID,
+) -> Dict[str, Any]:
+    """
+    Execute a directly indexed ACI function.
+
+    Replaces aci.functions.execute, whose tenacity retry would repeat
+    calendar writes after a 5xx or timeout; only the shared transport
+    retries, and only what IDEMPOTENT_FUNCTIONS allows.
+
+    Args:
+        function_name (str): Name of the ACI function to execute
+        function_arguments (Dict[str, Any]): Arguments produced by the tool call
+        linked_account_owner_id (str): Owner whose linked account is used
+
+    Returns:
+        Dict[str, Any]: Serialized FunctionExecutionResult
+    """
+    with span(f"aci.{function_name}"):
+        response = aci.httpx_client.post(
+            f"functions/{function_name}/execute",
+            json={
+                "function_input": function_arguments,
+                "linked_account_owner_id": linked_account_owner_id,
+            },
+            extensions={"idempotent": function_name in IDEMPOTENT_FUNCTIONS},
+        )
+    result = FunctionExecutionResult.model_validate(aci_response_data(response))
+    return result.model_dump(exclude_none=True)
+
+
+async def execute_function_async(
+    function_name: str,
+    function_arguments: Dict[str, Any],
+    linked_account_owner_id: str = LINKED_ACCOUNT_OWNER_ID,
+) -> Dict[str, Any]:
+    """
+    Async counterpart of execute_function.
+
+    Args:
+        function_name (str): Name of the ACI function to execute
+        function_arguments (Dict[str, Any]): Arguments produced by the tool call
+        linked_account_owner_id (str): Owner whose linked account is used
+
+    Returns:
+        Dict[str, Any]: Serialized FunctionExecutionResult
+    """
+    with span(f"aci.{function_name}"):
+        response = await aci_async_client.post(
+            f"functions/{function_name}/execute",
+            json={
+                "function_input": function_arguments,
+                "linked_account_owner_id": linked_account_owner_id,
+            },
+            extensions={"idempotent": function_name in IDEMPOTENT_FUNCTIONS},
+        )
+    result = FunctionExecutionResult.model_validate(aci_response_data(response))
+    return result.model_dump(exclude_none=True)
 
 
 def execute_calendar_function(function_name: str, user_message: str) -> Dict[str, Any]:
@@ -35,7 +187,7 @@ def execute_calendar_function(function_name: str, user_message: str) -> Dict[str
     Returns:
         Dict[str, Any]: Result of the function execution
     """
-    function_definition = aci.functions.get_definition(function_name)
+    function_definition = calendar_tools.get(function_name) or get_definition(function_name)
 
     response = mistral.chat.complete(
         model="mistral-large-latest",
@@ -60,17 +212,43 @@ def execute_calendar_function(function_name: str, user_message: str) -> Dict[str
     )
 
     if tool_call:
-        result = aci.functions.execute(
-            tool_call.function.name,
-            json.loads(tool_call.function.arguments),
-            linked_account_owner_id=LINKED_ACCOUNT_OWNER_ID,
-        )
-        return result
+        return execute_function(tool_call.function.name, json.loads(tool_call.function.arguments))
     return {}
 
 
+def events_list_input(time_min: str, time_max: str, calendar_id: str = "primary") -> Dict[str, Any]:
+    """Function input of GOOGLE_CALENDAR__EVENTS_LIST for a time range."""
+    return {
+        "path": {"calendarId": calendar_id},
+        "query": {
+            "timeMin": time_min,
+            "timeMax": time_max,
+            "singleEvents": True,
+            "orderBy": "startTime",
+        },
+    }
+
+
+def events_insert_input(
+    summary: str,
+    start_time: str,
+    end_time: str,
+    timezone: str = "Europe/Berlin",
+    calendar_id: str = "primary",
+) -> Dict[str, Any]:
+    """Function input of GOOGLE_CALENDAR__EVENTS_INSERT for a timed event."""
+    return {
+        "path": {"calendarId": calendar_id},
+        "body": {
+            "end": {"dateTime": end_time, "timeZone": timezone},
+            "start": {"dateTime": start_time, "timeZone": timezone},
+            "summary": summary,
+        },
+    }
+
+
 def get_calendar_events(
-    time_min: str, time_max: str, email: str = "xxx"
+    time_min: str, time_max: str, email: str = "xxx", via_llm: bool = False
 ) -> Dict[str, Any]:
     """
     Get calendar events for a specific time range.
@@ -78,11 +256,15 @@ def get_calendar_events(
     Args:
         time_min (str): Start time in ISO format (e.g., "2025-06-01T00:00:00Z")
         time_max (str): End time in ISO format (e.g., "2025-06-30T23:59:59Z")
-        email (str): Email address to fetch events for
+        email (str): Email address to fetch events for (only used with via_llm)
+        via_llm (bool): Let Mistral build the tool call instead of calling ACI directly
 
     Returns:
         Dict[str, Any]: Calendar events data
     """
+    if not via_llm:
+        return execute_function("GOOGLE_CALENDAR__EVENTS_LIST", events_list_input(time_min, time_max))
+
     user_message = f"""
     get all event for user : {email}
     timeMin: {time_min},
@@ -97,6 +279,7 @@ def create_calendar_event(
     end_time: str,
     timezone: str = "Europe/Berlin",
     email: str = "xxx",
+    via_llm: bool = False,
 ) -> Dict[str, Any]:
     """
     Create a new calendar event.
@@ -106,20 +289,19 @@ def create_calendar_event(
         start_time (str): Start time in ISO format (e.g., "2025-06-15T08:00:00+02:00")
         end_time (str): End time in ISO format (e.g., "2025-06-15T09:00:00+02:00")
         timezone (str): Timezone for the event
-        email (str): Email address to create event for
+        email (str): Email address to create event for (only used with via_llm)
+        via_llm (bool): Let Mistral build the tool call instead of calling ACI directly
 
     Returns:
         Dict[str, Any]: Created event data
     """
-    event_data = {
-        "end": {"dateTime": end_time, "timeZone": timezone},
-        "start": {"dateTime": start_time, "timeZone": timezone},
-        "summary": summary,
-    }
+    function_input = events_insert_input(summary, start_time, end_time, timezone)
+    if not via_llm:
+        return execute_function("GOOGLE_CALENDAR__EVENTS_INSERT", function_input)
 
     user_message = f"""
     create event for user : {email}
-    with details: {json.dumps(event_data)}
+    with details: {json.dumps(function_input["body"])}
     """
     return execute_calendar_function("GOOGLE_CALENDAR__EVENTS_INSERT", user_message)
 
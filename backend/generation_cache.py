@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+
+def content_key(*parts: Any) -> str:
+    """Stable SHA-256 over the JSON serialization of all parts."""
+    payload = json.dumps(parts, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class GenerationCache:
+    """
+    Content-addressed cache for generated texts.
+
+    Entries live in an in-memory LRU and expire `ttl` seconds after they
+    were set, unless a later expiry is given (see `extend`). If
+    `sqlite_path` is set, they are also written to a SQLite file so they
+    survive restarts.
+
+    Args:
+        max_entries (int): Maximum number of entries kept in memory
+        ttl (float): Seconds an entry stays valid by default
+        sqlite_path (Optional[str]): SQLite file for persistence, if any
+    """
+
+    def __init__(self, max_entries: int = 512, ttl: float = 6 * 3600, sqlite_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # key -> (expires_at, value)
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if sqlite_path:
+            self._db = sqlite3.connect(sqlite_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS generations "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, expires_at REAL)"
+            )
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(generations)")}
+            if "expires_at" not in columns:
+                # Files written before per-entry expiry; their rows expire ttl after created_at
+                self._db.execute("ALTER TABLE generations ADD COLUMN expires_at REAL")
+            self._db.commit()
+
+    @staticmethod
+    def make_key(kind: str, model: str, prompt_version: str, *inputs: Any) -> str:
+        return content_key(kind, model, prompt_version, *inputs)
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None and self._db is not None:
+                row = self._db.execute(
+                    "SELECT created_at, expires_at, value FROM generations WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    entry = (row[1] if row[1] is not None else row[0] + self.ttl, row[2])
+                    self._remember(key, entry)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if now > expires_at:
+                self._forget(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, expires_at: Optional[float] = None) -> None:
+        now = time.time()
+        entry = (expires_at if expires_at is not None else now + self.ttl, value)
+        with self._lock:
+            self._remember(key, entry)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO generations (key, value, created_at, expires_at) VALUES (?, ?, ?, ?)",
+                    (key, value, now, entry[0]),
+                )
+                self._db.commit()
+
+    def extend(self, key: str, expires_at: float) -> bool:
+        """Keep a valid entry at least until `expires_at` (epoch seconds); False if there is none."""
+        value = self.get(key)
+        if value is None:
+            return False
+        with self._lock:
+            current = self._entries.get(key)
+            if current is not None and current[0] >= expires_at:
+                return True
+        self.set(key, value, expires_at)
+        return True
+
+    def _remember(self, key: str, entry: Tuple[float, str]) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _forget(self, key: str) -> None:
+        self._entries.pop(key, None)
+        if self._db is not None:
+            self._db.execute("DELETE FROM generations WHERE key = ?", (key,))
+            self._db.commit()
+
+
+generation_cache = GenerationCache(
+    max_entries=int(os.getenv("GENERATION_CACHE_SIZE", "512")),
+    ttl=float(os.getenv("GENERATION_CACHE_TTL", str(6 * 3600))),
+    sqlite_path=os.getenv("GENERATION_CACHE_DB") or None,
+)
@@ -0,0 +1,241 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import httpx
+
+from telemetry import Counter, registry
+
+try:
+    import h2  # noqa: F401
+
+    _H2_AVAILABLE = True
+except ImportError:
+    # HTTP/2 needs the optional h2 package (pip install httpx[http2])
+    _H2_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+HTTP2 = os.getenv("HTTP2", "1") != "0" and _H2_AVAILABLE
+# One pool for all providers; connections are kept per host
+HTTP_LIMITS = httpx.Limits(
+    max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", "100")),
+    max_keepalive_connections=int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20")),
+    keepalive_expiry=float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60")),
+)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+# The request never reached the server, so it is always safe to send again
+CONNECT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+UPSTREAM_RETRIES = registry.register(Counter(
+    "upstream_retries_total", "Upstream requests sent again after a failure", ("provider", "reason")
+))
+UPSTREAM_HEDGES = registry.register(Counter(
+    "upstream_hedges_total", "Hedged second requests and which request answered first", ("provider", "winner")
+))
+
+
+@dataclass(frozen=True)
+class ProviderPolicy:
+    """
+    Timeouts, retries and hedging of one upstream provider.
+
+    Args:
+        connect_timeout (float): Seconds to establish a connection
+        timeout (float): Seconds to wait for any read or write
+        max_retries (int): Additional attempts after a retryable failure
+        backoff_base (float): First backoff in seconds, doubled per attempt (full jitter)
+        backoff_max (float): Longest backoff; a longer Retry-After is not waited for
+        side_effect_free (bool): POSTs only generate content, so 5xx and read errors may be retried
+        hedge_after (Optional[float]): Seconds after which an idempotent request is sent a second time
+    """
+
+    connect_timeout: float
+    timeout: float
+    max_retries: int
+    backoff_base: float = 0.25
+    backoff_max: float = 8.0
+    side_effect_free: bool = True
+    hedge_after: Optional[float] = None
+
+    @property
+    def httpx_timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(self.timeout, connect=self.connect_timeout)
+
+
+def _policy(provider: str, timeout: float, side_effect_free: bool = True, hedge_after: str = "") -> ProviderPolicy:
+    prefix = provider.upper()
+    hedge = os.getenv(f"{prefix}_HEDGE_AFTER", hedge_after)
+    return ProviderPolicy(
+        connect_timeout=float(os.getenv(f"{prefix}_CONNECT_TIMEOUT", "5")),
+        timeout=float(os.getenv(f"{prefix}_TIMEOUT", str(timeout))),
+        max_retries=int(os.getenv(f"{prefix}_MAX_RETRIES", "2")),
+        side_effect_free=side_effect_free,
+        hedge_after=float(hedge) if hedge else None,
+    )
+
+
+PROVIDER_POLICIES = {
+    "openai": _policy("openai", 60),
+    "mistral": _policy("mistral", 30),
+    "elevenlabs": _policy("elevenlabs", 60),
+    # ACI executes calendar writes, so only requests marked idempotent are retried after a 5xx
+    "aci": _policy("aci", 20, side_effect_free=False, hedge_after="1.5"),
+}
+
+
+def is_idempotent(request: httpx.Request, policy: ProviderPolicy) -> bool:
+    """Whether the request may be sent again after it possibly reached the server."""
+    return request.method in IDEMPOTENT_METHODS or request.extensions.get("idempotent", False) or policy.side_effect_free
+
+
+def retry_reason(request: httpx.Request, policy: ProviderPolicy, response: Optional[httpx.Response], error: Optional[Exception]) -> Optional[str]:
+    if error is not None:
+        if isinstance(error, CONNECT_ERRORS):
+            return "connect"
+        if isinstance(error, httpx.TransportError) and is_idempotent(request, policy):
+            return type(error).__name__
+        return None
+    if response.status_code == 429:
+        # Rejected before any work was done
+        return "429"
+    if response.status_code in RETRY_STATUSES and is_idempotent(request, policy):
+        return str(response.status_code)
+    return None
+
+
+def retry_delay(policy: ProviderPolicy, attempt: int, response: Optional[httpx.Response]) -> Optional[float]:
+    """Backoff before the next attempt, or None if a Retry-After asks for longer than we wait."""
+    if response is not None and "retry-after" in response.headers:
+        try:
+            retry_after = float(response.headers["retry-after"])
+        except ValueError:
+            retry_after = None
+        if retry_after is not None:
+            return retry_after if retry_after <= policy.backoff_max else None
+    return random.uniform(0, min(policy.backoff_max, policy.backoff_base * 2 ** attempt))
+
+
+class RetryTransport(httpx.AsyncBaseTransport):
+    """
+    Async transport adding retries with jittered backoff and hedging on top of a shared pool.
+
+    Hedging only applies to idempotent requests (GETs, or requests sent
+    with `extensions={"idempotent": True}`) of providers with `hedge_after`:
+    if no response headers arrived by then, a second request is raced
+    against the first and the slower one is cancelled.
+    """
+
+    def __init__(self, pool: httpx.AsyncBaseTransport, provider: str, policy: ProviderPolicy):
+        self.pool = pool
+        self.provider = provider
+        self.policy = policy
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        # Bodies are sent more than once; make sure they are buffered
+        await request.aread()
+        attempt = 0
+        while True:
+            response, error = None, None
+            try:
+                response = await self._send(request)
+            except httpx.TransportError as e:
+                error = e
+            reason = retry_reason(request, self.policy, response, error) if attempt < self.policy.max_retries else None
+            delay = retry_delay(self.policy, attempt, response) if reason else None
+            if delay is None:
+                if error is not None:
+                    raise error
+                return response
+            if response is not None:
+                await response.aclose()
+            UPSTREAM_RETRIES.inc(provider=self.provider, reason=reason)
+            logger.info("Retrying %s %s after %s in %.2fs", request.method, request.url.path, reason, delay)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _send(self, request: httpx.Request) -> httpx.Response:
+        hedgeable = request.method in IDEMPOTENT_METHODS or request.extensions.get("idempotent", False)
+        if self.policy.hedge_after is None or not hedgeable:
+            return await self.pool.handle_async_request(request)
+
+        tasks = [asyncio.ensure_future(self.pool.handle_async_request(request))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.policy.hedge_after)
+            if not done:
+                tasks.append(asyncio.ensure_future(self.pool.handle_async_request(request)))
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                responses = [task for task in done if task.exception() is None]
+                if responses:
+                    for task in responses[1:]:
+                        await task.result().aclose()
+                    if len(tasks) > 1:
+                        UPSTREAM_HEDGES.inc(provider=self.provider, winner="first" if responses[0] is tasks[0] else "second")
+                    return responses[0].result()
+                error = next(iter(done)).exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def aclose(self) -> None:
+        # The pool is shared with the other providers' clients and lives as long as the process
+        pass
+
+
+class SyncRetryTransport(httpx.BaseTransport):
+    """Blocking counterpart of RetryTransport for the sync SDK clients, without hedging."""
+
+    def __init__(self, pool: httpx.BaseTransport, provider: str, policy: ProviderPolicy):
+        self.pool = pool
+        self.provider = provider
+        self.policy = policy
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        request.read()
+        attempt = 0
+        while True:
+            response, error = None, None
+            try:
+                response = self.pool.handle_request(request)
+            except httpx.TransportError as e:
+                error = e
+            reason = retry_reason(request, self.policy, response, error) if attempt < self.policy.max_retries else None
+            delay = retry_delay(self.policy, attempt, response) if reason else None
+            if delay is None:
+                if error is not None:
+                    raise error
+                return response
+            if response is not None:
+                response.close()
+            UPSTREAM_RETRIES.inc(provider=self.provider, reason=reason)
+            time.sleep(delay)
+            attempt += 1
+
+    def close(self) -> None:
+        pass
+
+
+_async_pool = httpx.AsyncHTTPTransport(http2=HTTP2, limits=HTTP_LIMITS)
+_sync_pool = httpx.HTTPTransport(http2=HTTP2, limits=HTTP_LIMITS)
+
+
+def async_client(provider: str, **kwargs) -> httpx.AsyncClient:
+    """httpx.AsyncClient for `provider` on the shared pool, with its timeouts and retry policy."""
+    policy = PROVIDER_POLICIES[provider]
+    return httpx.AsyncClient(transport=RetryTransport(_async_pool, provider, policy), timeout=policy.httpx_timeout, **kwargs)
+
+
+def sync_client(provider: str, **kwargs) -> httpx.Client:
+    policy = PROVIDER_POLICIES[provider]
+    return httpx.Client(transport=SyncRetryTransport(_sync_pool, provider, policy), timeout=policy.httpx_timeout, **kwargs)
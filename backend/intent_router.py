@@ -0,0 +1,125 @@
+import hashlib
+import logging
+import os
+import re
+from typing import NamedTuple, Tuple
+
+logger = logging.getLogger(__name__)
+
+INTENT_ROUTER_ENABLED = os.getenv("INTENT_ROUTER_ENABLED", "1") != "0"
+# Chat text is personal; only log it when explicitly asked to, e.g. while auditing the router
+INTENT_ROUTER_LOG_TEXT = os.getenv("INTENT_ROUTER_LOG_TEXT", "0") == "1"
+
+
+def _words(*words: str) -> str:
+    return r"\b(?:" + "|".join(words) + r")\b"
+
+
+# Asking about or changing the calendar outright
+SCHEDULE_QUERY = re.compile(
+    _words(
+        r"what(?:'s| is| do i have)? (?:on )?(?:my )?(?:calendar|schedule|agenda)",
+        r"what do i have", r"am i (?:free|busy|available)", r"my (?:calendar|schedule|agenda)",
+        r"when is my", r"(?:add|put|schedule|book|plan|move|reschedule|create|set up|block)\b.{0,40}\b(?:calendar|event|meeting|appointment|time|slot)",
+        r"remind me",
+    ),
+    re.IGNORECASE,
+)
+EVENT_NOUN = re.compile(
+    _words(
+        r"meetings?", r"appointments?", r"calls?", r"lunch", r"dinner", r"breakfast", r"class(?:es)?",
+        r"lectures?", r"exams?", r"interviews?", r"deadlines?", r"workouts?", r"gym", r"training",
+        r"sessions?", r"party", r"trip", r"flight", r"doctor", r"dentist", r"hackathon", r"pitch(?:es)?",
+        r"presentations?", r"date", r"event", r"standup", r"review",
+    ),
+    re.IGNORECASE,
+)
+TIME_EXPRESSION = re.compile(
+    _words(
+        r"today", r"tonight", r"tomorrow", r"yesterday", r"this (?:morning|afternoon|evening)",
+        r"(?:next|this|last) (?:week|month|monday|tuesday|wednesday|thursday|friday|saturday|sunday)",
+        r"on (?:monday|tuesday|wednesday|thursday|friday|saturday|sunday)",
+        r"monday|tuesday|wednesday|thursday|friday|saturday|sunday",
+        r"at \d{1,2}(?::\d{2})?(?: ?[ap]\.?m\.?)?", r"\d{1,2}(?::\d{2})? ?[ap]\.?m\.?", r"\d{1,2}:\d{2}",
+        r"from \d{1,2}", r"until \d{1,2}", r"in the (?:morning|afternoon|evening)",
+    ),
+    re.IGNORECASE,
+)
+# Journaling what happened ("I went to the gym") creates events as well
+PAST_ACTIVITY = re.compile(
+    _words(r"i (?:went|had|did|met|visited|attended|finished|worked|studied|played|ran|spent)"),
+    re.IGNORECASE,
+)
+FEELING_EXPRESSION = re.compile(
+    _words(
+        r"i(?:'m| am) (?:so |very |really |quite |a bit |kind of |pretty |not )?(?:feeling )?\w+ed",
+        r"i (?:feel|felt)", r"feeling", r"mood", r"emotion(?:al|s)?",
+        r"happy", r"sad", r"angry", r"anxious", r"stressed", r"excited", r"tired", r"calm",
+        r"motivated", r"relaxed", r"overwhelmed", r"lonely", r"depressed", r"frustrated", r"upset",
+        r"nervous", r"worried", r"proud", r"grateful", r"exhausted", r"bored", r"scared", r"afraid",
+        r"great", r"awful", r"terrible",
+    ),
+    re.IGNORECASE,
+)
+# Wanting something on the calendar without naming it ("put a study block on Thursday")
+SCHEDULING_VERB = re.compile(
+    _words(r"add", r"put", r"block", r"schedul\w*", r"plan(?:s|ned|ning)?", r"book", r"(?:re)?arrange", r"move", r"cancel"),
+    re.IGNORECASE,
+)
+# Requests that want an answer, not a calendar or journal entry
+ADVICE_REQUEST = re.compile(
+    _words(
+        r"how (?:should|can|do|could|would) i", r"what (?:should|can|could) i", r"should i",
+        r"any (?:tips|advice|ideas|suggestions)", r"advice", r"tips?", r"suggest\w*", r"recommend\w*",
+        r"help me", r"why", r"explain", r"what is", r"what are", r"how to",
+        r"hi", r"hello", r"hey", r"thanks?", r"thank you",
+    ),
+    re.IGNORECASE,
+)
+
+
+class RouteDecision(NamedTuple):
+    use_tools: bool
+    intents: Tuple[str, ...]
+    reason: str
+
+
+def classify(text: str) -> RouteDecision:
+    """
+    Decide whether a chat turn needs the tool round (calendar or feeling tools).
+
+    Only turns that clearly just ask for an answer skip the tools; anything
+    ambiguous keeps the tool round, since a missed calendar entry or feeling
+    is worse than a slower reply.
+    """
+    intents = []
+    if SCHEDULE_QUERY.search(text):
+        intents.append("calendar")
+    elif EVENT_NOUN.search(text) and TIME_EXPRESSION.search(text):
+        intents.append("calendar")
+    elif PAST_ACTIVITY.search(text):
+        intents.append("calendar")
+    if FEELING_EXPRESSION.search(text):
+        intents.append("feeling")
+    if intents:
+        return RouteDecision(True, tuple(intents), "matched " + "+".join(intents))
+    # A time or scheduling verb may still mean a calendar insert or lookup ("help me study tomorrow at 3pm")
+    if ADVICE_REQUEST.search(text) and not TIME_EXPRESSION.search(text) and not SCHEDULING_VERB.search(text):
+        return RouteDecision(False, (), "answer only")
+    return RouteDecision(True, (), "uncertain")
+
+
+def route(text: str) -> RouteDecision:
+    """Classify a turn and log the decision for later auditing."""
+    if not INTENT_ROUTER_ENABLED:
+        return RouteDecision(True, (), "router disabled")
+    decision = classify(text)
+    logger.info(
+        "intent route use_tools=%s intents=%s reason=%s text_sha=%s%s",
+        decision.use_tools,
+        ",".join(decision.intents) or "-",
+        decision.reason,
+        hashlib.sha256(text.encode("utf-8")).hexdigest()[:12],
+        f" text={text!r}" if INTENT_ROUTER_LOG_TEXT else "",
+    )
+    return decision
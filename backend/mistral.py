@@ -1,38 +1,61 @@
 # mistral_api.py
-from datetime import datetime
+import asyncio
+import logging
+from datetime import datetime, timezone
 import os
 import json
-from typing import Tuple, List
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
 
-import pytz
 from aci.types.enums import FunctionDefinitionFormat
 from mistralai import Mistral
 from dotenv import load_dotenv
 from sqlalchemy.orm import Query
 
-from schemes import Event, Feeling
-from gcal import aci
-from openai import OpenAI
+from chat_sessions import ChatMessage, build_context, chat_sessions
+from feeling_lexicon import extract_feeling
+from generation_cache import generation_cache
+from intent_router import route
+from prompt_encoding import encode_events, encode_feelings
+from schemes import APP_TIMEZONE, Event, Feeling, parse_timestamp
+from single_flight import SingleFlight
+from admission import admit, estimate_tokens
+from telemetry import record_usage, span
+from gcal import calendar_tools, execute_function_async
+from http_transport import PROVIDER_POLICIES, async_client, sync_client
+from openai import AsyncOpenAI
 
 load_dotenv()
 MISTRAL_API_KEY = os.getenv("MISTRAL_API_KEY", "xxx")
 
-mistral_client = Mistral(api_key=MISTRAL_API_KEY)
-openai_client = OpenAI()
+logger = logging.getLogger(__name__)
+
+# Base URL overrides (MISTRAL_SERVER_URL, OPENAI_BASE_URL) point the clients at local stand-ins, e.g. for benchmarks.
+# Connections, timeouts and retries come from the shared transport, so the SDKs don't retry on their own.
+mistral_client = Mistral(
+    api_key=MISTRAL_API_KEY,
+    server_url=os.getenv("MISTRAL_SERVER_URL") or None,
+    client=sync_client("mistral"),
+    async_client=async_client("mistral"),
+    timeout_ms=int(PROVIDER_POLICIES["mistral"].timeout * 1000),
+)
+# Takes its timeout from the client
+openai_client = AsyncOpenAI(http_client=async_client("openai"), max_retries=0)
+# Upper bound for ACI tool calls of one lifeChat turn running at the same time
+TOOL_CALL_CONCURRENCY = int(os.getenv("TOOL_CALL_CONCURRENCY", "4"))
+# "tool": only the model's extract_feeling_from_log call; "fallback": the local lexicon fills in
+# when the model logged no feeling; "lexicon": only the lexicon, the tool is not offered
+FEELING_EXTRACTION = os.getenv("FEELING_EXTRACTION", "fallback")
 
 def google_event_to_event(event_data) -> Event:
-    def strip_timezone(dt_str):
-        # Remove timezone info if present (e.g., 2024-06-13T10:00:00+02:00 or 2024-06-13T10:00:00Z)
-        if "+" in dt_str:
-            return dt_str.split("+")[0]
-        if "Z" in dt_str:
-            return dt_str.replace("Z", "")
-        return dt_str
+    # All-day events only carry a "date" instead of a "dateTime"
+    start = event_data["start"].get("dateTime") or event_data["start"]["date"]
+    end = event_data["end"].get("dateTime") or event_data["end"]["date"]
+    start_time = parse_timestamp(start)
 
     return Event(
-        date=event_data["start"]["dateTime"][:10],
-        startTime=strip_timezone(event_data["start"]["dateTime"]),
-        endTime=strip_timezone(event_data["end"]["dateTime"]),
+        date=start_time.astimezone(APP_TIMEZONE).strftime("%Y-%m-%d"),
+        startTime=start_time,
+        endTime=end,
         description=event_data.get("summary", ""),
         tags=["calendar"],
         name=event_data.get("summary", ""),
@@ -45,12 +68,10 @@ def extract_feeling_from_log(feelings=None, score=None) -> dict:
     Returns a dict with keys: feelings (list), score (int), datetime (str).
     Accepts optional arguments to create a Feeling entry.
     """
-    from schemes import Feeling
-    datetime_val = datetime.now().isoformat()
     feeling_obj = Feeling(
         feelings=feelings,
         score=score,
-        datetime=datetime_val
+        datetime=datetime.now(timezone.utc)
     )
     return feeling_obj.model_dump()
 
@@ -77,38 +98,66 @@ feeling_tool = {
         }
     }
 }
+# Register the custom feeling extraction tool
+calendar_tools.add_static_tool(feeling_tool)
 
-def lifeChat(messages, model="gpt-4.1") -> Tuple[str, List[Event]]:
-    tools=[
-        aci.functions.get_definition("GOOGLE_CALENDAR__EVENTS_INSERT"),
-        aci.functions.get_definition("GOOGLE_CALENDAR__EVENTS_LIST"),
-        feeling_tool,  # Register the custom feeling extraction tool
-    ]
-    response = openai_client.chat.completions.create(
-        model=model,
-        messages=messages,
-        tools=tools,
-        tool_choice="required",
-    )
-    tool_calls = (
-        response.choices[0].message.tool_calls
-        if response.choices[0].message.tool_calls
-        else None
-    )
+# Overrides for ACI functions by name, e.g. to serve calendar reads from a local mirror
+ToolHandlers = Dict[str, Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]]
+
+async def run_tool_call(tool_call, semaphore: asyncio.Semaphore, tool_handlers: Optional[ToolHandlers] = None):
+    arguments = json.loads(tool_call.function.arguments)
+    if tool_call.function.name == "extract_feeling_from_log":
+        return extract_feeling_from_log(**arguments)
+    handler = (tool_handlers or {}).get(tool_call.function.name)
+    async with semaphore:
+        if handler:
+            return await handler(arguments)
+        return await execute_function_async(
+            tool_call.function.name,
+            arguments,
+            linked_account_owner_id=os.getenv("LINKED_ACCOUNT_OWNER_ID", ""),
+        )
+
+def chat_tools():
+    if FEELING_EXTRACTION == "lexicon":
+        return [tool for tool in calendar_tools.tools if tool is not feeling_tool]
+    return calendar_tools.tools
+
+async def request_tool_calls(messages, model):
+    await calendar_tools.ensure_loaded()
+    admission = await admit("openai", estimate_tokens(messages))
+    with span("openai.tool_round"):
+        response = await openai_client.chat.completions.create(
+            model=model,
+            messages=messages,
+            tools=chat_tools(),
+            tool_choice="required",
+        )
+    record_usage("openai", model, response.usage)
+    admission.settle(response.usage)
+    tool_calls = response.choices[0].message.tool_calls or []
+    # Paired with the intent router's log line to audit its decisions
+    logger.info("tool round called %s", ",".join(call.function.name for call in tool_calls) or "-")
+    return tool_calls
+
+def tool_outcome(tool_call, result) -> Optional[Tuple[str, Any]]:
+    """The ("feeling", dict) or ("event", Event) a tool call produced for the user, if any."""
+    if tool_call.function.name == "extract_feeling_from_log":
+        return "feeling", result
+    if (
+            tool_call.function.name == "GOOGLE_CALENDAR__EVENTS_INSERT"
+            and result.get("success")
+            and "data" in result
+    ):
+        return "event", google_event_to_event(result["data"])
+    return None
 
+def apply_tool_results(messages, tool_calls, results) -> Tuple[List[Event], List[dict]]:
     created_events = []
     created_feelings = []  # Collect extracted feelings
-    for tool_call in tool_calls:
-        if tool_call.function.name == "extract_feeling_from_log":
-            result = extract_feeling_from_log(**json.loads(tool_call.function.arguments))
-            created_feelings.append(result)
-        else:
-            result = aci.handle_function_call(
-                tool_call.function.name,
-                json.loads(tool_call.function.arguments),
-                linked_account_owner_id=os.getenv("LINKED_ACCOUNT_OWNER_ID", ""),
-            )
-            print(result)
+    for tool_call, result in zip(tool_calls, results):
+        if tool_call.function.name != "extract_feeling_from_log":
+            logger.debug("tool %s returned %s", tool_call.function.name, result)
             messages.append({"role": "assistant", "tool_calls": [tool_call]})
             messages.append(
                 {
@@ -117,45 +166,231 @@ def lifeChat(messages, model="gpt-4.1") -> Tuple[str, List[Event]]:
                     "content": json.dumps(result),
                 }
             )
-            if (
-                    tool_call.function.name == "GOOGLE_CALENDAR__EVENTS_INSERT"
-                    and result.get("success")
-                    and "data" in result
-            ):
-                created_events.append(google_event_to_event(result["data"]))
-
-    messages[0] =  {
-        "role": "system",
-        "content": f"Answer the user as a journaling assistant and give him helpful guidance. Also inform him if you added something to his calendar. It is {datetime.now(pytz.timezone('Europe/Berlin')).strftime('%m/%d/%Y %I:%M:%S %p %Z')}.",
-    }
-    messages[1] = {
-        "role": "user",
-        "content": f"The request from the user: {messages[1]['content']}",
-    }
-    response = openai_client.chat.completions.create(
-        model=model,
-        messages=messages,
-    )
+        outcome = tool_outcome(tool_call, result)
+        if outcome and outcome[0] == "feeling":
+            created_feelings.append(outcome[1])
+        elif outcome:
+            created_events.append(outcome[1])
+    return created_events, created_feelings
+
+# System prompts are constant so providers can cache the prompt prefix; the time goes with the user message
+EXTRACTION_SYSTEM_PROMPT = "Extract structured Event and Feeling data from a user chat log. Make sure events are atomic and separated. Do not use focus time. Always use orderBy startTime. Make sure to include all required parameters including path. Use timezone Europe/Berlin. Each user message starts with the current time."
+ANSWER_SYSTEM_PROMPT = "Answer the user as a journaling assistant and give him helpful guidance. Also inform him if you added something to his calendar. Each user message starts with the current time."
+SUMMARY_MODEL = "gpt-4.1-mini"
+
+def answer_messages(messages):
+    """The tool round's conversation with the answering system prompt in front."""
+    return [{"role": "system", "content": ANSWER_SYSTEM_PROMPT}] + messages[1:]
+
+async def lifeChat(messages, model="gpt-4.1", max_concurrency=TOOL_CALL_CONCURRENCY, tool_handlers: Optional[ToolHandlers] = None, use_tools: bool = True) -> Tuple[str, List[Event]]:
+    # Without tools the turn is a single answer completion
+    tool_calls = await request_tool_calls(messages, model) if use_tools else []
+
+    # Independent tool calls run concurrently, results are handled in call order
+    semaphore = asyncio.Semaphore(max_concurrency)
+    results = await asyncio.gather(*(run_tool_call(tool_call, semaphore, tool_handlers) for tool_call in tool_calls))
+    created_events, created_feelings = apply_tool_results(messages, tool_calls, results)
+
+    admission = await admit("openai", estimate_tokens(answer_messages(messages)))
+    with span("openai.answer"):
+        response = await openai_client.chat.completions.create(
+            model=model,
+            messages=answer_messages(messages),
+        )
+    record_usage("openai", model, response.usage)
+    admission.settle(response.usage)
     content = response.choices[0].message.content
     return content, created_events, created_feelings
 
-def extract_event_and_feeling(chat: str) -> Tuple[Event, List[Event]]:
+async def lifeChat_stream(messages, model="gpt-4.1", max_concurrency=TOOL_CALL_CONCURRENCY, tool_handlers: Optional[ToolHandlers] = None, use_tools: bool = True) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Streaming variant of lifeChat.
+
+    Yields ("event", Event) and ("feeling", dict) as soon as the producing
+    tool call finishes, then ("token", str) for every answer delta and
+    finally ("done", dict) with the same fields as the /lifeChat response.
+    """
+    tool_calls = await request_tool_calls(messages, model) if use_tools else []
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def indexed(i, tool_call):
+        return i, await run_tool_call(tool_call, semaphore, tool_handlers)
+
+    tasks = [asyncio.create_task(indexed(i, tool_call)) for i, tool_call in enumerate(tool_calls)]
+    results = [None] * len(tasks)
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            i, result = await next_done
+            results[i] = result
+            outcome = tool_outcome(tool_calls[i], result)
+            if outcome:
+                yield outcome
+    finally:
+        # Only has an effect if the client went away mid-way
+        for task in tasks:
+            task.cancel()
+    # Messages still get the results in call order, as in lifeChat
+    created_events, created_feelings = apply_tool_results(messages, tool_calls, results)
+
+    parts = []
+    admission = await admit("openai", estimate_tokens(answer_messages(messages)))
+    with span("openai.answer_stream"):
+        stream = await openai_client.chat.completions.create(
+            model=model,
+            messages=answer_messages(messages),
+            stream=True,
+            # The final chunk then carries the token usage
+            stream_options={"include_usage": True},
+        )
+        async for chunk in stream:
+            if chunk.usage:
+                record_usage("openai", model, chunk.usage)
+                admission.settle(chunk.usage)
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+                yield "token", chunk.choices[0].delta.content
+    yield "done", {
+        "response": "".join(parts),
+        "created_events": created_events,
+        "feeling": created_feelings,
+    }
+
+def stamped(chat: str) -> str:
+    return f"[{datetime.now(APP_TIMEZONE).strftime('%m/%d/%Y %I:%M:%S %p %Z')}] {chat}"
+
+def extraction_messages(chat: str):
     system = {
         "role": "system",
-        "content": f"Extract structured Event and Feeling data from a user chat log. Make sure events are atomic and separated. Do not use focus time. Always use orderBy startTime. Make sure to include all required parameters including path. Use timezone Europe/Berlin It is {datetime.now(pytz.timezone('Europe/Berlin')).strftime('%m/%d/%Y %I:%M:%S %p %Z')}.",
+        "content": EXTRACTION_SYSTEM_PROMPT,
     }
     user = {
         "role": "user",
-        "content": chat
+        "content": stamped(chat)
     }
-    response = lifeChat([system, user])
-    return response
+    return [system, user]
 
+async def summarize_turns(summary: str, turns: List[ChatMessage]) -> str:
+    """Fold older chat turns into the rolling summary of a session."""
+    transcript = "\n".join(f"{turn.role}: {turn.content}" for turn in turns)
+    messages = [
+        {"role": "system", "content": "Summarize this journaling conversation in a few sentences. Keep facts the assistant may need later: plans, events, feelings, goals."},
+        {"role": "user", "content": f"Summary so far: {summary or '-'}\n\nNew turns:\n{transcript}"},
+    ]
+    admission = await admit("openai", estimate_tokens(messages, 300))
+    with span("openai.summary"):
+        response = await openai_client.chat.completions.create(
+            model=SUMMARY_MODEL,
+            messages=messages,
+            max_tokens=300,
+        )
+    record_usage("openai", SUMMARY_MODEL, response.usage)
+    admission.settle(response.usage)
+    return response.choices[0].message.content
+
+async def session_messages(chat: str, session_id: Optional[str]):
+    """Messages for one turn; with a session, its history (within the token budget) comes first."""
+    if not session_id:
+        return extraction_messages(chat), None
+    session = chat_sessions.get(session_id)
+    messages = await build_context(chat_sessions, session, EXTRACTION_SYSTEM_PROMPT, stamped(chat), summarize_turns)
+    return messages, session
+
+def record_turn(session, user_content: str, answer: str) -> None:
+    if session is not None:
+        chat_sessions.append(session, "user", user_content)
+        chat_sessions.append(session, "assistant", answer)
+
+def lexicon_feeling(chat: str) -> Optional[dict]:
+    if FEELING_EXTRACTION == "tool":
+        return None
+    feeling = extract_feeling(chat)
+    return feeling.model_dump() if feeling else None
+
+def needs_tool_round(chat: str) -> bool:
+    decision = route(chat)
+    if FEELING_EXTRACTION == "lexicon" and decision.intents == ("feeling",):
+        # The lexicon covers the only thing the tool round would be for
+        return False
+    return decision.use_tools
+
+async def extract_event_and_feeling(chat: str, tool_handlers: Optional[ToolHandlers] = None, session_id: Optional[str] = None) -> Tuple[Event, List[Event]]:
+    messages, session = await session_messages(chat, session_id)
+    # lifeChat appends the tool round to messages; only the user message and the answer are recorded
+    user_content = messages[-1]["content"]
+    content, created_events, created_feelings = await lifeChat(messages, tool_handlers=tool_handlers, use_tools=needs_tool_round(chat))
+    if not created_feelings:
+        feeling = lexicon_feeling(chat)
+        if feeling:
+            created_feelings.append(feeling)
+    record_turn(session, user_content, content)
+    return content, created_events, created_feelings
+
+async def extract_event_and_feeling_stream(chat: str, tool_handlers: Optional[ToolHandlers] = None, session_id: Optional[str] = None) -> AsyncIterator[Tuple[str, Any]]:
+    messages, session = await session_messages(chat, session_id)
+    user_content = messages[-1]["content"]
+    fallback = None
+    seen_feeling = False
+    async for kind, data in lifeChat_stream(messages, tool_handlers=tool_handlers, use_tools=needs_tool_round(chat)):
+        if kind == "feeling":
+            seen_feeling = True
+        elif kind in ("token", "done") and not seen_feeling:
+            # The tool round is over without a feeling from the model
+            seen_feeling = True
+            fallback = lexicon_feeling(chat)
+            if fallback:
+                yield "feeling", fallback
+        if kind == "done":
+            if fallback:
+                data["feeling"].append(fallback)
+            record_turn(session, user_content, data["response"])
+            data["session_id"] = session_id
+        yield kind, data
+
+
+GENERATION_MODEL = "mistral-large-latest"
+# Bump when a prompt changes so cached generations of the old prompt are not served
+ADVICE_PROMPT_VERSION = "2"
+MOTIVATION_PROMPT_VERSION = "2"
+# Concurrent requests for the same generation (e.g. several dashboards opening) share one Mistral call
+generation_flights = SingleFlight("generation")
+
+
+async def complete_cached(cache_key: str, stage: str, messages) -> str:
+    """Generate with Mistral and cache the text; concurrent calls with the same key share one request."""
+
+    async def complete():
+        admission = await admit("mistral", estimate_tokens(messages, 100))
+        with span(stage):
+            chat_response = await mistral_client.chat.complete_async(
+                model=GENERATION_MODEL,
+                messages=messages,
+                temperature=0.3,
+                max_tokens=100
+            )
+        record_usage("mistral", GENERATION_MODEL, chat_response.usage)
+        admission.settle(chat_response.usage)
+        content = chat_response.choices[0].message.content
+        generation_cache.set(cache_key, content)
+        return content
+
+    return await generation_flights.do(cache_key, complete)
+
+
+def advice_cache_key(events: list) -> str:
+    # The advice prompt only sees the events
+    return generation_cache.make_key("advice", GENERATION_MODEL, ADVICE_PROMPT_VERSION, events)
+
+
+async def generate_advice(events: list, feelings: list) -> str:
+    cache_key = advice_cache_key(events)
+    cached = generation_cache.get(cache_key)
+    if cached is not None:
+        return cached
 
-def generate_advice(events: list, feelings: list) -> str:
     prompt = f"""
     Here are the user's events:
-    {json.dumps(events, indent=2)}
+    {encode_events(events)}
     
     Please provide personal, supportive advice.
     Provide advice based on events. 
@@ -170,39 +405,69 @@ def generate_advice(events: list, feelings: list) -> str:
                  "content": "You are a life coach and you are helping the user to achieve their deadlines. Always format your responses in markdown."},
                 {"role": "user", "content": prompt}]
 
-    chat_response = mistral_client.chat.complete(
-        model="mistral-large-latest",
-        messages=messages,
-        temperature=0.3,
-        max_tokens=100
+    return await complete_cached(cache_key, "mistral.advice", messages)
+
+
+def motivation_cache_key(events: list, feelings: list) -> str:
+    return generation_cache.make_key(
+        "motivation", GENERATION_MODEL, MOTIVATION_PROMPT_VERSION, events, feelings
     )
-    return chat_response.choices[0].message.content
 
 
-def generate_motivation(events: list, feelings: list) -> str:
+def motivation_messages(events: list, feelings: list):
     prompt = f"""
     You are a motivation coach.
     Return a 3 motivational quotes based on the user's events and feelings.
-    Events: {json.dumps(events, indent=2)}
-    Feelings: {json.dumps(feelings, indent=2)}
+    {encode_events(events)}
+    {encode_feelings(feelings)}
     Do not preamble. Just return the quotes.
     Return concise and short quotes.
     """
 
-    messages = [{"role": "system",
-                 "content": "You are a motivation coach. Return 3 motivational quotes based on the user's events and feelings."},
-                {"role": "user", "content": prompt}]
+    return [{"role": "system",
+             "content": "You are a motivation coach. Return 3 motivational quotes based on the user's events and feelings."},
+            {"role": "user", "content": prompt}]
 
-    chat_response = mistral_client.chat.complete(
-        model="mistral-large-latest",
-        messages=messages,
-        temperature=0.3,
-        max_tokens=100
-    )
-    return chat_response.choices[0].message.content
+
+async def generate_motivation(events: list, feelings: list) -> str:
+    cache_key = motivation_cache_key(events, feelings)
+    cached = generation_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    return await complete_cached(cache_key, "mistral.motivation", motivation_messages(events, feelings))
+
+
+async def generate_motivation_stream(events: list, feelings: list) -> AsyncIterator[str]:
+    """Like generate_motivation, but yields the text as Mistral generates it."""
+    cache_key = motivation_cache_key(events, feelings)
+    cached = generation_cache.get(cache_key)
+    if cached is not None:
+        yield cached
+        return
+
+    parts = []
+    messages = motivation_messages(events, feelings)
+    admission = await admit("mistral", estimate_tokens(messages, 100))
+    with span("mistral.motivation_stream"):
+        stream = await mistral_client.chat.stream_async(
+            model=GENERATION_MODEL,
+            messages=messages,
+            temperature=0.3,
+            max_tokens=100
+        )
+        async for event in stream:
+            if event.data.usage:
+                record_usage("mistral", GENERATION_MODEL, event.data.usage)
+                admission.settle(event.data.usage)
+            delta = event.data.choices[0].delta.content if event.data.choices else None
+            if isinstance(delta, str) and delta:
+                parts.append(delta)
+                yield delta
+    generation_cache.set(cache_key, "".join(parts))
 
 
-def generate_advice_from_feeling(feeling: str) -> str:
+async def generate_advice_from_feeling(feeling: str) -> str:
     system = {
         "role": "system",
         "content": """You are a kind, thoughtful life coach. Always format your responses in markdown.""",
@@ -221,7 +486,7 @@ def generate_advice_from_feeling(feeling: str) -> str:
     Do not preamble. Just return the advices.
     """,
     }
-    return lifeChat([system, user], model="mistral-large-latest", max_tokens=500)
+    return await lifeChat([system, user], model="mistral-large-latest", max_tokens=500)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, time, timedelta
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from admission import AdmissionRejected, Priority, set_priority
+from generation_cache import generation_cache
+from mistral import advice_cache_key, generate_advice, generate_motivation, motivation_cache_key
+from schemes import APP_TIMEZONE
+from telemetry import Counter, registry
+
+logger = logging.getLogger(__name__)
+
+PRECOMPUTE_ENABLED = os.getenv("PRECOMPUTE_ENABLED", "1") != "0"
+# Local hours [from, to) in which precomputation runs; may wrap midnight, e.g. "23-5"
+PRECOMPUTE_HOURS = os.getenv("PRECOMPUTE_HOURS", "3-6")
+# Seconds between checks for changed windows during those hours
+PRECOMPUTE_INTERVAL = float(os.getenv("PRECOMPUTE_INTERVAL", "900"))
+
+PRECOMPUTE_RUNS = registry.register(Counter(
+    "precompute_windows_total", "Precomputation results per window", ("window", "outcome")
+))
+
+# (startTime, endTime) as local ISO strings, as the endpoints receive them -> (events, feelings) as they serialize them
+LoadWindow = Callable[[str, str], Awaitable[Tuple[list, list]]]
+# Makes sure the audio for a text is in the audio cache
+CacheSpeech = Callable[[str], Awaitable[bool]]
+
+
+def parse_hours(hours: str) -> Tuple[int, int]:
+    start, _, end = hours.partition("-")
+    return int(start), int(end)
+
+
+def in_hours(now: datetime, hours: Tuple[int, int]) -> bool:
+    start, end = hours
+    hour = now.astimezone(APP_TIMEZONE).hour
+    return start <= hour < end if start <= end else hour >= start or hour < end
+
+
+def common_windows(now: datetime) -> List[Tuple[str, datetime, datetime]]:
+    """Today and the current week (from Monday), as naive local bounds."""
+    today = datetime.combine(now.astimezone(APP_TIMEZONE).date(), time())
+    week = today - timedelta(days=today.weekday())
+    return [
+        ("today", today, today + timedelta(days=1)),
+        ("week", week, week + timedelta(days=7)),
+    ]
+
+
+class PrecomputeScheduler:
+    """
+    Generates advice, motivation and (optionally) speech audio for the common windows off-peak.
+
+    The results go into the generation and audio caches, which are keyed by
+    a hash of their inputs. A window whose outputs are already cached thus
+    has unchanged events and feelings and is skipped; only changed windows
+    (or outputs evicted from the caches) cost upstream calls. Precomputed
+    texts stay cached until their window ends, past the cache's TTL.
+
+    Args:
+        load_window (LoadWindow): Loads a window exactly like the endpoints do
+        cache_speech (Optional[CacheSpeech]): Synthesizes the motivation text into the audio cache, if the app serves audio
+        hours (str): Local hours "from-to" in which to run
+        interval (float): Seconds between checks
+    """
+
+    def __init__(
+        self,
+        load_window: LoadWindow,
+        cache_speech: Optional[CacheSpeech] = None,
+        hours: str = PRECOMPUTE_HOURS,
+        interval: float = PRECOMPUTE_INTERVAL,
+    ):
+        self.load_window = load_window
+        self.cache_speech = cache_speech
+        self.hours = parse_hours(hours)
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def precompute(self, start: datetime, end: datetime) -> str:
+        events, feelings = await self.load_window(start.isoformat(), end.isoformat())
+        if not events and not feelings:
+            # The endpoints answer these without a model call
+            return "empty"
+        outcome = "cached"
+        advice_key = advice_cache_key(events)
+        motivation_key = motivation_cache_key(events, feelings)
+        if generation_cache.get(advice_key) is None:
+            await generate_advice(events, feelings)
+            outcome = "generated"
+        if generation_cache.get(motivation_key) is None:
+            outcome = "generated"
+        text = await generate_motivation(events, feelings)
+        # The texts are requested hours after these off-peak runs; keep them as long as their window lasts
+        expires_at = APP_TIMEZONE.localize(end).timestamp()
+        generation_cache.extend(advice_key, expires_at)
+        generation_cache.extend(motivation_key, expires_at)
+        if self.cache_speech is not None and await self.cache_speech(text):
+            outcome = "generated"
+        return outcome
+
+    async def run_once(self, now: Optional[datetime] = None) -> None:
+        for name, start, end in common_windows(now or datetime.now(APP_TIMEZONE)):
+            try:
+                outcome = await self.precompute(start, end)
+            except AdmissionRejected as e:
+                # Requests have the providers' capacity; the next check retries
+                logger.info("Precomputing the %s window was deferred: %s", name, e)
+                outcome = "rejected"
+            except Exception:
+                # Requests still generate on demand; the next check retries
+                logger.exception("Precomputing the %s window failed", name)
+                outcome = "error"
+            logger.debug("Precomputed %s window: %s", name, outcome)
+            PRECOMPUTE_RUNS.inc(window=name, outcome=outcome)
+
+    async def start(self) -> None:
+        if PRECOMPUTE_ENABLED:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _loop(self) -> None:
+        # Queued behind request traffic at the providers' rate limits
+        set_priority(Priority.BACKGROUND)
+        while True:
+            if in_hours(datetime.now(APP_TIMEZONE), self.hours):
+                await self.run_once()
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,123 @@
+import os
+from collections import Counter, defaultdict
+from typing import Dict, List, Sequence
+
+from tokens import count_tokens
+
+# Upper bounds for the event and feeling sections of a generation prompt
+PROMPT_EVENT_TOKENS = int(os.getenv("PROMPT_EVENT_TOKENS", "1200"))
+PROMPT_FEELING_TOKENS = int(os.getenv("PROMPT_FEELING_TOKENS", "600"))
+
+
+def _time(value: str) -> str:
+    # Serialized timestamps are local ISO strings; keep "HH:MM"
+    return value[11:16]
+
+
+def _evenly(count: int, keep: int) -> List[int]:
+    if keep >= count:
+        return list(range(count))
+    if keep <= 1:
+        return [count - 1]
+    return sorted({round(i * (count - 1) / (keep - 1)) for i in range(keep)})
+
+
+def fit_lines(header: str, lines: List[str], budget: int, noun: str) -> str:
+    """
+    Join header and lines, dropping lines evenly across the list until the text fits `budget` tokens.
+
+    Sampling evenly rather than cutting the tail keeps the whole range
+    represented.
+    """
+    line_tokens = [count_tokens(line) + 1 for line in lines]
+    fixed = count_tokens(header) + count_tokens(f"... {len(lines)} more {noun} not shown") + 1
+    keep = len(lines)
+    indices = list(range(keep))
+    while keep > 1 and fixed + sum(line_tokens[i] for i in indices) > budget:
+        keep = max(1, min(keep - 1, int(keep * budget / (fixed + sum(line_tokens[i] for i in indices)))))
+        indices = _evenly(len(lines), keep)
+    selected = [lines[i] for i in indices]
+    if len(selected) < len(lines):
+        selected.append(f"... {len(lines) - len(selected)} more {noun} not shown")
+    return "\n".join([header] + selected)
+
+
+def encode_events(events: Sequence[Dict], budget: int = PROMPT_EVENT_TOKENS) -> str:
+    """
+    Events as one line each: `date start-end name [tags] description`.
+
+    Tags shared by all events are listed once in the header, and a
+    description is only written the first time it occurs for a name (or
+    not at all if it just repeats the name). Over budget, recurring events
+    are collapsed into one summary line each, then lines are sampled.
+    """
+    if not events:
+        return "Events: none"
+    events = sorted(events, key=lambda e: e["startTime"])
+    common_tags = set.intersection(*(set(e["tags"]) for e in events))
+    header = "Events (date start-end name [tags] description)"
+    if common_tags:
+        header += f"; all tagged: {','.join(sorted(common_tags))}"
+
+    described = set()
+    lines = []
+    for e in events:
+        line = f"{e['startTime'][:10]} {_time(e['startTime'])}-{_time(e['endTime'])} {e['name']}"
+        tags = [tag for tag in e["tags"] if tag not in common_tags]
+        if tags:
+            line += f" [{','.join(tags)}]"
+        description = e["description"]
+        if description and description != e["name"] and (e["name"], description) not in described:
+            described.add((e["name"], description))
+            line += f" {description}"
+        lines.append(line)
+    text = "\n".join([header] + lines)
+    if count_tokens(text) <= budget:
+        return text
+
+    # Collapse recurring events (same name) into one line each
+    header = header.replace("(date start-end name [tags] description)", "(date start-end name, or first..last name xcount)")
+    by_name: Dict[str, List[Dict]] = defaultdict(list)
+    for e in events:
+        by_name[e["name"]].append(e)
+    lines = []
+    for name, group in sorted(by_name.items(), key=lambda item: item[1][0]["startTime"]):
+        if len(group) == 1:
+            e = group[0]
+            lines.append(f"{e['startTime'][:10]} {_time(e['startTime'])}-{_time(e['endTime'])} {name}")
+            continue
+        usual = Counter(f"{_time(e['startTime'])}-{_time(e['endTime'])}" for e in group).most_common(1)[0][0]
+        lines.append(f"{group[0]['startTime'][:10]}..{group[-1]['startTime'][:10]} {name} x{len(group)}, usually {usual}")
+    return fit_lines(header, lines, budget, "events")
+
+
+def encode_feelings(feelings: Sequence[Dict], budget: int = PROMPT_FEELING_TOKENS) -> str:
+    """
+    Feelings as `date time score feelings` lines.
+
+    Over budget they are aggregated per day (count, average, range and
+    emotion counts), then days are sampled.
+    """
+    if not feelings:
+        return "Feelings: none"
+    feelings = sorted(feelings, key=lambda f: f["datetime"])
+    header = "Feelings (date time score(1-10) feelings)"
+    lines = [
+        f"{f['datetime'][:10]} {_time(f['datetime'])} {f['score']} {','.join(f['feelings'])}"
+        for f in feelings
+    ]
+    text = "\n".join([header] + lines)
+    if count_tokens(text) <= budget:
+        return text
+
+    by_day: Dict[str, List[Dict]] = defaultdict(list)
+    for f in feelings:
+        by_day[f["datetime"][:10]].append(f)
+    header = "Feelings per day (date count avg min-max feelings)"
+    lines = []
+    for day, group in by_day.items():
+        scores = [f["score"] for f in group]
+        emotions = Counter(name for f in group for name in f["feelings"])
+        names = ",".join(name if count == 1 else f"{name}x{count}" for name, count in emotions.most_common())
+        lines.append(f"{day} {len(group)} {sum(scores) / len(scores):.1f} {min(scores)}-{max(scores)} {names}")
+    return fit_lines(header, lines, budget, "days")
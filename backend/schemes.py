@@ -1,18 +1,71 @@
-from typing import List
+from datetime import datetime as dt, timezone
+from typing import Annotated, List, Union
 
-from pydantic import BaseModel, Field
+import pytz
+from pydantic import BaseModel, BeforeValidator, Field, PlainSerializer, PrivateAttr
+
+# Naive timestamps (as sent by the Flutter client) are wall-clock times in this zone
+APP_TIMEZONE = pytz.timezone("Europe/Berlin")
+
+
+def parse_timestamp(value: Union[str, dt]) -> dt:
+    """
+    Parse an ISO 8601 string or datetime into a timezone-aware UTC datetime.
+
+    Naive values are interpreted in APP_TIMEZONE. A date without time
+    (e.g. all-day calendar events) is taken as local midnight.
+    """
+    if isinstance(value, str):
+        value = dt.fromisoformat(value)
+    if value.tzinfo is None:
+        value = APP_TIMEZONE.localize(value)
+    return value.astimezone(timezone.utc)
+
+
+def format_timestamp(value: dt) -> str:
+    """Serialize as local wall-clock ISO string without offset, the format the clients expect."""
+    return value.astimezone(APP_TIMEZONE).replace(tzinfo=None).isoformat()
+
+
+def to_epoch(value: Union[str, dt]) -> float:
+    return parse_timestamp(value).timestamp()
+
+
+Timestamp = Annotated[
+    dt,
+    BeforeValidator(parse_timestamp),
+    PlainSerializer(format_timestamp, return_type=str),
+]
 
 
 class Event(BaseModel):
     date: str
-    startTime: str
-    endTime: str
+    startTime: Timestamp
+    endTime: Timestamp
     description: str
     tags: List[str]
     name: str
 
+    _start_epoch: float = PrivateAttr()
+
+    def model_post_init(self, __context) -> None:
+        self._start_epoch = self.startTime.timestamp()
+
+    @property
+    def start_epoch(self) -> float:
+        return self._start_epoch
+
 
 class Feeling(BaseModel):
     feelings: List[str]
     score: int = Field(..., ge=1, le=10)
-    datetime: str
+    datetime: Timestamp
+
+    _epoch: float = PrivateAttr()
+
+    def model_post_init(self, __context) -> None:
+        self._epoch = self.datetime.timestamp()
+
+    @property
+    def epoch(self) -> float:
+        return self._epoch
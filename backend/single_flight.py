@@ -0,0 +1,276 @@
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple, TypeVar
+
+from admission import SharedPriority, current_priority, use_shared_priority
+from telemetry import Counter, registry
+
+T = TypeVar("T")
+
+FLIGHT_CALLS = registry.register(Counter(
+    "single_flight_calls_total", "Calls that started an upstream call (leader) or joined one (follower)", ("flight", "role")
+))
+
+
+# Bytes the upstream may be read ahead of the slowest subscriber before reading pauses
+STREAM_READ_AHEAD = 256 * 1024
+# Bytes kept from the start so later subscribers can replay them; past that, chunks every
+# subscriber has read are dropped and the stream takes no new subscribers
+STREAM_REPLAY_BYTES = 1024 * 1024
+
+
+class _Subscription:
+    """
+    One subscriber's position in a SharedStream; an async iterator over its chunks.
+
+    It registers with the stream on the first `__anext__`. Until then it
+    only holds the stream at the first byte, and dropping it unread
+    releases the stream just like `aclose()`.
+    """
+
+    def __init__(self, stream: "SharedStream"):
+        self._stream = stream
+        self.position = 0
+        self.bytes_read = 0
+        self.started = False
+        self.closed = False
+
+    def __aiter__(self) -> "_Subscription":
+        return self
+
+    async def __anext__(self) -> bytes:
+        if self.closed:
+            raise StopAsyncIteration
+        if not self.started:
+            self.started = True
+            self._stream._start(self)
+        try:
+            chunk = await self._stream._next(self)
+        except BaseException:
+            self._close()
+            raise
+        if chunk is None:
+            self._close()
+            raise StopAsyncIteration
+        return chunk
+
+    async def aclose(self) -> None:
+        self._close()
+
+    def _close(self) -> None:
+        if not self.closed:
+            self.closed = True
+            self._stream._unsubscribe(self)
+
+    def __del__(self):
+        # E.g. a response that was never started; started subscriptions are closed by their reader
+        try:
+            self._close()
+        except RuntimeError:
+            # The event loop is already closed, and the upstream task with it
+            pass
+
+
+class SharedStream:
+    """
+    One upstream byte stream replayed to any number of subscribers.
+
+    The upstream is read by a background task at most `read_ahead` bytes
+    ahead of the slowest subscriber, so a slow client still slows the
+    upstream down. The first `replay_bytes` are kept so that subscribers
+    joining late start from the first byte; once the stream grew past
+    that, chunks every subscriber has read are dropped and new requests
+    start their own stream instead of joining.
+
+    A subscription handed out but not read from yet counts as a subscriber
+    at the first byte. When the last subscriber leaves (reads to the end,
+    closes, or is dropped unread) before the upstream finished, the stream
+    is detached from its flight and the upstream is cancelled.
+    """
+
+    def __init__(
+        self,
+        chunks: AsyncIterator[bytes],
+        on_done: Callable[[], None],
+        read_ahead: int = STREAM_READ_AHEAD,
+        replay_bytes: int = STREAM_REPLAY_BYTES,
+    ):
+        self.read_ahead = read_ahead
+        self.replay_bytes = replay_bytes
+        self._chunks: List[bytes] = []
+        # Position of self._chunks[0] in the whole stream
+        self._first = 0
+        self._produced = 0
+        self._subscribers: Set[_Subscription] = set()
+        # Subscriptions handed out but not read from yet
+        self._pending = 0
+        self._joinable = True
+        self._error: Optional[BaseException] = None
+        self._done = False
+        self._changed = asyncio.Event()
+        self._on_done = on_done
+        self._task = asyncio.create_task(self._pump(chunks))
+
+    @property
+    def joinable(self) -> bool:
+        """Whether a new subscriber would still receive the stream from its first byte."""
+        return self._joinable
+
+    async def _pump(self, chunks: AsyncIterator[bytes]) -> None:
+        try:
+            async for chunk in chunks:
+                self._chunks.append(chunk)
+                self._produced += len(chunk)
+                self._trim()
+                self._notify()
+                while self._produced - self._slowest() >= self.read_ahead:
+                    await self._changed.wait()
+        except asyncio.CancelledError as e:
+            # Never let anyone still reading take a cut-off stream for a complete one
+            self._error = e
+            raise
+        except Exception as e:
+            self._error = e
+        finally:
+            # Also when cancelled between two chunks, where the upstream would only be closed when collected
+            await chunks.aclose()
+            self._done = True
+            self._joinable = False
+            self._notify()
+            self._on_done()
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _slowest(self) -> int:
+        """Bytes read by the subscriber furthest behind; pending ones have read nothing."""
+        if self._pending or not self._subscribers:
+            return 0
+        return min(s.bytes_read for s in self._subscribers)
+
+    def _trim(self) -> None:
+        if self._produced > self.replay_bytes:
+            self._joinable = False
+        if self._joinable or self._pending or not self._subscribers:
+            return
+        drop = min(s.position for s in self._subscribers) - self._first
+        if drop > 0:
+            del self._chunks[:drop]
+            self._first += drop
+
+    def subscribe(self) -> AsyncIterator[bytes]:
+        if not self._joinable:
+            raise RuntimeError("stream no longer takes subscribers")
+        self._pending += 1
+        return _Subscription(self)
+
+    def _start(self, subscription: _Subscription) -> None:
+        self._pending -= 1
+        self._subscribers.add(subscription)
+
+    async def _next(self, subscription: _Subscription) -> Optional[bytes]:
+        """The subscriber's next chunk, or None at the end of the stream."""
+        while True:
+            index = subscription.position - self._first
+            if index < len(self._chunks):
+                chunk = self._chunks[index]
+                subscription.position += 1
+                subscription.bytes_read += len(chunk)
+                self._trim()
+                # Wakes the pump if it waits for the slowest subscriber
+                self._notify()
+                return chunk
+            if self._done:
+                if self._error is not None:
+                    raise self._error
+                return None
+            await self._changed.wait()
+
+    def _unsubscribe(self, subscription: _Subscription) -> None:
+        if subscription.started:
+            self._subscribers.discard(subscription)
+        else:
+            self._pending -= 1
+        if not self._subscribers and not self._pending and not self._done:
+            # Detach first, so no request joins a stream that is about to stop
+            self._joinable = False
+            self._on_done()
+            self._task.cancel()
+        else:
+            self._trim()
+            self._notify()
+
+
+class SingleFlight:
+    """
+    Collapse concurrent calls with the same key onto one upstream call.
+
+    Only calls that overlap in time are shared; once a call finished the
+    next one for its key starts a new flight, so results should be cached
+    by the caller. The call runs in its own task: a caller that goes away
+    does not cancel it for the others. Its upstream calls are admitted at
+    the most urgent priority among the callers waiting for it.
+
+    Args:
+        name (str): Label of the flight in the metrics
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[str, Tuple[asyncio.Task, SharedPriority]] = {}
+        self._streams: Dict[str, Tuple[SharedStream, SharedPriority]] = {}
+
+    async def do(self, key: str, call: Callable[[], Awaitable[T]]) -> T:
+        flight = self._calls.get(key)
+        if flight is None:
+            FLIGHT_CALLS.inc(flight=self.name, role="leader")
+            priority = SharedPriority(current_priority())
+
+            async def run() -> T:
+                use_shared_priority(priority)
+                return await call()
+
+            task = asyncio.ensure_future(run())
+            self._calls[key] = (task, priority)
+            task.add_done_callback(lambda t: self._finish_call(key, t))
+        else:
+            FLIGHT_CALLS.inc(flight=self.name, role="follower")
+            task, priority = flight
+            priority.raise_to(current_priority())
+        return await asyncio.shield(task)
+
+    def _finish_call(self, key: str, task: asyncio.Task) -> None:
+        if key in self._calls and self._calls[key][0] is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # Retrieved here so an error nobody waited for any more is not reported as unhandled
+            task.exception()
+
+    def stream(self, key: str, open_stream: Callable[[], AsyncIterator[bytes]]) -> AsyncIterator[bytes]:
+        """Subscribe to the in-flight stream for `key`, opening it with `open_stream` if there is none it can join."""
+        flight = self._streams.get(key)
+        if flight is None or not flight[0].joinable:
+            FLIGHT_CALLS.inc(flight=self.name, role="leader")
+            priority = SharedPriority(current_priority())
+            chunks = open_stream()
+
+            async def run() -> AsyncIterator[bytes]:
+                # Runs in the stream's own task
+                use_shared_priority(priority)
+                try:
+                    async for chunk in chunks:
+                        yield chunk
+                finally:
+                    await chunks.aclose()
+
+            shared = SharedStream(run(), lambda: self._finish_stream(key, shared))
+            self._streams[key] = (shared, priority)
+        else:
+            FLIGHT_CALLS.inc(flight=self.name, role="follower")
+            shared, priority = flight
+            priority.raise_to(current_priority())
+        return shared.subscribe()
+
+    def _finish_stream(self, key: str, shared: SharedStream) -> None:
+        if key in self._streams and self._streams[key][0] is shared:
+            del self._streams[key]
@@ -0,0 +1,31 @@
+import json
+from typing import Any, AsyncIterator, Tuple
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+
+from admission import AdmissionRejected
+
+
+def sse_frame(event: str, data: Any) -> str:
+    """Encode one server-sent event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+
+def sse_response(frames: AsyncIterator[Tuple[str, Any]]) -> StreamingResponse:
+    """Stream (event, data) pairs as text/event-stream."""
+
+    async def encode():
+        try:
+            async for event, data in frames:
+                yield sse_frame(event, data)
+        except AdmissionRejected as e:
+            # The 200 is already sent, so the rejection ends the stream as a frame
+            yield sse_frame("error", {"detail": str(e), "retry_after": e.retry_after})
+
+    return StreamingResponse(
+        encode(),
+        media_type="text/event-stream",
+        # Keep proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,286 @@
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from fastapi import FastAPI
+from fastapi.responses import Response
+
+logger = logging.getLogger(__name__)
+
+# Requests taking longer than this are logged with a per-stage breakdown
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", "2"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Labels, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+class Counter:
+    """Monotonic counter per label combination, rendered in the Prometheus text format."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Labels, float] = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] += amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in values]
+
+
+class Gauge(Counter):
+    """Current value per label combination that may go up and down, e.g. a queue depth."""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count per label combination."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per labels: [count per bucket (+Inf last), sum]
+        self._values: Dict[Labels, Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[bisect_left(self.buckets, value)] += 1
+            total[0] += value
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted((key, list(counts), total[0]) for key, (counts, total) in self._values.items())
+        lines = []
+        for key, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                bucket_labels = _format_labels(self.labelnames, key, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+REQUEST_SECONDS = registry.register(Histogram(
+    "http_request_duration_seconds", "Time until the last response byte was sent", ("method", "route", "status")
+))
+STAGE_SECONDS = registry.register(Histogram(
+    "stage_duration_seconds", "Duration of upstream calls and database queries", ("stage", "outcome")
+))
+LLM_TOKENS = registry.register(Counter(
+    "llm_tokens_total", "Prompt and completion tokens reported by the providers", ("provider", "model", "kind")
+))
+TTS_CHARACTERS = registry.register(Counter(
+    "tts_characters_total", "Characters sent to speech synthesis", ("provider", "model")
+))
+
+
+class Trace:
+    """Stages and token counts of one HTTP request, for the slow-request log."""
+
+    def __init__(self):
+        self.stages: List[Tuple[str, float]] = []
+        self.tokens: Dict[str, int] = defaultdict(int)
+
+    def breakdown(self) -> Dict[str, Dict[str, float]]:
+        stages: Dict[str, Dict[str, float]] = {}
+        for stage, duration in self.stages:
+            entry = stages.setdefault(stage, {"count": 0, "seconds": 0.0})
+            entry["count"] += 1
+            entry["seconds"] = round(entry["seconds"] + duration, 4)
+        return stages
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("telemetry_trace", default=None)
+
+
+def record_stage(stage: str, duration: float, outcome: str = "ok") -> None:
+    STAGE_SECONDS.observe(duration, stage=stage, outcome=outcome)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.stages.append((stage, duration))
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """
+    Time the enclosed block as `stage`.
+
+    Works around awaits and inside (async) generators, where it covers the
+    whole time the stream was open.
+    """
+    start = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except GeneratorExit:
+        outcome = "closed"
+        raise
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        record_stage(stage, time.perf_counter() - start, outcome)
+
+
+def record_usage(provider: str, model: str, usage: Any) -> None:
+    """Count the prompt/completion tokens of an OpenAI or Mistral usage object."""
+    if usage is None:
+        return
+    trace = _current_trace.get()
+    for kind in ("prompt", "completion"):
+        tokens = getattr(usage, f"{kind}_tokens", None) or 0
+        if tokens:
+            LLM_TOKENS.inc(tokens, provider=provider, model=model, kind=kind)
+            if trace is not None:
+                trace.tokens[kind] += tokens
+
+
+def record_tts(provider: str, model: str, text: str) -> None:
+    TTS_CHARACTERS.inc(len(text), provider=provider, model=model)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.tokens["tts_characters"] += len(text)
+
+
+def instrument_engine(engine) -> None:
+    """Time every statement of a SQLAlchemy engine as a `db.<verb>` stage."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("telemetry_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start = conn.info["telemetry_start"].pop()
+        verb = statement.lstrip().split(None, 1)[0].lower() if statement.strip() else "other"
+        record_stage(f"db.{verb}", time.perf_counter() - start)
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        starts = exception_context.connection.info.get("telemetry_start") if exception_context.connection else None
+        if starts:
+            record_stage("db.error", time.perf_counter() - starts.pop(), "error")
+
+
+class TelemetryMiddleware:
+    """
+    ASGI middleware recording request latency per route and logging slow requests.
+
+    Streaming responses are timed until their last chunk was sent.
+    """
+
+    def __init__(self, app, slow_request_seconds: float = SLOW_REQUEST_SECONDS):
+        self.app = app
+        self.slow_request_seconds = slow_request_seconds
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace()
+        token = _current_trace.set(trace)
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _current_trace.reset(token)
+            duration = time.perf_counter() - start
+            # The route template, not the raw path, keeps the label set bounded
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            REQUEST_SECONDS.observe(duration, method=scope["method"], route=route, status=str(status))
+            if duration >= self.slow_request_seconds:
+                logger.warning("slow request %s", json.dumps({
+                    "method": scope["method"],
+                    "route": route,
+                    "status": status,
+                    "seconds": round(duration, 4),
+                    "stages": trace.breakdown(),
+                    "tokens": dict(trace.tokens),
+                }))
+
+
+def metrics() -> Response:
+    return Response(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def instrument_app(app: FastAPI) -> None:
+    """Add the telemetry middleware and a Prometheus `/metrics` endpoint."""
+    app.add_middleware(TelemetryMiddleware)
+    app.add_api_route("/metrics", metrics, methods=["GET"], include_in_schema=False)
@@ -0,0 +1,11 @@
+import os
+import sys
+
+# Modules are imported the way the apps import them, from backend/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The provider clients are built at import time; tests never reach the providers
+for name in ("OPENAI_API_KEY", "MISTRAL_API_KEY", "ELEVENLABS_API_KEY", "ACI_API_KEY", "LINKED_ACCOUNT_OWNER_ID"):
+    os.environ.setdefault(name, "test")
+os.environ["GENERATION_CACHE_DB"] = ""
+os.environ["PRECOMPUTE_ENABLED"] = "0"
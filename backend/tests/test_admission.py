@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+
+import admission
+from admission import AdmissionRejected, Priority, ProviderLimiter, admit, set_priority
+from single_flight import SingleFlight
+
+
+@pytest.fixture
+def make_limiter(monkeypatch):
+    def make(requests_per_minute):
+        limiter = ProviderLimiter("test", requests_per_minute, 0)
+        # Start with an empty bucket so every call queues
+        limiter.requests.level = 0
+        monkeypatch.setitem(admission.PROVIDER_LIMITERS, "test", limiter)
+        return limiter
+
+    return make
+
+
+async def call(priority, admitted, name, flight=None):
+    set_priority(priority)
+
+    async def upstream():
+        await admit("test")
+        admitted.append(name)
+        return name
+
+    if flight is None:
+        return await upstream()
+    return await flight.do("key", upstream)
+
+
+def test_joining_a_background_flight_raises_its_priority(make_limiter):
+    async def main():
+        limiter = make_limiter(600)
+        flight = SingleFlight("test")
+        admitted = []
+        first = asyncio.create_task(call(Priority.NORMAL, admitted, "first"))
+        await asyncio.sleep(0)
+        background = asyncio.create_task(call(Priority.BACKGROUND, admitted, "background", flight))
+        await asyncio.sleep(0)
+        later = asyncio.create_task(call(Priority.NORMAL, admitted, "later"))
+        await asyncio.sleep(0)
+        joined = asyncio.create_task(call(Priority.NORMAL, admitted, "joined", flight))
+        await asyncio.sleep(0)
+
+        # The background call was queued before "later" and now waits at normal priority, so it goes first
+        assert [(waiter.priority, waiter.seq) for waiter in sorted(limiter._queue)] == [
+            (Priority.NORMAL, 0), (Priority.NORMAL, 1), (Priority.NORMAL, 2)
+        ]
+        assert await asyncio.gather(first, background, later, joined) == ["first", "background", "later", "background"]
+
+    asyncio.run(main())
+
+
+def test_joined_flight_waits_under_the_joiners_deadline(make_limiter, monkeypatch):
+    monkeypatch.setitem(admission.ADMISSION_DEADLINES, Priority.NORMAL, 0.05)
+
+    async def main():
+        make_limiter(6)
+        flight = SingleFlight("test")
+        admitted = []
+        background = asyncio.create_task(call(Priority.BACKGROUND, admitted, "background", flight))
+        await asyncio.sleep(0)
+        joined = asyncio.create_task(call(Priority.NORMAL, admitted, "joined", flight))
+
+        for task in (background, joined):
+            with pytest.raises(AdmissionRejected):
+                await asyncio.wait_for(task, 1)
+        assert admitted == []
+
+    asyncio.run(main())
@@ -0,0 +1,19 @@
+import pytest
+
+from audio_cache import etag_matches
+
+ETAG = '"abc123"'
+
+
+@pytest.mark.parametrize("if_none_match, expected", [
+    ('"abc123"', True),
+    ('W/"abc123"', True),
+    ('"other", W/"abc123"', True),
+    (' "other" ,"abc123" ', True),
+    ("*", True),
+    ('"other"', False),
+    ('W/"other", "abc1234"', False),
+    ("abc123", False),
+])
+def test_etag_matches(if_none_match, expected):
+    assert etag_matches(if_none_match, ETAG) is expected
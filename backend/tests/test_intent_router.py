@@ -0,0 +1,32 @@
+import pytest
+
+from intent_router import classify
+
+
+@pytest.mark.parametrize("text, use_tools, intents", [
+    # Asking for an answer only
+    ("How can I focus better when studying?", False, ()),
+    ("Any tips for sleeping better?", False, ()),
+    ("Hi there!", False, ()),
+    ("Thanks, that helps", False, ()),
+    ("Why is procrastination so common?", False, ()),
+    # Calendar and feeling cues
+    ("What's on my calendar?", True, ("calendar",)),
+    ("Am I free this afternoon?", True, ("calendar",)),
+    ("Add a meeting with Anna to my calendar", True, ("calendar",)),
+    ("I have a dentist appointment tomorrow at 10", True, ("calendar",)),
+    ("I went to the gym and worked on my thesis", True, ("calendar",)),
+    ("I'm so stressed about the exam", True, ("feeling",)),
+    ("I had lunch with Tom and I feel great", True, ("calendar", "feeling")),
+    # Answer-style phrasing that still carries a time or scheduling verb
+    ("Hi, I need to study tomorrow at 3pm", True, ()),
+    ("Can you help me put a study block on Thursday from 2 to 4?", True, ()),
+    ("What is planned for tomorrow?", True, ()),
+    ("Should I schedule my workout before work?", True, ()),
+    # No cues either way
+    ("Pizza", True, ()),
+])
+def test_classify(text, use_tools, intents):
+    decision = classify(text)
+    assert decision.use_tools is use_tools
+    assert decision.intents == intents
@@ -0,0 +1,82 @@
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+import generation_cache as generation_cache_module
+import mistral
+from generation_cache import generation_cache
+from precompute import PrecomputeScheduler
+from schemes import APP_TIMEZONE
+
+EVENTS = [{
+    "date": "2025-06-16",
+    "startTime": "2025-06-16T09:00:00",
+    "endTime": "2025-06-16T10:00:00",
+    "description": "Team sync",
+    "tags": ["work"],
+    "name": "Team sync",
+}]
+FEELINGS = [{"feelings": ["motivated"], "score": 7, "datetime": "2025-06-16T08:00:00"}]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = SimpleNamespace(value=0.0)
+    monkeypatch.setattr(generation_cache_module, "time", SimpleNamespace(time=lambda: now.value))
+    return now
+
+
+@pytest.fixture
+def completions(monkeypatch):
+    calls = []
+
+    async def complete_async(**kwargs):
+        calls.append(kwargs)
+        message = SimpleNamespace(content=f"generated {len(calls)}")
+        usage = SimpleNamespace(prompt_tokens=10, completion_tokens=5, total_tokens=15)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+    monkeypatch.setattr(mistral.mistral_client.chat, "complete_async", complete_async)
+    monkeypatch.setattr(generation_cache, "_entries", type(generation_cache._entries)())
+    return calls
+
+
+async def load_window(start: str, end: str):
+    return EVENTS, FEELINGS
+
+
+def local(day: datetime, hour: int, minute: int = 0) -> float:
+    return APP_TIMEZONE.localize(day + timedelta(hours=hour, minutes=minute)).timestamp()
+
+
+def test_precomputed_texts_outlive_the_cache_ttl(clock, completions):
+    day = datetime(2025, 6, 16)
+    clock.value = local(day, 4)
+    asyncio.run(PrecomputeScheduler(load_window).precompute(day, day + timedelta(days=1)))
+    assert len(completions) == 2
+
+    # First open of the day, well past the default TTL
+    clock.value = local(day, 4) + generation_cache.ttl + 6 * 3600
+    assert asyncio.run(mistral.generate_advice(EVENTS, FEELINGS)) == "generated 1"
+    assert asyncio.run(mistral.generate_motivation(EVENTS, FEELINGS)) == "generated 2"
+    assert len(completions) == 2
+
+
+def test_precomputed_texts_expire_with_their_window(clock, completions):
+    day = datetime(2025, 6, 16)
+    clock.value = local(day, 4)
+    asyncio.run(PrecomputeScheduler(load_window).precompute(day, day + timedelta(days=1)))
+
+    clock.value = local(day + timedelta(days=1), 0, 30)
+    asyncio.run(mistral.generate_advice(EVENTS, FEELINGS))
+    assert len(completions) == 3
+
+
+def test_requested_texts_keep_the_default_ttl(clock, completions):
+    clock.value = 1_000_000.0
+    asyncio.run(mistral.generate_advice(EVENTS, FEELINGS))
+    clock.value += generation_cache.ttl + 1
+    asyncio.run(mistral.generate_advice(EVENTS, FEELINGS))
+    assert len(completions) == 2
@@ -0,0 +1,165 @@
+import asyncio
+import gc
+
+import pytest
+
+from single_flight import SharedStream, SingleFlight
+
+
+class Upstream:
+    """A byte stream whose chunks the test releases one by one."""
+
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+        self.released = asyncio.Semaphore(0)
+        self.pulled = 0
+        self.closed = False
+
+    def release(self, count=1):
+        for _ in range(count):
+            self.released.release()
+
+    async def __call__(self):
+        try:
+            for chunk in self.chunks:
+                await self.released.acquire()
+                self.pulled += 1
+                yield chunk
+        finally:
+            self.closed = True
+
+
+async def settle():
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def test_late_joiner_replays_from_the_first_chunk():
+    async def main():
+        flight = SingleFlight("test")
+        upstream = Upstream([b"ab", b"cd", b"ef"])
+        opened = []
+
+        def open_stream():
+            opened.append(1)
+            return upstream()
+
+        first = flight.stream("key", open_stream)
+        upstream.release()
+        assert await first.__anext__() == b"ab"
+
+        late = flight.stream("key", open_stream)
+        upstream.release(2)
+        assert [chunk async for chunk in late] == [b"ab", b"cd", b"ef"]
+        assert [chunk async for chunk in first] == [b"cd", b"ef"]
+        assert len(opened) == 1
+
+    asyncio.run(main())
+
+
+def test_slow_subscriber_stalls_the_upstream_at_read_ahead():
+    async def main():
+        upstream = Upstream([b"1234"] * 10)
+        shared = SharedStream(upstream(), lambda: None, read_ahead=10, replay_bytes=100)
+        subscription = shared.subscribe()
+        upstream.release(10)
+        assert await subscription.__anext__() == b"1234"
+        await settle()
+        # 4 bytes read, so the upstream pauses once 14 or more bytes were produced
+        assert upstream.pulled == 4
+
+        await subscription.__anext__()
+        await settle()
+        assert upstream.pulled == 5
+        await subscription.aclose()
+
+    asyncio.run(main())
+
+
+def test_stream_stops_taking_subscribers_past_replay_bytes():
+    async def main():
+        flight = SingleFlight("test")
+        upstreams = []
+
+        def open_stream():
+            upstreams.append(Upstream([b"abcd"] * 4))
+            return upstreams[-1]()
+
+        subscription = flight.stream("key", open_stream)
+        shared, _ = flight._streams["key"]
+        shared.replay_bytes = 6
+        upstreams[0].release()
+        assert await subscription.__anext__() == b"abcd"
+        assert shared.joinable
+        upstreams[0].release()
+        assert await subscription.__anext__() == b"abcd"
+        assert not shared.joinable
+        with pytest.raises(RuntimeError):
+            shared.subscribe()
+
+        # Chunks every subscriber has read are dropped
+        await settle()
+        assert shared._first == 2
+
+        other = flight.stream("key", open_stream)
+        assert len(upstreams) == 2
+        await subscription.aclose()
+        await other.aclose()
+
+    asyncio.run(main())
+
+
+def test_last_subscriber_leaving_cancels_and_detaches():
+    async def main():
+        flight = SingleFlight("test")
+        upstream = Upstream([b"ab", b"cd"])
+        first = flight.stream("key", upstream)
+        second = flight.stream("key", upstream)
+        upstream.release()
+        assert await first.__anext__() == b"ab"
+        assert await second.__anext__() == b"ab"
+
+        await first.aclose()
+        await settle()
+        assert "key" in flight._streams
+        assert not upstream.closed
+
+        await second.aclose()
+        assert "key" not in flight._streams
+        await settle()
+        assert upstream.closed
+
+    asyncio.run(main())
+
+
+def test_unread_subscription_releases_the_stream_when_dropped():
+    async def main():
+        flight = SingleFlight("test")
+        upstream = Upstream([b"ab", b"cd"])
+        subscription = flight.stream("key", upstream)
+        upstream.release()
+        await settle()
+        assert upstream.pulled == 1
+        del subscription
+        gc.collect()
+        assert "key" not in flight._streams
+        await settle()
+        assert upstream.closed
+
+    asyncio.run(main())
+
+
+def test_cancelled_upstream_is_an_error_for_remaining_readers():
+    async def main():
+        upstream = Upstream([b"ab", b"cd"])
+        shared = SharedStream(upstream(), lambda: None)
+        subscription = shared.subscribe()
+        upstream.release()
+        assert await subscription.__anext__() == b"ab"
+
+        shared._task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await subscription.__anext__()
+        assert upstream.closed
+
+    asyncio.run(main())
@@ -0,0 +1,46 @@
+import asyncio
+
+import pytest
+
+import voice
+from admission import AdmissionRejected
+
+
+@pytest.fixture
+def synthesis(monkeypatch):
+    rejected = set()
+
+    async def text_to_speech_chunks(text, previous_text=None):
+        if text in rejected:
+            raise AdmissionRejected("elevenlabs", "deadline", 3)
+        for part in ("start", "end"):
+            yield f"{text}:{part}|".encode()
+
+    monkeypatch.setattr(voice, "text_to_speech_chunks", text_to_speech_chunks)
+    return rejected
+
+
+async def sentences(*texts):
+    for text in texts:
+        yield text
+
+
+async def collect(chunks):
+    return b"".join([chunk async for chunk in chunks])
+
+
+def test_pipelined_speech_keeps_sentence_order(synthesis):
+    audio = asyncio.run(collect(voice.pipelined_speech(sentences("one", "two", "three"))))
+    assert audio == b"one:start|one:end|two:start|two:end|three:start|three:end|"
+
+
+def test_later_rejection_ends_after_the_last_complete_segment(synthesis):
+    synthesis.add("three")
+    audio = asyncio.run(collect(voice.pipelined_speech(sentences("one", "two", "three", "four"))))
+    assert audio == b"one:start|one:end|two:start|two:end|"
+
+
+def test_rejection_of_the_first_sentence_is_raised(synthesis):
+    synthesis.add("one")
+    with pytest.raises(AdmissionRejected):
+        asyncio.run(collect(voice.pipelined_speech(sentences("one", "two"))))
@@ -0,0 +1,50 @@
+from bisect import bisect_left, bisect_right
+from typing import Any, Callable, Generic, Iterable, Iterator, List, TypeVar
+
+T = TypeVar("T")
+
+
+class TimeIndex(Generic[T]):
+    """
+    In-memory store that keeps records sorted by a pre-computed timestamp key.
+
+    The key of every record is computed once on insertion, so range lookups
+    only bisect over the key list and slice the matching records.
+
+    Args:
+        key (Callable[[T], Any]): Returns the (comparable) timestamp of a record
+        records (Iterable[T]): Initial records, sorted once on construction
+    """
+
+    def __init__(self, key: Callable[[T], Any], records: Iterable[T] = ()):
+        self._key = key
+        pairs = sorted(((key(r), r) for r in records), key=lambda p: p[0])
+        self._keys: List[Any] = [k for k, _ in pairs]
+        self._records: List[T] = [r for _, r in pairs]
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __iter__(self) -> Iterator[T]:
+        return iter(self._records)
+
+    def add(self, record: T) -> None:
+        """Insert a record at its sorted position (after records with an equal key)."""
+        k = self._key(record)
+        i = bisect_right(self._keys, k)
+        self._keys.insert(i, k)
+        self._records.insert(i, record)
+
+    def extend(self, records: Iterable[T]) -> None:
+        for record in records:
+            self.add(record)
+
+    def range(self, start: Any, end: Any) -> List[T]:
+        """
+        Return all records with start <= key < end in timestamp order.
+
+        Runs in O(log n + k) for k matching records.
+        """
+        lo = bisect_left(self._keys, start)
+        hi = bisect_left(self._keys, end, lo)
+        return self._records[lo:hi]
@@ -0,0 +1,14 @@
+try:
+    import tiktoken
+
+    _encoding = tiktoken.get_encoding("o200k_base")
+except Exception:
+    # Not installed (or the encoding can't be loaded offline); fall back to an estimate
+    _encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """Token count with tiktoken if available, otherwise roughly four characters per token."""
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return (len(text) + 3) // 4
@@ -0,0 +1,133 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+TOOL_REGISTRY_TTL = float(os.getenv("TOOL_REGISTRY_TTL", "3600"))
+
+
+class ToolRegistry:
+    """
+    In-memory registry of tool definitions, warmed at startup.
+
+    Definitions are fetched once when the app starts (or read from a local
+    cache file on cold starts) and refreshed in the background every `ttl`
+    seconds, so requests read the prebuilt `tools` list without any I/O.
+
+    Args:
+        fetch (Callable[[str], Awaitable[dict]]): Fetches the definition of one function
+        function_names (Iterable[str]): Functions to serve definitions for
+        static_tools (Iterable[dict]): Local tools appended to the tools list as-is
+        cache_path (Optional[str]): JSON file definitions are persisted to, if set
+        ttl (float): Seconds between background refreshes
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[str], Awaitable[Dict[str, Any]]],
+        function_names: Iterable[str],
+        static_tools: Iterable[Dict[str, Any]] = (),
+        cache_path: Optional[str] = None,
+        ttl: float = TOOL_REGISTRY_TTL,
+    ):
+        self._fetch = fetch
+        self.function_names = list(function_names)
+        self.static_tools = list(static_tools)
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self.loaded_at = 0.0
+        self._definitions: Dict[str, Dict[str, Any]] = {}
+        self._tools: List[Dict[str, Any]] = list(self.static_tools)
+        self._refresh_task: Optional[asyncio.Task] = None
+        # Concurrent first uses wait for one load instead of each fetching the definitions
+        self._load_lock = asyncio.Lock()
+
+    @property
+    def tools(self) -> List[Dict[str, Any]]:
+        """Prebuilt tools list: all fetched definitions followed by the static tools."""
+        return self._tools
+
+    def get(self, function_name: str) -> Optional[Dict[str, Any]]:
+        return self._definitions.get(function_name)
+
+    def add_static_tool(self, tool: Dict[str, Any]) -> None:
+        self.static_tools.append(tool)
+        self._rebuild()
+
+    def _rebuild(self) -> None:
+        # Swap in a new list so concurrent readers never see a partial update
+        self._tools = [
+            self._definitions[name] for name in self.function_names if name in self._definitions
+        ] + self.static_tools
+
+    async def refresh(self) -> None:
+        definitions = await asyncio.gather(*(self._fetch(name) for name in self.function_names))
+        self._definitions = dict(zip(self.function_names, definitions))
+        self.loaded_at = time.time()
+        self._rebuild()
+        self._save_cache()
+
+    def _load_cache(self) -> bool:
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return False
+        try:
+            with open(self.cache_path) as f:
+                cached = json.load(f)
+            definitions = dict(cached["definitions"])
+            loaded_at = float(cached["loaded_at"])
+            if set(definitions) != set(self.function_names):
+                return False
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning("Ignoring unreadable tool cache %s: %s", self.cache_path, e)
+            return False
+        self._definitions = definitions
+        self.loaded_at = loaded_at
+        self._rebuild()
+        return True
+
+    def _save_cache(self) -> None:
+        if not self.cache_path:
+            return
+        tmp_path = f"{self.cache_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"loaded_at": self.loaded_at, "definitions": self._definitions}, f)
+        os.replace(tmp_path, self.cache_path)
+
+    async def ensure_loaded(self) -> None:
+        """Load on first use when the registry was not warmed by an app startup."""
+        if self.loaded_at:
+            return
+        async with self._load_lock:
+            if not self.loaded_at and not self._load_cache():
+                await self.refresh()
+
+    async def start(self) -> None:
+        """Warm the registry and start the background refresh loop."""
+        async with self._load_lock:
+            if not self._load_cache():
+                try:
+                    await self.refresh()
+                except Exception:
+                    # Don't keep the app from starting; ensure_loaded retries on first use
+                    logger.exception("Loading tool definitions at startup failed")
+        self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self) -> None:
+        if self._refresh_task:
+            self._refresh_task.cancel()
+            self._refresh_task = None
+
+    async def _refresh_loop(self) -> None:
+        delay = max(0.0, self.loaded_at + self.ttl - time.time())
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                await self.refresh()
+            except Exception:
+                # Keep serving the previous definitions and retry after a full ttl
+                logger.exception("Refreshing tool definitions failed")
+            delay = self.ttl
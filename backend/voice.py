@@ -1,55 +1,242 @@
+import asyncio
+import logging
 import os
-from typing import IO
+import re
+from typing import IO, AsyncIterator, Optional
 from io import BytesIO
-from elevenlabs import VoiceSettings, ElevenLabs
+from elevenlabs import VoiceSettings, ElevenLabs, AsyncElevenLabs
 from dotenv import load_dotenv
+from admission import AdmissionRejected, admit
+from generation_cache import content_key
+from http_transport import PROVIDER_POLICIES, async_client, sync_client
+from single_flight import SingleFlight
+from telemetry import record_tts, span
 from pydub import AudioSegment
 from pydub.playback import play
 import sounddevice as sd
 import soundfile as sf
 
+logger = logging.getLogger(__name__)
+
 load_dotenv()
 
 ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
+# Lets benchmarks point the clients at a local stand-in
+ELEVENLABS_BASE_URL = os.getenv("ELEVENLABS_BASE_URL") or None
 elevenlabs = ElevenLabs(
     api_key=ELEVENLABS_API_KEY,
+    base_url=ELEVENLABS_BASE_URL,
+    timeout=PROVIDER_POLICIES["elevenlabs"].timeout,
+    httpx_client=sync_client("elevenlabs"),
+)
+async_elevenlabs = AsyncElevenLabs(
+    api_key=ELEVENLABS_API_KEY,
+    base_url=ELEVENLABS_BASE_URL,
+    timeout=PROVIDER_POLICIES["elevenlabs"].timeout,
+    httpx_client=async_client("elevenlabs"),
 )
+# Retries happen in the shared transport
+REQUEST_OPTIONS = {"max_retries": 0}
 
+VOICE_ID = "pNInz6obpgDQGcFmaJgB" # Adam pre-made voice
+OUTPUT_FORMAT = "mp3_22050_32"
+MODEL_ID = "eleven_multilingual_v2"
+VOICE_SETTINGS = VoiceSettings(
+    stability=0.0,
+    similarity_boost=1.0,
+    style=0.0,
+    use_speaker_boost=True,
+    speed=1.0,
+)
+
+
+# Concurrent requests for the same audio share one synthesis and its byte stream
+speech_flights = SingleFlight("speech")
+
+
+def speech_cache_key(text: str) -> str:
+    """Hash over everything that determines the synthesized audio."""
+    return content_key(text, VOICE_ID, MODEL_ID, OUTPUT_FORMAT, VOICE_SETTINGS.model_dump())
 
-def text_to_speech_stream(text: str) -> IO[bytes]:
-    # Perform the text-to-speech conversion
-    response = elevenlabs.text_to_speech.stream(
-        voice_id="pNInz6obpgDQGcFmaJgB", # Adam pre-made voice
-        output_format="mp3_22050_32",
-        text=text,
-        model_id="eleven_multilingual_v2",
-        voice_settings=VoiceSettings(
-            stability=0.0,
-            similarity_boost=1.0,
-            style=0.0,
-            use_speaker_boost=True,
-            speed=1.0,
-        ),
-    )
 
+def text_to_speech_stream(text: str) -> IO[bytes]:
+    record_tts("elevenlabs", MODEL_ID, text)
     # Create a BytesIO object to hold the audio data in memory
     audio_stream = BytesIO()
 
-    # Write each chunk of audio data to the stream
-    for chunk in response:
-        if chunk:
-            audio_stream.write(chunk)
+    with span("elevenlabs.tts"):
+        # Perform the text-to-speech conversion
+        response = elevenlabs.text_to_speech.stream(
+            voice_id=VOICE_ID,
+            output_format=OUTPUT_FORMAT,
+            text=text,
+            model_id=MODEL_ID,
+            voice_settings=VOICE_SETTINGS,
+            request_options=REQUEST_OPTIONS,
+        )
+
+        # Write each chunk of audio data to the stream
+        for chunk in response:
+            if chunk:
+                audio_stream.write(chunk)
 
     audio_stream.seek(0)
 
     return audio_stream
 
+
+async def text_to_speech_chunks(text: str, previous_text: Optional[str] = None) -> AsyncIterator[bytes]:
+    """
+    Yield audio chunks as ElevenLabs produces them.
+
+    Nothing is buffered, so the consumer's pace is the upstream read pace.
+    Closing or cancelling the iterator (e.g. on client disconnect) closes
+    the upstream request.
+    """
+    await admit("elevenlabs", len(text))
+    record_tts("elevenlabs", MODEL_ID, text)
+    response = async_elevenlabs.text_to_speech.stream(
+        voice_id=VOICE_ID,
+        output_format=OUTPUT_FORMAT,
+        text=text,
+        model_id=MODEL_ID,
+        voice_settings=VOICE_SETTINGS,
+        previous_text=previous_text,
+        request_options=REQUEST_OPTIONS,
+    )
+    try:
+        with span("elevenlabs.tts_stream"):
+            async for chunk in response:
+                if chunk:
+                    yield chunk
+    finally:
+        await response.aclose()
+
+
+async def start_speech_stream(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """
+    Wait for the first chunk, then return an iterator over the whole stream.
+
+    Upstream errors thus still surface before a response is started instead
+    of truncating a 200 response.
+    """
+    try:
+        first = await chunks.__anext__()
+    except StopAsyncIteration:
+        first = b""
+
+    async def stream():
+        try:
+            if first:
+                yield first
+            async for chunk in chunks:
+                yield chunk
+        finally:
+            await chunks.aclose()
+
+    return stream()
+
+
+# A sentence ends at ., ! or ? followed by whitespace, or at a line break
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+|\n+")
+
+
+async def split_sentences(tokens: AsyncIterator[str], min_chars: int = 20) -> AsyncIterator[str]:
+    """
+    Re-chunk a token stream into sentences.
+
+    Fragments shorter than `min_chars` (list markers like "1.", interjections)
+    are merged into the following sentence so every TTS request carries
+    enough text for natural prosody.
+    """
+    buffer = ""
+    pending = ""
+    async for token in tokens:
+        buffer += token
+        *sentences, buffer = SENTENCE_BOUNDARY.split(buffer)
+        for sentence in sentences:
+            pending = f"{pending} {sentence.strip()}".strip()
+            if len(pending) >= min_chars:
+                yield pending
+                pending = ""
+    rest = f"{pending} {buffer.strip()}".strip()
+    if rest:
+        yield rest
+
+
+async def pipelined_speech(sentences: AsyncIterator[str], max_ahead: int = 3, chunks_ahead: int = 16) -> AsyncIterator[bytes]:
+    """
+    Synthesize every sentence as soon as it arrives and yield the audio in order.
+
+    Up to `max_ahead` sentences are synthesized while earlier ones are still
+    being sent, so text generation and speech synthesis overlap. Each of them
+    buffers at most `chunks_ahead` chunks before its upstream read pauses, so
+    a slow client slows down synthesis instead of growing memory. The MP3
+    segments share one output format and play back as one continuous stream.
+
+    Each sentence is admitted by the ElevenLabs rate limit when its synthesis
+    starts. A rejection of the first one is raised before any audio; a later
+    one ends the stream after the last complete segment, since the response
+    is already under way.
+    """
+    segments: asyncio.Queue = asyncio.Queue(maxsize=max_ahead)
+    tasks = []
+
+    async def synthesize(sentence: str, previous_text: str, out: asyncio.Queue):
+        try:
+            async for chunk in text_to_speech_chunks(sentence, previous_text=previous_text or None):
+                await out.put(chunk)
+            await out.put(None)
+        except Exception as e:
+            await out.put(e)
+
+    async def produce():
+        previous = []
+        try:
+            async for sentence in sentences:
+                out: asyncio.Queue = asyncio.Queue(maxsize=chunks_ahead)
+                tasks.append(asyncio.create_task(synthesize(sentence, " ".join(previous), out)))
+                # Blocks while max_ahead segments are waiting to be sent
+                await segments.put(out)
+                previous.append(sentence)
+            await segments.put(None)
+        except Exception as e:
+            await segments.put(e)
+
+    producer = asyncio.create_task(produce())
+    sent = 0
+    try:
+        while True:
+            out = await segments.get()
+            if out is None:
+                break
+            if isinstance(out, Exception):
+                raise out
+            while True:
+                chunk = await out.get()
+                if chunk is None:
+                    break
+                if isinstance(chunk, AdmissionRejected) and sent:
+                    # Rejected before its first chunk, so the audio sent so far ends on a whole segment
+                    logger.warning("Pipelined speech ended after %d sentences: %s", sent, chunk)
+                    return
+                if isinstance(chunk, Exception):
+                    raise chunk
+                yield chunk
+            sent += 1
+    finally:
+        producer.cancel()
+        for task in tasks:
+            task.cancel()
+
+
 def motivational_speech(text: str) -> IO[bytes]:
     response = elevenlabs.text_to_speech.stream(
         voice_id="pNInz6obpgDQGcFmaJgB", # Adam pre-made voice
         output_format="mp3_22050_32",
         text=text,
         model_id="eleven_multilingual_v2",
+        request_options=REQUEST_OPTIONS,
     )
 
 
@@ -57,7 +244,8 @@ def motivational_speech(text: str) -> IO[bytes]:
 def speech_to_text(audio_stream: IO[bytes]) -> str:
     response = elevenlabs.speech_to_text.convert(
         file=audio_stream,
-        model_id="scribe_v1"
+        model_id="scribe_v1",
+        request_options=REQUEST_OPTIONS,
     )
     return response
 